@@ -1,9 +1,14 @@
 import argparse
+import logging
+import multiprocessing as mp
 import os
+import sys
 import threading
 from time import gmtime, strftime, time
 
-from misc import config, merge_datasets, utils
+from misc import (config, driver_pool, image_downloader, logger, merge_datasets,
+                  metrics, network, seen_index, utils)
+from scrapers import idealista
 from scrapers.scraper_base import HouseScraper
 from scrapers.scraper_factory import ScraperFactory
 
@@ -46,13 +51,18 @@ def scrape_web(scraper: HouseScraper, urls: list = None):
         The scraper object that is going to scrape the web
     urls : list, opt
         List of URLs the scraper has to work with.
+
+    Returns
+    -------
+    True if the scraper finished its crawl
     """
     start_time = time()
-    scraper.scrape(urls)
+    finished = scraper.scrape(urls)
     end_time = time()
     elapsed_seconds = end_time - start_time
     utils.log(
-        f'[{scraper.id}] Elapsed time: {strftime("%H:%M:%S", gmtime(elapsed_seconds))}')
+        '[%s] Elapsed time: %s', scraper.id, strftime("%H:%M:%S", gmtime(elapsed_seconds)))
+    return finished
 
 
 def join_results():
@@ -70,10 +80,102 @@ def join_results():
     merge_datasets.zip_everything()
 
 
-def main(scrapers_ids: list, urls: dict):
+def limit_resources(index: int):
+    """
+    Pins the current process to its own cores, as configured. The browsers it
+    launches inherit the affinity
+
+    Parameters
+    ----------
+    index : int
+        Index of the scraper, to pin every scraper to different cores
+    """
+    if config.SCRAPER_CPUS and hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        first = index * config.SCRAPER_CPUS % len(cores)
+        os.sched_setaffinity(0, {cores[(first + i) % len(cores)]
+                                 for i in range(min(config.SCRAPER_CPUS, len(cores)))})
+
+
+def run_scraper(id: str, index: int, scrapers: int, urls: list, options: dict, events: mp.Queue):
+    """
+    Scrapes a real estate listing web in a process of its own. Its logs and its
+    status ('done' or 'failed') are sent to the launcher through the events queue;
+    a scraper that fails or stops before finishing its crawl exits with an error
+
+    Parameters
+    ----------
+    id : str
+        ID of the scraper
+    index : int
+        Index of the scraper, to pin every scraper to different cores
+    scrapers : int
+        Number of scrapers running, that split the drivers
+    urls : list
+        List of URLs the scraper has to work with. None for the default ones
+    options : dict
+        Keyword arguments of ScraperFactory.create_scraper()
+    events : Queue
+        Queue of the log records and the status events, read by the launcher
+    """
+    # the launcher writes the log file: the records are sent to it
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    handler = logger.ProcessQueueHandler(events)
+    handler.addFilter(logger.ContextFilter())
+    root.addHandler(handler)
+    limit_resources(index)
+    driver_pool.set_size(max(1, config.DRIVER_POOL_SIZE // scrapers))
+    logger.set_scraper(id)
+    metrics.set_scraper(id)
+    if config.METRICS_PORT is not None:
+        metrics.start_server(config.METRICS_PORT + index)
+
+    # the exit handlers are not run in a child process: the pools are closed here
+    status = 'failed'
+    try:
+        network.get_fingerprints()
+        if scrape_web(ScraperFactory.create_scraper(id, **options), urls):
+            status = 'done'
+        else:
+            utils.error('[%s] Scraper stopped before finishing its crawl', id)
+    finally:
+        # the images must be on disk before joining the results
+        image_downloader.shutdown()
+        driver_pool.shutdown()
+        seen_index.shutdown()
+        metrics.dump()
+        events.put({'id': id, 'status': status})
+    if status != 'done':
+        # the launcher restarts it, resuming the crawl
+        sys.exit(1)
+
+
+def handle_events(events: mp.Queue, statuses: dict):
     """
-    Launches several threads to scrape multiple real estate listing webs; then joins 
-    the results in a single CSV file
+    Writes the log records sent by the scraper processes and keeps their status,
+    until a None is received
+
+    Parameters
+    ----------
+    events : Queue
+        Queue of the log records and the status events
+    statuses : dict
+        Dictionary with scraper id <-> last status reported
+    """
+    for event in iter(events.get, None):
+        if isinstance(event, logging.LogRecord):
+            logging.getLogger().handle(event)
+        else:
+            statuses[event['id']] = event['status']
+
+
+def main(scrapers_ids: list, urls: dict, refresh: bool = False, incremental: bool = False,
+         broker: str = None, coordinator: bool = False):
+    """
+    Launches a process per real estate listing web to scrape, restarting the ones that
+    crash; then joins the results in a single CSV file if all of them finished
 
     Parameters
     ----------
@@ -81,24 +183,65 @@ def main(scrapers_ids: list, urls: dict):
         List of the selected pages' IDs to scrape
     urls : dict
         Dictionary with scraper id <-> list of URLs to scrape
+    refresh : bool, opt
+        Flag to scrape again the listings already scraped
+    incremental : bool, opt
+        Flag to scrape again the listings already scraped whose navigation card changed
+    broker : str, opt
+        host:port of the broker of a distributed crawl. Without coordinator, this process
+        is a worker of the crawl and the coordinator joins the results
+    coordinator : bool, opt
+        Flag to serve the crawl to the workers from broker
     """
 
     utils.log('Starting web-scraping')
     init_tmp_folder(scraper_ids)
-    scraper_threads = list()
-    for id in scrapers_ids:
-        scraper_urls = urls.get(id)
-        scraper_thread = threading.Thread(target=scrape_web, args=(
-            ScraperFactory.create_scraper(id), scraper_urls))
-        scraper_threads.append(scraper_thread)
-        scraper_thread.start()
+    network.get_fingerprints()  # builds the fingerprint pool before the workers need it
+    options = {'refresh': refresh, 'incremental': incremental,
+               'broker': broker, 'coordinator': coordinator}
+    events = mp.Queue()
+    statuses = dict()
+    event_thread = threading.Thread(target=handle_events, args=(events, statuses))
+    event_thread.start()
+
+    def start(id: str) -> mp.Process:
+        process = mp.Process(target=run_scraper, name=f'scraper-{id}', args=(
+            id, scrapers_ids.index(id), len(scrapers_ids), urls.get(id), options, events))
+        process.start()
+        statuses[id] = 'running'
+        return process
 
-    for scraper_thread in scraper_threads:
-        scraper_thread.join()
+    processes = {id: start(id) for id in scrapers_ids}
+    restarts = {id: 0 for id in scrapers_ids}
+    while processes:
+        for id, process in list(processes.items()):
+            process.join(timeout=1)
+            if process.exitcode is None:
+                continue
+            del processes[id]
+            if process.exitcode == 0:
+                continue
+            # the scrapers checkpoint their progress: a restart resumes the crawl
+            if restarts[id] < config.SCRAPER_MAX_RESTARTS:
+                restarts[id] += 1
+                utils.warn('[%s] Scraper exited with code %s, restarting it (%s/%s)',
+                           id, process.exitcode, restarts[id], config.SCRAPER_MAX_RESTARTS)
+                processes[id] = start(id)
+            else:
+                utils.error('[%s] Scraper exited with code %s, giving up', id, process.exitcode)
+
+    events.put(None)
+    event_thread.join()
+    failed = [id for id in scrapers_ids if statuses.get(id) != 'done']
 
     utils.delete_directory(os.path.join(config.TMP_DIR, config.CHROME_SESSION))
 
     utils.log('Finished web-scraping')
+    if broker and not coordinator:
+        return
+    if failed:
+        utils.error('Not joining the results: %s did not finish', failed)
+        return
     utils.log('Joining results...')
 
     join_results()
@@ -119,9 +262,23 @@ if __name__ == '__main__':
         '--urls-idealista', help='urls to scrape with idealista', required=False, type=str, nargs='+')
     argparser.add_argument('-m', '--merge', help='merges the data files without launching the scrapers',
                            action='store_true')
+    argparser.add_argument('--reextract', help='regenerates the idealista dataset from the archived pages, ' +
+                           'without any request, and joins the results', action='store_true')
     argparser.add_argument(
         '-r', '--reset', help='resets the dataset and temporary files', action='store_true')
+    argparser.add_argument(
+        '--refresh', help='scrapes again the listings already scraped', action='store_true')
+    argparser.add_argument('--incremental', help='scrapes again the listings already scraped only if their ' +
+                           'price, rooms or m2 changed', action='store_true')
+    argparser.add_argument('--coordinator', help='serves the idealista crawl to the workers, and joins their results',
+                           action='store_true')
+    argparser.add_argument('--worker', help='scrapes the idealista crawl served by a coordinator',
+                           action='store_true')
+    argparser.add_argument('--broker', help=f'host:port of the coordinator (default {config.BROKER_ADDRESS}). ' +
+                           'Beyond localhost, set the same HOUSE_SCRAPER_BROKER_TOKEN in the coordinator and the workers',
+                           default=config.BROKER_ADDRESS, type=str)
     args = argparser.parse_args()
+    logger.setup()
 
     scraper_ids = list()
     urls = dict()
@@ -136,14 +293,22 @@ if __name__ == '__main__':
 
     if not scraper_ids:
         scraper_ids = [config.IDEALISTA_ID, config.FOTOCASA_ID]
+    if args.worker:
+        # only idealista keeps its crawl in a frontier to share
+        scraper_ids = [config.IDEALISTA_ID]
 
     if args.reset:
         utils.create_directory(config.TMP_DIR)
         utils.create_directory(config.DATASET_DIR)
 
-    if args.merge:
+    if args.reextract:
+        utils.log('Re-extracting the archived pages')
+        idealista.reextract()
+        join_results()
+    elif args.merge:
         utils.log('Joining and zipping the scraping results')
         join_results()
     else:
-        utils.log(f'Scraping {scraper_ids}')
-        main(scrapers_ids=scraper_ids, urls=urls)
+        utils.log('Scraping %s', scraper_ids)
+        main(scrapers_ids=scraper_ids, urls=urls, refresh=args.refresh, incremental=args.incremental,
+             broker=args.broker if args.coordinator or args.worker else None, coordinator=args.coordinator)
@@ -0,0 +1,294 @@
+"""
+End-to-end crawl benchmark. Serves the fixture site locally and runs each
+scraper against it, in a process of its own launched from a scratch folder
+(its tmp, dataset and log are written there) with its waits scaled down.
+Reports the throughput, the page latency, the driver startup cost and the
+checkpoint overhead, and stores them as JSON to compare between commits.
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, strftime
+
+import fixture_server
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPER_DIR = os.path.dirname(BENCHMARK_DIR)
+ROOT_DIR = os.path.dirname(SCRAPER_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+
+SCRAPERS = ['idealista', 'fotocasa']
+
+
+def get_commit() -> str:
+    """
+    Gets the commit being benchmarked
+
+    Returns
+    -------
+    The short hash of HEAD, 'local' if it is not known
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRAPER_DIR, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'local'
+
+
+def summarize(values: list) -> dict:
+    """
+    Summarizes some timings
+
+    Parameters
+    ----------
+    values : list
+        Timings, in seconds
+
+    Returns
+    -------
+    Dictionary with the 'count', 'total_s', 'mean_s', 'p50_s' and 'p99_s' of the timings
+    """
+    if not values:
+        return {'count': 0, 'total_s': 0, 'mean_s': None, 'p50_s': None, 'p99_s': None}
+    values = sorted(values)
+
+    def percentile(q: float) -> float:
+        return round(values[min(len(values) - 1, int(q * len(values)))], 4)
+
+    return {'count': len(values), 'total_s': round(sum(values), 4),
+            'mean_s': round(sum(values) / len(values), 4),
+            'p50_s': percentile(0.5), 'p99_s': percentile(0.99)}
+
+
+def install_probes(timings: dict):
+    """
+    Times the page loads, the driver startups and the checkpoints of the scrapers
+
+    Parameters
+    ----------
+    timings : dict
+        Dictionary with 'page', 'driver' and 'checkpoint' lists to append the timings to
+    """
+    from misc import utils
+    from scrapers.idealista import IdealistaScraper
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+    def probe(owner, name: str, kind: str):
+        fn = getattr(owner, name)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings[kind].append(perf_counter() - start)
+        setattr(owner, name, timed)
+
+    probe(WebDriver, 'get', 'page')
+    probe(utils, 'fetch_page', 'page')
+    probe(utils, 'get_selenium', 'driver')
+    probe(IdealistaScraper, 'checkpoint', 'checkpoint')
+    probe(IdealistaScraper, 'compact_houses', 'checkpoint')
+
+
+def run_child(id: str, server: str, scratch: str, wait_scale: float, pages: int, houses: int,
+              result_file: str):
+    """
+    Runs a scraper against the fixture site and writes its timings. Runs in the
+    process launched by run_scraper()
+
+    Parameters
+    ----------
+    id : str
+        ID of the scraper
+    server : str
+        Root URL of the fixture site
+    scratch : str
+        Folder the scraper is launched from
+    wait_scale : float
+        Multiplier of the waits of the scraper
+    pages : int
+        Navigation pages of each location
+    houses : int
+        Houses in each navigation page
+    result_file : str
+        JSON file to write the timings to
+    """
+    # the configuration derives its folders from the launched script
+    sys.argv[0] = os.path.join(scratch, 'scraper', '__main__.py')
+    for resource in glob.glob(os.path.join(ROOT_DIR, 'chromedriver*')) + glob.glob(os.path.join(ROOT_DIR, '*.crx')):
+        os.symlink(resource, os.path.join(scratch, os.path.basename(resource)))
+    sys.path.insert(0, SCRAPER_DIR)
+
+    from misc import (config, driver_pool, image_downloader, logger,
+                      network, utils)
+    from scrapers.scraper_factory import ScraperFactory
+
+    config.WAIT_SCALE = wait_scale
+    config.IDEALISTA_URL = server + fixture_server.IDEALISTA_PATH
+    config.FOTOCASA_NUM_PAGES_TO_READ = pages
+    config.IDEALISTA_RESULTS_PER_PAGE = config.FOTOCASA_RESULTS_PER_PAGE = houses
+    utils.create_directory(config.TMP_DIR)
+    utils.create_directory(config.DATASET_DIR)
+    logger.setup()
+    timings = {'page': list(), 'driver': list(), 'checkpoint': list()}
+    install_probes(timings)
+
+    urls = [server + fixture_server.FOTOCASA_PATH] if id == config.FOTOCASA_ID else None
+    network.get_fingerprints()
+    scraper = ScraperFactory.create_scraper(id)
+    start = perf_counter()
+    try:
+        scraper.scrape(urls)
+    finally:
+        image_downloader.shutdown()
+        driver_pool.shutdown()
+    elapsed = perf_counter() - start
+
+    houses = 0
+    for csv_file in glob.glob(os.path.join(config.DATASET_DIR, f'{id}*.csv')):
+        with open(csv_file, 'r', encoding='utf-8') as file:
+            houses += max(0, sum(1 for _ in file) - 1)
+    with open(result_file, 'w', encoding='utf-8') as file:
+        json.dump({'elapsed_s': elapsed, 'houses': houses, 'timings': timings}, file)
+
+
+def run_scraper(server: fixture_server.FixtureServer, id: str, args) -> dict:
+    """
+    Runs a scraper against the fixture site, in a process of its own
+
+    Parameters
+    ----------
+    server : FixtureServer
+        The fixture site, started
+    id : str
+        ID of the scraper
+    args
+        Arguments of the benchmark
+
+    Returns
+    -------
+    Dictionary with the results of the scraper
+    """
+    scratch = tempfile.mkdtemp(prefix=f'benchmark-{id}-')
+    result_file = os.path.join(scratch, 'result.json')
+    server.reset_stats()
+    print(f'[{id}] Running against {server.url} in {scratch}')
+    try:
+        process = subprocess.run([sys.executable, BENCHMARK_DIR, '--child', id, '--server', server.url,
+                                  '--scratch', scratch, '--wait-scale', str(args.wait_scale),
+                                  '--pages', str(args.pages), '--houses', str(args.houses),
+                                  '--result', result_file],
+                                 timeout=args.timeout)
+        exit_code = process.returncode
+    except subprocess.TimeoutExpired:
+        exit_code = None
+    served = server.get_stats()
+
+    results = {'exit_code': exit_code, 'served': served}
+    if exit_code == 0 and os.path.exists(result_file):
+        with open(result_file, 'r', encoding='utf-8') as file:
+            child = json.load(file)
+        pages = sum(count for kind, count in served.items()
+                    if not kind.startswith(('image:', 'unknown:')))
+        page = summarize(child['timings']['page'])
+        results.update({'elapsed_s': round(child['elapsed_s'], 3), 'pages': pages, 'houses': child['houses'],
+                        'pages_per_minute': round(pages / child['elapsed_s'] * 60, 2),
+                        'page_latency_p50_s': page['p50_s'], 'page_latency_p99_s': page['p99_s'],
+                        'page_loads': page, 'driver_startup': summarize(child['timings']['driver']),
+                        'checkpoint': summarize(child['timings']['checkpoint'])})
+    if args.keep:
+        results['scratch'] = scratch
+    else:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return results
+
+
+def compare(results: dict, baseline_file: str):
+    """
+    Prints the change of the main figures against the results of another commit
+
+    Parameters
+    ----------
+    results : dict
+        Results of this benchmark
+    baseline_file : str
+        JSON file with the results of the other commit
+    """
+    with open(baseline_file, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    print(f'Compared to {baseline.get("commit")} ({baseline_file}):')
+    for id, current in results['scrapers'].items():
+        previous = baseline.get('scrapers', dict()).get(id, dict())
+        for figure in ('pages_per_minute', 'page_latency_p50_s', 'page_latency_p99_s'):
+            if current.get(figure) is None or not previous.get(figure):
+                continue
+            change = (current[figure] - previous[figure]) / previous[figure] * 100
+            print(f'  [{id}] {figure}: {previous[figure]} -> {current[figure]} ({change:+.1f}%)')
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(
+        description='Benchmarks the scrapers against a local fixture site')
+    argparser.add_argument('-s', '--scrapers', help='scrapers to benchmark', nargs='+',
+                           choices=SCRAPERS, default=SCRAPERS)
+    argparser.add_argument('--latency', help='mean seconds to answer a page', type=float, default=0.05)
+    argparser.add_argument('--error-rate', help='chance of a 500', type=float, default=0)
+    argparser.add_argument('--block-rate', help='chance of a 403', type=float, default=0)
+    argparser.add_argument('--captcha-rate', help='chance of a captcha', type=float, default=0)
+    argparser.add_argument('--locations', help='idealista locations', type=int, default=2)
+    argparser.add_argument('--pages', help='navigation pages of each location', type=int, default=3)
+    argparser.add_argument('--houses', help='houses in each navigation page', type=int, default=10)
+    argparser.add_argument('--seed', help='seed of the injected faults', type=int, default=None)
+    argparser.add_argument('--wait-scale', help='multiplier of the waits of the scrapers',
+                           type=float, default=0.01)
+    argparser.add_argument('--timeout', help='seconds before giving up on a scraper', type=float, default=3600)
+    argparser.add_argument('-o', '--output', help='JSON file of the results (default results/<commit>.json)')
+    argparser.add_argument('--baseline', help='JSON file of the results of another commit to compare with')
+    argparser.add_argument('--keep', help='keeps the scratch folders of the scrapers', action='store_true')
+    # used internally to run a scraper in a process of its own
+    argparser.add_argument('--child', help=argparse.SUPPRESS)
+    argparser.add_argument('--server', help=argparse.SUPPRESS)
+    argparser.add_argument('--scratch', help=argparse.SUPPRESS)
+    argparser.add_argument('--result', help=argparse.SUPPRESS)
+    args = argparser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.server, args.scratch, args.wait_scale, args.pages, args.houses,
+                  args.result)
+        sys.exit(0)
+
+    server = fixture_server.FixtureServer(latency=args.latency, error_rate=args.error_rate,
+                                          block_rate=args.block_rate, captcha_rate=args.captcha_rate,
+                                          locations=args.locations, pages=args.pages, houses=args.houses,
+                                          seed=args.seed)
+    server.start()
+    commit = get_commit()
+    results = {'commit': commit, 'date': strftime('%Y-%m-%d %H:%M:%S'),
+               'fixtures': {'latency': args.latency, 'error_rate': args.error_rate,
+                            'block_rate': args.block_rate, 'captcha_rate': args.captcha_rate,
+                            'locations': args.locations, 'pages': args.pages, 'houses': args.houses,
+                            'seed': args.seed},
+               'wait_scale': args.wait_scale, 'scrapers': dict()}
+    try:
+        for id in args.scrapers:
+            results['scrapers'][id] = run_scraper(server, id, args)
+            print(f'[{id}] {json.dumps(results["scrapers"][id])}')
+    finally:
+        server.close()
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results stored in {output}')
+    if args.baseline:
+        compare(results, args.baseline)
@@ -0,0 +1,268 @@
+"""
+Local fixture site for the benchmark. Serves idealista and fotocasa pages
+built from the templates in fixtures/, which keep the markup the scrapers
+read from the recorded pages. The latency, the server errors, the 403s,
+the captchas and the pagination depth are configurable, and every page
+served is counted.
+"""
+
+import os
+import random
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from time import sleep
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+IDEALISTA_PATH = '/idealista'
+FOTOCASA_PATH = '/fotocasa/es/comprar/viviendas/madrid-capital/villaverde/l'
+FOTOCASA_HOUSE_PATH = '/fotocasa/es/comprar/vivienda/madrid-capital/villaverde'
+
+# cards of the fotocasa navigation pages: the first pages show bigger cards
+FOTOCASA_CARDS = {1: ('re-CardPackPremium', 're-CardPackPremium-carousel'),
+                  2: ('re-CardPackAdvance', 're-CardPackAdvance-slider')}
+FOTOCASA_MINIMAL_CARD = ('re-CardPackMinimal', 're-CardPackMinimal-slider')
+
+# a 1x1 JPEG, served for every photo
+JPEG = bytes.fromhex('ffd8ffe000104a46494600010100000100010000ffdb004300080606070605080707070909080a0c14'
+                     '0d0c0b0b0c1912130f141d1a1f1e1d1a1c1c20242e2720222c231c1c2837292c30313434341f27393d38'
+                     '323c2e333432ffc0000b080001000101011100ffc4001f0000010501010101010100000000000000000102'
+                     '030405060708090a0bffc400b5100002010303020403050504040000017d01020300041105122131410613'
+                     '516107227114328191a1082342b1c11552d1f02433627282090a161718191a25262728292a3435363738'
+                     '393a434445464748494a535455565758595a636465666768696a737475767778797a838485868788898a'
+                     '92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5c6c7c8c9cad2d3d4d5d6d7'
+                     'd8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8f9faffda0008010100003f00fbd3ffd9')
+
+
+class FixtureServer():
+    """
+    Class used to represent the local fixture site
+
+    ...
+
+    Attributes
+    ----------
+    url : str
+        root URL of the site, once started
+    latency : float
+        mean seconds to answer a page
+    error_rate : float
+        chance of answering a page with a 500
+    block_rate : float
+        chance of answering a page with a 403
+    captcha_rate : float
+        chance of answering a page with a captcha
+    locations : int
+        idealista locations in the home page
+    pages : int
+        navigation pages of each location
+    houses : int
+        houses in each navigation page
+
+    Methods
+    -------
+    start()
+        Starts serving in the background
+    get_stats()
+        Gets the number of pages served by kind and status
+    reset_stats()
+        Forgets the pages served
+    close()
+        Stops serving
+    """
+
+    def __init__(self, latency: float = 0.05, error_rate: float = 0, block_rate: float = 0,
+                 captcha_rate: float = 0, locations: int = 2, pages: int = 3, houses: int = 10,
+                 seed: int = None):
+        self.url = None
+        self.latency = latency
+        self.error_rate = error_rate
+        self.block_rate = block_rate
+        self.captcha_rate = captcha_rate
+        self.locations = locations
+        self.pages = pages
+        self.houses = houses
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__stats = Counter()    # (kind, status) -> pages
+        self.__server = None
+        self.__templates = dict()
+        for file in os.listdir(FIXTURES_DIR):
+            with open(os.path.join(FIXTURES_DIR, file), 'r', encoding='utf-8') as template:
+                self.__templates[file.replace('.html', '')] = Template(template.read())
+
+    def start(self) -> str:
+        """
+        Starts serving in the background, on a free port of localhost
+
+        Returns
+        -------
+        The root URL of the site
+        """
+        fixtures = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, content_type, body = fixtures.answer(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.__server.server_address[1]}'
+        return self.url
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            return {f'{kind}:{status}': pages for (kind, status), pages in sorted(self.__stats.items())}
+
+    def reset_stats(self):
+        with self.__lock:
+            self.__stats.clear()
+
+    def close(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def answer(self, path: str) -> tuple:
+        """
+        Builds the answer to a request
+
+        Parameters
+        ----------
+        path : str
+            Path of the request
+
+        Returns
+        -------
+        A tuple (status, content type, body)
+        """
+        path = path.split('?')[0]
+        if path.startswith('/img/'):
+            return self.__count('image', 200, 'image/jpeg', JPEG)
+        if path == '/captcha':
+            return 200, 'text/html; charset=utf-8', b'<html><body></body></html>'
+
+        route = self.__route(path)
+        if route is None:
+            return self.__count('unknown', 404, 'text/html; charset=utf-8', b'<html><body>404</body></html>')
+        kind, render = route
+        with self.__lock:
+            delay = self.latency * self.__random.uniform(0.5, 1.5)
+            roll = self.__random.random()
+        sleep(delay)
+        if roll < self.error_rate:
+            return self.__count(kind, 500, 'text/html; charset=utf-8', b'<html><body>500</body></html>')
+        roll -= self.error_rate
+        if roll < self.block_rate:
+            return self.__count(kind, 403, *self.__blocked('403 Forbidden', '<h1>Forbidden</h1>'))
+        roll -= self.block_rate
+        if roll < self.captcha_rate:
+            # the captcha checks look for the iframe of the captcha provider
+            return self.__count(kind, 'captcha', *self.__blocked(
+                'idealista.com', '<iframe src="/captcha?geo.captcha-delivery.com"></iframe>'))
+        return self.__count(kind, 200, 'text/html; charset=utf-8', render().encode('utf-8'))
+
+    def __count(self, kind: str, status, content_type: str, body: bytes) -> tuple:
+        with self.__lock:
+            self.__stats[(kind, status)] += 1
+        # a captcha is served as a regular page
+        return status if isinstance(status, int) else 200, content_type, body
+
+    def __blocked(self, title: str, body: str) -> tuple:
+        html = self.__templates['blocked'].substitute(
+            title=title, body=body, reload=int(max(self.latency, 0.5) * 1000))
+        return 'text/html; charset=utf-8', html.encode('utf-8')
+
+    def __route(self, path: str) -> tuple:
+        """
+        Gets the kind of a page and the function rendering it, None if it does not exist
+        """
+        if path.rstrip('/') == IDEALISTA_PATH:
+            return 'idealista-home', self.__idealista_home
+        match = re.fullmatch(IDEALISTA_PATH + r'/venta-viviendas/loc-(\d+)/(?:pagina-(\d+)\.htm)?', path)
+        if match and int(match.group(1)) < self.locations and int(match.group(2) or 1) <= self.pages:
+            location, page = int(match.group(1)), int(match.group(2) or 1)
+            return 'idealista-navigation', lambda: self.__idealista_navigation(location, page)
+        match = re.fullmatch(IDEALISTA_PATH + r'/inmueble/(\d+)/', path)
+        if match:
+            return 'idealista-house', lambda: self.__idealista_house(int(match.group(1)))
+        match = re.fullmatch(FOTOCASA_PATH + r'(?:/(\d+))?', path)
+        if match and int(match.group(1) or 1) <= self.pages:
+            return 'fotocasa-navigation', lambda: self.__fotocasa_navigation(int(match.group(1) or 1))
+        match = re.fullmatch(FOTOCASA_HOUSE_PATH + r'/(\d+)/d', path)
+        if match:
+            return 'fotocasa-house', lambda: self.__fotocasa_house(int(match.group(1)))
+        return None
+
+    def __house(self, id: int) -> dict:
+        """
+        Gets the details of a house, always the same for the same ID
+        """
+        details = random.Random(id)
+        return {'title': f'Piso en venta, casa {id}', 'price': details.randrange(60, 900) * 1000,
+                'rooms': details.randint(1, 5), 'baths': details.randint(1, 3),
+                'm2': details.randrange(40, 200), 'floor': details.randint(1, 9),
+                'photos': details.randint(1, 12),
+                'description': 'Vivienda luminosa, reformada y cerca del metro. ' * 5}
+
+    def __idealista_home(self) -> str:
+        locations = '\n'.join(f'<li><a href="{IDEALISTA_PATH}/venta-viviendas/loc-{i}/municipios">Localidad {i}</a>'
+                              f'<p>{self.pages * self.houses}</p></li>' for i in range(self.locations))
+        return self.__templates['idealista-home'].substitute(locations=locations)
+
+    def __idealista_navigation(self, location: int, page: int) -> str:
+        cards = list()
+        for i in range(self.houses):
+            id = 90_000_000 + location * 100_000 + page * 1000 + i
+            house = self.__house(id)
+            cards.append(f'<article class="item"><div class="item-info-container">'
+                         f'<a class="item-link" href="{IDEALISTA_PATH}/inmueble/{id}/">{house["title"]}</a>'
+                         f'<span class="item-price">{house["price"]:,}€</span>'.replace(',', '.') +
+                         f'<span class="item-detail">{house["rooms"]} hab.</span>'
+                         f'<span class="item-detail">{house["m2"]} m²</span></div></article>')
+        next = f'<li class="next"><a href="pagina-{page + 1}.htm">Siguiente</a></li>' \
+            if page < self.pages else ''
+        return self.__templates['idealista-navigation'].substitute(
+            location=f'Localidad {location}', count=self.pages * self.houses, cards='\n'.join(cards), next=next)
+
+    def __idealista_house(self, id: int) -> str:
+        house = self.__house(id)
+        images = '\n'.join(f'<div class="image"><img data-ondemand-img="{self.url}/img/{id}-{i}.jpg"></div>'
+                           for i in range(house['photos']))
+        return self.__templates['idealista-house'].substitute(
+            house, price=f'{house["price"]:,}'.replace(',', '.'), location='Localidad', images=images)
+
+    def __fotocasa_navigation(self, page: int) -> str:
+        card, link = FOTOCASA_CARDS.get(page, FOTOCASA_MINIMAL_CARD)
+        cards = list()
+        for i in range(self.houses):
+            id = 160_000_000 + page * 1000 + i
+            house = self.__house(id)
+            cards.append(f'<article class="{card}"><a class="{link}" href="{FOTOCASA_HOUSE_PATH}/{id}/d"></a>'
+                         f'<span class="re-CardPrice">{house["price"]:,} €</span>'.replace(',', '.') +
+                         f'<ul class="re-CardFeatures-wrapper"><li>{house["rooms"]} habs</li>'
+                         f'<li>{house["m2"]} m²</li></ul></article>')
+        # the scraper follows the link of the last item; the last page has none
+        next = f'<li class="sui-MoleculePagination-item"><a href="{FOTOCASA_PATH}/{page + 1}">&gt;</a></li>' \
+            if page < self.pages else '<li class="sui-MoleculePagination-item"><span>&gt;</span></li>'
+        return self.__templates['fotocasa-navigation'].substitute(
+            location='Villaverde', count=self.pages * self.houses, cards='\n'.join(cards), next=next)
+
+    def __fotocasa_house(self, id: int) -> str:
+        house = self.__house(id)
+        images = '\n'.join(f'<figure><img src="{self.url}/img/{id}-{i}.jpg"></figure>'
+                           for i in range(house['photos']))
+        return self.__templates['fotocasa-house'].substitute(
+            house, price=f'{house["price"]:,}'.replace(',', '.'), images=images)
@@ -0,0 +1,363 @@
+"""
+Work broker for distributed crawls. The coordinator serves its frontier,
+its dataset writer and the seen index over a small TCP server speaking
+JSON lines; worker processes on any host lease the tasks, execute them,
+acknowledge them and send their results back, so the results and the
+checkpoints are kept by the coordinator only. The workers are paced by
+the coordinator's rate limiter, so the per-domain budget holds for the
+whole crawl. The tasks leased by a worker that dies are given to another
+one after a timeout. Every request carries the token shared by the
+coordinator and its workers; without a token, the broker only listens on
+the loopback interface.
+"""
+
+import hmac
+import ipaddress
+import json
+import socket
+import socketserver
+import threading
+
+from . import config, frontier, rate_limiter, seen_index, utils
+
+
+class Broker():
+    """
+    Class used to represent the server that shares a frontier with the workers
+
+    ...
+
+    Attributes
+    ----------
+    address : str
+        host:port the broker listens on
+    token : str
+        secret the workers must send with every request. None to accept any
+        request, only on localhost
+
+    Methods
+    -------
+    start()
+        Starts serving in the background
+    is_authorized(token : str)
+        Checks the token sent with a request
+    dispatch(op : str, args : dict)
+        Executes an operation requested by a worker
+    is_idle(kinds : list)
+        Checks if no task is pending or leased
+    close()
+        Stops serving
+    """
+
+    def __init__(self, address: str, tasks: frontier.Frontier, writer, token: str = config.BROKER_TOKEN):
+        self.address = address
+        self.token = token
+        self.__tasks = tasks
+        self.__writer = writer
+        self.__server = None
+        self.__closed = threading.Event()
+
+    def start(self):
+        """
+        Starts serving in the background, and requeueing the tasks of the dead workers
+        """
+        host, port = parse_address(self.address)
+        if not self.token and not is_loopback(host):
+            raise ValueError(f'Refusing to serve on {host} without a token: ' +
+                             'set HOUSE_SCRAPER_BROKER_TOKEN in the coordinator and the workers')
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if not broker.is_authorized(request.get('token')):
+                            raise PermissionError('Invalid token')
+                        response = {'result': broker.dispatch(
+                            request['op'], request.get('args', dict()))}
+                    except Exception as e:
+                        response = {'error': f'{type(e).__name__}: {e}'}
+                    self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.__server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        threading.Thread(target=self.__reaper, daemon=True).start()
+        utils.log('Broker listening on %s:%s', host, port)
+
+    def is_authorized(self, token: str) -> bool:
+        """
+        Checks the token sent with a request
+
+        Parameters
+        ----------
+        token : str
+            Token of the request
+
+        Returns
+        -------
+        True if the broker has no token, or the token is its one
+        """
+        if not self.token:
+            return True
+        return isinstance(token, str) and hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8'))
+
+    def dispatch(self, op: str, args: dict):
+        """
+        Executes an operation requested by a worker
+
+        Parameters
+        ----------
+        op : str
+            Name of the operation
+        args : dict
+            Arguments of the operation
+
+        Returns
+        -------
+        The result of the operation, serializable as JSON
+        """
+        if op in ('put', 'lease', 'complete', 'release', 'has', 'count'):
+            return getattr(self.__tasks, op)(**args)
+        if op == 'append':
+            segment = self.__writer.append(args['rows'])
+            return segment is not None
+        if op == 'seen_has':
+            return seen_index.get_index().has(**args)
+        if op == 'seen_get_summary':
+            return seen_index.get_index().get_summary(**args)
+        if op == 'seen_add':
+            return seen_index.get_index().add(**args)
+        if op == 'seen_touch':
+            return seen_index.get_index().touch(**args)
+        if op in ('reserve', 'success', 'blocked', 'get_rate'):
+            return getattr(rate_limiter.get_limiter(), op)(**args)
+        raise ValueError(f'Unknown operation {op}')
+
+    def is_idle(self, kinds: list) -> bool:
+        """
+        Checks if no task of the kinds is pending or leased by a worker
+
+        Parameters
+        ----------
+        kinds : list
+            Kinds of the tasks (navigation, house...)
+
+        Returns
+        -------
+        True if there is nothing left to do
+        """
+        return not any(self.__tasks.has(kind, state) for kind in kinds
+                       for state in (frontier.PENDING, frontier.INFLIGHT))
+
+    def close(self):
+        """
+        Stops serving
+        """
+        self.__closed.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+
+    def __reaper(self):
+        """
+        Requeues the tasks leased for too long, by workers that probably died
+        """
+        while not self.__closed.wait(config.BROKER_LEASE_TIMEOUT / 4):
+            requeued = self.__tasks.requeue(config.BROKER_LEASE_TIMEOUT)
+            if requeued:
+                utils.warn('Requeued %s tasks leased for too long', requeued)
+
+
+class BrokerClient():
+    """
+    Class used to represent a worker's connection to the broker. It has the same
+    methods as the Frontier, and the append() of the DatasetWriter
+
+    ...
+
+    Attributes
+    ----------
+    address : str
+        host:port of the broker
+    token : str
+        secret sent with every request, as configured in the broker
+    seen : RemoteSeenIndex
+        the coordinator's seen index
+    limiter : RemoteRateLimiter
+        the coordinator's rate limiter
+
+    Methods
+    -------
+    call(op : str, **args)
+        Executes an operation in the broker
+    """
+
+    def __init__(self, address: str, token: str = config.BROKER_TOKEN):
+        self.address = address
+        self.token = token
+        self.seen = RemoteSeenIndex(self)
+        self.limiter = RemoteRateLimiter(self)
+        self.__local = threading.local()    # a connection per thread
+
+    def call(self, op: str, **args):
+        """
+        Executes an operation in the broker, reconnecting once if the connection was lost
+
+        Parameters
+        ----------
+        op : str
+            Name of the operation
+        **args
+            Arguments of the operation
+
+        Returns
+        -------
+        The result of the operation
+        """
+        request = (json.dumps({'op': op, 'args': args, 'token': self.token}) + '\n').encode('utf-8')
+        for retry in range(2):
+            try:
+                connection = self.__connect()
+                connection.sendall(request)
+                line = self.__local.reader.readline()
+                if not line:
+                    raise ConnectionError('Connection closed by the broker')
+                break
+            except OSError as e:
+                self.__disconnect()
+                if retry > 0:
+                    raise ConnectionError(f'Broker {self.address} unreachable: {e}')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f'Broker error in {op}: {response["error"]}')
+        return response['result']
+
+    def put(self, kind: str, url: str, priority: int = 0, payload: dict = None, reset: bool = False) -> bool:
+        return self.call('put', kind=kind, url=url, priority=priority, payload=payload, reset=reset)
+
+    def lease(self, kind: str, timeout: float = None) -> tuple:
+        leased = self.call('lease', kind=kind, timeout=timeout)
+        return tuple(leased) if leased is not None else None
+
+    def complete(self, kind: str, urls: list):
+        if urls:
+            self.call('complete', kind=kind, urls=urls)
+
+    def release(self, kind: str, url: str):
+        self.call('release', kind=kind, url=url)
+
+    def has(self, kind: str, state: int = None) -> bool:
+        return self.call('has', kind=kind, state=state)
+
+    def count(self, kind: str, state: int = None) -> int:
+        return self.call('count', kind=kind, state=state)
+
+    def append(self, rows: list):
+        if rows:
+            self.call('append', rows=rows)
+
+    def __connect(self) -> socket.socket:
+        if getattr(self.__local, 'connection', None) is None:
+            connection = socket.create_connection(parse_address(self.address),
+                                                  timeout=config.BROKER_TIMEOUT)
+            self.__local.connection = connection
+            self.__local.reader = connection.makefile('rb')
+        return self.__local.connection
+
+    def __disconnect(self):
+        connection = getattr(self.__local, 'connection', None)
+        self.__local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+
+class RemoteSeenIndex():
+    """
+    Class used to represent the coordinator's seen index, seen from a worker.
+    It has the same methods as the SeenIndex
+    """
+
+    def __init__(self, client: BrokerClient):
+        self.__client = client
+
+    def has(self, url: str) -> bool:
+        return self.__client.call('seen_has', url=url)
+
+    def get_summary(self, url: str) -> str:
+        return self.__client.call('seen_get_summary', url=url)
+
+    def add(self, urls: list, summaries: list = None):
+        self.__client.call('seen_add', urls=urls, summaries=summaries)
+
+    def touch(self, urls: list):
+        if urls:
+            self.__client.call('seen_touch', urls=urls)
+
+
+class RemoteRateLimiter():
+    """
+    Class used to represent the coordinator's rate limiter, seen from a worker.
+    It has the same methods as the RateLimiter
+    """
+
+    def __init__(self, client: BrokerClient):
+        self.__client = client
+
+    def reserve(self, url: str) -> float:
+        return self.__client.call('reserve', url=url)
+
+    def wait(self, url: str):
+        utils.timed_sleep(self.reserve(url), 'pacing')
+
+    def success(self, url: str):
+        self.__client.call('success', url=url)
+
+    def blocked(self, url: str):
+        self.__client.call('blocked', url=url)
+
+    def get_rate(self, url: str) -> float:
+        return self.__client.call('get_rate', url=url)
+
+
+def is_loopback(host: str) -> bool:
+    """
+    Checks if a host is only reachable from this machine
+
+    Parameters
+    ----------
+    host : str
+        Host name or IP address
+
+    Returns
+    -------
+    True for localhost and the loopback addresses
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_address(address: str) -> tuple:
+    """
+    Parses a host:port address
+
+    Parameters
+    ----------
+    address : str
+        Address, as host:port
+
+    Returns
+    -------
+    A tuple (host, port)
+    """
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
@@ -5,10 +5,11 @@ the help of the Buster extension.
 
 from time import sleep
 
+from bs4 import BeautifulSoup
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 
-from . import utils
+from . import metrics, utils
 
 
 def check(driver) -> bool:
@@ -32,7 +33,24 @@ def check(driver) -> bool:
         utils.warn('This page is not a idealista captcha')
         return False
     except Exception as e:
-        utils.error(f'There was an unexpected error: {e}')
+        utils.error('There was an unexpected error: %s', e)
+
+
+def check_html(html: str) -> bool:
+    """
+    Checks if an HTML document downloaded without a browser is a captcha page
+
+    Parameters
+    ----------
+    html : str
+        HTML of the page
+
+    Returns
+    -------
+    True if the HTML is a captcha page, False otherwise
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.select_one('iframe[src*="geo.captcha-delivery.com"]') is not None
 
 
 def solve(driver):
@@ -44,31 +62,32 @@ def solve(driver):
     driver : WebElement
         Selenium driver, in the root content
     """
-    try:
-        sleep(5)
-        driver.switch_to.default_content()
-        parent_frame = driver.find_element(by=By.TAG_NAME, value='iframe')
-        driver.switch_to.frame(parent_frame)
-        driver.switch_to.frame(driver.find_element(
-            by=By.CSS_SELECTOR, value='iframe[title="reCAPTCHA"]'))
-        captcha = driver.find_element(by=By.ID, value='recaptcha-anchor-label')
-        sleep(5)
-        captcha.click()
-        sleep(5)
-
-        driver.switch_to.default_content()
-        while check(driver):
-            __click_solve(driver, parent_frame)
-            sleep(1.5)
-            if check(driver):
+    with metrics.CAPTCHA_SOLVE.time():
+        try:
+            sleep(5)
+            driver.switch_to.default_content()
+            parent_frame = driver.find_element(by=By.TAG_NAME, value='iframe')
+            driver.switch_to.frame(parent_frame)
+            driver.switch_to.frame(driver.find_element(
+                by=By.CSS_SELECTOR, value='iframe[title="reCAPTCHA"]'))
+            captcha = driver.find_element(by=By.ID, value='recaptcha-anchor-label')
+            sleep(5)
+            captcha.click()
+            sleep(5)
+
+            driver.switch_to.default_content()
+            while check(driver):
                 __click_solve(driver, parent_frame)
-                sleep(5)
+                sleep(1.5)
                 if check(driver):
-                    __click_reload(driver, parent_frame)
-                    sleep(2.5)
-    except:
-        utils.warn('There was an unexpected error')
-        return
+                    __click_solve(driver, parent_frame)
+                    sleep(5)
+                    if check(driver):
+                        __click_reload(driver, parent_frame)
+                        sleep(2.5)
+        except:
+            utils.warn('There was an unexpected error')
+            return
 
 
 def __click_solve(driver, parent_frame):
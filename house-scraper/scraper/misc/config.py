@@ -12,6 +12,10 @@ TMP_DIR = os.path.join(ROOT_DIR, 'tmp')
 DATASET_DIR = os.path.join(ROOT_DIR, 'dataset')
 CHROME_SESSION = 'chrome-session'
 BUSTER = os.path.join(ROOT_DIR, 'buster_1.3.crx')
+# JSON lines log, written in the background and rotated by size
+LOG_FILE = os.path.join(ROOT_DIR, 'house-scraper.log')
+LOG_MAX_MB = 50
+LOG_BACKUPS = 5     # rotated files kept
 
 # ---------------------------------------------------------
 
@@ -23,8 +27,26 @@ IDEALISTA_FILE = os.path.join(
 IDEALISTA_MAPS = os.path.join(DATASET_DIR, IDEALISTA_ID + '-maps')
 # Directory to save temporary files
 IDEALISTA_TMP = os.path.join(TMP_DIR, IDEALISTA_ID)
+# URLs visited and to visit, kept between runs
+IDEALISTA_FRONTIER = os.path.join(IDEALISTA_TMP, 'frontier.sqlite')
+# houses scraped since the last compaction into IDEALISTA_FILE
+IDEALISTA_SEGMENTS = os.path.join(IDEALISTA_TMP, 'segments')
+# raw pages fetched, kept between runs to extract them again offline
+IDEALISTA_ARCHIVE = os.path.join(DATASET_DIR, IDEALISTA_ID + '-archive')
+IDEALISTA_ARCHIVE_PAGES = True
 IDEALISTA_BACKUP_AFTER = 10  # URLs to visit before saving the progress
 IDEALISTA_MAX_RETRIES = 3   # Max. retries before giving up on URL
+# Download the house pages over plain HTTP, using the browser only as fallback
+IDEALISTA_HTTP_FETCH = True
+IDEALISTA_HTTP_WORKERS = 24  # workers downloading house pages over HTTP
+# Navigation workers, sharing the drivers with the house pages. Only one navigates
+# while the houses waiting to be scraped are at least IDEALISTA_HOUSES_BACKLOG
+IDEALISTA_NAVIGATION_WORKERS = 6
+IDEALISTA_HOUSES_BACKLOG = 48
+# Enqueue all the navigation pages of a location at once, built from its number of
+# houses, instead of discovering each page from the previous one
+IDEALISTA_PAGINATION_SYNTHESIS = True
+IDEALISTA_RESULTS_PER_PAGE = 30
 
 FOTOCASA_ID = 'fotocasa'
 FOTOCASA_URL = 'https://www.fotocasa.es/es/'
@@ -38,15 +60,32 @@ FOTOCASA_SCROLL_LOCATION_PAGE = 20
 FOTOCASA_SCROLL_HOUSE_PAGE = 3
 # number of pages to process
 FOTOCASA_NUM_PAGES_TO_READ = 100
+# Read the navigation pages after the first one in parallel, built from the number
+# of houses, instead of following the links to the next page one by one
+FOTOCASA_PAGINATION_SYNTHESIS = True
+FOTOCASA_RESULTS_PER_PAGE = 30
+
+# files of a merged folder that could not be hardlinked: relative path -> source path
+FOLDER_MANIFEST = 'manifest.json'
+
+# merging of the partial datasets, streamed in chunks
+MERGE_CHUNK_ROWS = 50_000
+MERGE_WORKERS = 4   # files parsed in parallel
+MERGE_PREFETCH = 2  # chunks parsed ahead per file
 
 # name of merged dataframe
 MERGED_FILE = os.path.join(DATASET_DIR, 'fotocasa_idealista_merged.csv')
 # name of zip merged dataframe
 MERGED_ZIP_FILE = os.path.join(
     DATASET_DIR, 'fotocasa_idealista-villaverde_salamanca-2022_04.zip')
+MERGED_ZIP_CSV_LEVEL = 6    # deflate level of the CSV; the images are stored as they are
+MERGED_ZIP_CHUNK_MB = 16    # chunks of the CSV deflated in parallel
+MERGED_ZIP_WORKERS = os.cpu_count() or 4    # threads deflating the chunks of the CSV
 
 # ---------------------------------------------------------
 
+WAIT_SCALE = 1     # multiplier of every wait and pacing delay; the benchmark scales them down
+
 SCROLL_WAIT = 0.5
 
 RANDOM_MIN_WAIT = 10
@@ -61,4 +100,68 @@ MEGA_MAX_WAIT = 80
 
 SYNCHRO_MAX_WAIT = 90
 
+# pacing of the requests to each domain: additive increase, multiplicative decrease
+RATE_INITIAL = 0.2      # requests per second to a domain, shared by all workers
+RATE_MIN = 1 / 120
+RATE_MAX = 1
+RATE_INCREASE = 0.01    # requests per second added after each clean response
+RATE_DECREASE = 0.5     # rate multiplier after a 403, a captcha or a retry
+RATE_BURST = 2  # requests that can be made in a row after an idle period
+RATE_JITTER = 0.5   # waits are randomly stretched up to this fraction
+
 MAX_WORKERS = 6
+
+# every scraper runs in its own process, restarted if it crashes
+SCRAPER_MAX_RESTARTS = 2
+SCRAPER_CPUS = None     # cores each scraper is pinned to, Linux only
+SCRAPER_MAX_MEMORY_MB = None    # resident memory of a scraper and its browsers before recycling its drivers
+
+# drivers split between the scrapers, each one with its own pool
+DRIVER_POOL_SIZE = MAX_WORKERS * 2
+DRIVER_MAX_PAGES = 50   # pages served by a driver before recycling it
+DRIVER_MAX_MEMORY_MB = 2048     # resident memory of a driver and its browser before recycling it
+
+# stages of the scraping run on trio: fetch, parse and persist
+ORCHESTRATOR_PARSE_WORKERS = 4  # threads parsing pages at once
+ORCHESTRATOR_BUFFER = 16    # items waiting between two stages
+ORCHESTRATOR_POLL = 1   # seconds between checks for new work in the frontier
+
+# metrics of the scraping stages, served while scraping and dumped at the end
+METRICS_PORT = 9108     # each scraper process listens on the next port; None to not serve them
+METRICS_DIR = os.path.join(ROOT_DIR, 'metrics')
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)    # seconds
+
+# raw pages archive: a gzip member per page, in segments indexed by URL and fetch time
+PAGE_ARCHIVE_LEVEL = 6
+PAGE_ARCHIVE_SEGMENT_MB = 256
+PAGE_ARCHIVE_WORKERS = os.cpu_count() or 4  # processes parsing the archived pages
+PAGE_ARCHIVE_CHUNK = 500    # pages parsed by a process at a time
+
+# images are downloaded in the background, once, into a content-addressed store
+IMAGE_STORE_DIR = os.path.join(DATASET_DIR, 'image-store')
+IMAGE_WORKERS = 8
+IMAGE_QUEUE_SIZE = 5000     # images waiting to be downloaded
+IMAGE_MAX_RETRIES = 3
+IMAGE_RETRY_BACKOFF = 2     # seconds before the first retry, doubles every time
+
+# distributed crawls: the coordinator serves its frontier to the workers
+BROKER_ADDRESS = 'localhost:8765'
+BROKER_TIMEOUT = 600    # seconds waiting for an answer; longer than any lease wait
+BROKER_LEASE_TIMEOUT = 1800     # seconds before the task of a silent worker is requeued
+# secret shared by the coordinator and its workers; required to serve beyond localhost
+BROKER_TOKEN = os.environ.get('HOUSE_SCRAPER_BROKER_TOKEN')
+
+# listings already scraped, as site:id, kept between runs
+SEEN_INDEX_FILE = os.path.join(DATASET_DIR, 'seen-listings.txt')
+SEEN_INDEX_BLOOM = False    # Bloom filter instead of an exact set, for very large crawls
+SEEN_BLOOM_CAPACITY = 10_000_000
+SEEN_BLOOM_ERROR_RATE = 0.001   # chance of skipping a new listing at full capacity
+
+# proxies are validated against the probe URL and scored by latency
+PROXY_PROBE_URL = 'https://www.google.com/generate_204'
+PROXY_TIMEOUT = 10
+PROXY_VALIDATION_WORKERS = 32
+PROXY_MIN_ATTEMPTS = 3      # attempts before a proxy can be evicted
+PROXY_MIN_SUCCESS_RATE = 0.5
+PROXY_EVICTION_SECONDS = 30 * 60     # time an evicted proxy is not validated again
+PROXY_TOP = 5   # proxies handed out are picked from the fastest ones
@@ -0,0 +1,157 @@
+"""
+Append-only dataset writer. Every checkpoint flushes its batch of rows
+as a new immutable JSON Lines segment, listed in a small manifest, so a
+checkpoint costs the size of the batch and not the size of the dataset.
+The segments are deduplicated and compacted into the CSV only at the
+end of the scraping or on demand.
+"""
+
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+
+from . import utils
+
+
+class DatasetWriter():
+    """
+    Class used to represent a dataset written in immutable segments
+
+    ...
+
+    Attributes
+    ----------
+    folder : str
+        folder of the segments and their manifest
+
+    Methods
+    -------
+    append(rows : list)
+        Writes a batch of rows as a new segment
+    get_segments()
+        Gets the segment files, oldest first
+    compact(csv_file : str, key : str, opt, columns : list, opt)
+        Merges the segments into a CSV file and deletes them
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.__manifest_file = os.path.join(folder, 'manifest.json')
+        self.__lock = threading.Lock()
+        self.__segments = list()    # {'file', 'rows'}, oldest first
+
+        if not utils.directory_exists(folder):
+            utils.create_directory(folder)
+        if utils.file_exists(self.__manifest_file):
+            with open(self.__manifest_file, 'r', encoding='utf-8') as file:
+                self.__segments = json.load(file)['segments']
+
+        # segments written right before a crash, not yet in the manifest
+        listed = {segment['file'] for segment in self.__segments}
+        orphans = sorted(file for file in os.listdir(folder)
+                         if re.match(r'segment-\d+\.jsonl$', file) and file not in listed)
+        for orphan in orphans:
+            utils.warn('Recovering segment %s missing from the manifest', orphan)
+            with open(os.path.join(folder, orphan), 'r', encoding='utf-8') as file:
+                self.__segments.append(
+                    {'file': orphan, 'rows': sum(1 for _ in file)})
+        if orphans:
+            self.__segments.sort(key=lambda segment: segment['file'])
+            self.__write_manifest()
+
+    def append(self, rows: list) -> str:
+        """
+        Writes a batch of rows as a new segment. The segment is never modified again
+
+        Parameters
+        ----------
+        rows : list
+            List of dictionaries, one per row
+
+        Returns
+        -------
+        Absolute path of the segment, None if there were no rows
+        """
+        if not rows:
+            return None
+        with self.__lock:
+            number = int(re.search(r'\d+', self.__segments[-1]['file']).group(0)) + 1 \
+                if self.__segments else 1
+            name = f'segment-{number:06d}.jsonl'
+            segment_file = os.path.join(self.folder, name)
+            with open(segment_file + '.tmp', 'w', encoding='utf-8') as file:
+                for row in rows:
+                    file.write(json.dumps(row, ensure_ascii=False,
+                               default=str) + '\n')
+            os.replace(segment_file + '.tmp', segment_file)
+            self.__segments.append({'file': name, 'rows': len(rows)})
+            self.__write_manifest()
+        utils.log('Wrote %s rows into %s', len(rows), segment_file)
+        return segment_file
+
+    def get_segments(self) -> list:
+        """
+        Gets the segment files, oldest first
+
+        Returns
+        -------
+        List of the absolute paths of the segments
+        """
+        with self.__lock:
+            return [os.path.join(self.folder, segment['file']) for segment in self.__segments]
+
+    def compact(self, csv_file: str, key: str = 'id', columns: list = None) -> int:
+        """
+        Merges the segments into a CSV file, keeping the newest row of each key,
+        and deletes the segments
+
+        Parameters
+        ----------
+        csv_file : str
+            Absolute path to the CSV file. Its rows are kept unless a segment has a newer one
+        key : str, opt
+            Column identifying a row
+        columns : list, opt
+            Columns of the CSV file. By default, the columns found in the data
+
+        Returns
+        -------
+        The number of rows of the CSV file, None if there were no segments to compact
+        """
+        with self.__lock:
+            segments = list(self.__segments)
+            dfs = list()
+            if utils.file_exists(csv_file):
+                dfs.append(pd.read_csv(csv_file))
+            for segment in segments:
+                dfs.append(pd.read_json(os.path.join(self.folder, segment['file']),
+                                        lines=True, dtype=False))
+            if not segments:
+                return None
+
+            df = pd.concat(dfs).drop_duplicates(key, keep='last')
+            if columns:
+                df = df.reindex(columns=columns)
+            df.to_csv(csv_file + '.tmp', encoding='utf-8',
+                      index=False, header=True)
+            os.replace(csv_file + '.tmp', csv_file)
+
+            # the manifest goes first: a segment not deleted is just written again
+            self.__segments = self.__segments[len(segments):]
+            self.__write_manifest()
+            for segment in segments:
+                os.remove(os.path.join(self.folder, segment['file']))
+        utils.log(
+            'Compacted %s segments into %s: %s', len(segments), csv_file, df.shape)
+        return len(df)
+
+    def __write_manifest(self):
+        """
+        Writes the manifest atomically. Must be called holding the lock
+        """
+        with open(self.__manifest_file + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'segments': self.__segments}, file, indent=2)
+        os.replace(self.__manifest_file + '.tmp', self.__manifest_file)
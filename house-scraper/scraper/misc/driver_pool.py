@@ -0,0 +1,258 @@
+"""
+Pool of selenium web drivers shared by the tasks of a scraper. The
+drivers are leased to the tasks and reused between them, instead of
+starting a new Chrome for every page. Every scraper process has its own
+pool, with its share of the drivers.
+"""
+
+import atexit
+import os
+import threading
+from contextlib import contextmanager
+from queue import Empty, Queue
+
+from . import config, utils
+
+try:
+    import psutil
+except ImportError:     # without psutil, the drivers are only recycled by pages served
+    psutil = None
+
+
+class DriverPool():
+    """
+    Class used to represent a bounded pool of selenium web drivers
+
+    ...
+
+    Attributes
+    ----------
+    size : int
+        maximum number of drivers alive at the same time
+    use_proxy : bool
+        if the drivers are created behind a proxy
+    max_memory_mb : int
+        resident memory of the process and its browsers before recycling the drivers
+        given back. None for no limit
+
+    Methods
+    -------
+    lease()
+        Context manager that lends a healthy driver to a task
+    close()
+        Quits every driver of the pool
+    """
+
+    def __init__(self, size: int = config.DRIVER_POOL_SIZE, use_proxy: bool = False,
+                 max_memory_mb: int = config.SCRAPER_MAX_MEMORY_MB):
+        self.size = size
+        self.use_proxy = use_proxy
+        self.max_memory_mb = max_memory_mb
+        self.__idle = Queue()
+        self.__slots = threading.Semaphore(value=size)
+        self.__pages = dict()   # pages served by each driver
+        self.__closed = False
+
+    @contextmanager
+    def lease(self):
+        """
+        Lends a driver to a task, waiting for one to be free if all of them are leased.
+        The driver returns to the pool when the task is done
+
+        Returns
+        -------
+        A selenium driver
+        """
+        self.__slots.acquire()
+        driver = None
+        try:
+            driver = self.__take()
+            yield driver
+        finally:
+            if driver is not None:
+                self.__give_back(driver)
+            self.__slots.release()
+
+    def close(self):
+        """
+        Quits every idle driver of the pool. Leased drivers are quit when given back
+        """
+        self.__closed = True
+        self.__quit_idle()
+
+    def __take(self):
+        """
+        Takes an idle driver that is still alive, or creates a new one
+
+        Returns
+        -------
+        A selenium driver
+        """
+        while True:
+            try:
+                driver = self.__idle.get_nowait()
+            except Empty:
+                driver = utils.get_selenium(self.use_proxy)
+                self.__pages[id(driver)] = 0
+                return driver
+            if self.__is_alive(driver):
+                return driver
+            utils.warn('Recycling a dead driver')
+            self.__quit(driver)
+
+    def __give_back(self, driver):
+        """
+        Returns a driver to the pool, or quits it if it has served too many pages
+        or uses too much memory. If the whole process does, the idle drivers are quit too
+
+        Parameters
+        ----------
+        driver
+            Selenium driver
+        """
+        self.__pages[id(driver)] = self.__pages.get(id(driver), 0) + 1
+        utils.get_browser_response(driver)  # empties the performance log
+        if self.__closed:
+            self.__quit(driver)
+        elif self.__pages[id(driver)] >= config.DRIVER_MAX_PAGES:
+            utils.log(
+                'Recycling a driver after %s pages', self.__pages[id(driver)])
+            self.__quit(driver)
+        elif self.__memory_mb(self.__pid(driver)) >= config.DRIVER_MAX_MEMORY_MB:
+            utils.log('Recycling a driver that uses too much memory')
+            self.__quit(driver)
+        elif self.max_memory_mb and self.__memory_mb(os.getpid()) >= self.max_memory_mb:
+            utils.warn('The scraper uses more than %s MB, recycling its idle drivers', self.max_memory_mb)
+            self.__quit(driver)
+            self.__quit_idle()
+        else:
+            self.__idle.put(driver)
+
+    def __is_alive(self, driver) -> bool:
+        """
+        Checks if the driver still answers
+
+        Parameters
+        ----------
+        driver
+            Selenium driver
+
+        Returns
+        -------
+        True if the driver is alive
+        """
+        try:
+            driver.execute_script('return document.readyState')
+            return True
+        except Exception:
+            return False
+
+    def __pid(self, driver) -> int:
+        """
+        Gets the ID of the chromedriver process of a driver, None if unknown
+        """
+        try:
+            return driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def __memory_mb(self, pid: int) -> float:
+        """
+        Gets the resident memory of a process and every process it launched: for a
+        driver, the chromedriver and its browser processes
+
+        Parameters
+        ----------
+        pid : int
+            ID of the process
+
+        Returns
+        -------
+        Megabytes used, 0 if unknown
+        """
+        if psutil is None or pid is None:
+            return 0
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.Error:
+            return 0
+        used = 0
+        for process in processes:
+            try:
+                used += process.memory_info().rss
+            except psutil.Error:
+                pass    # the process exited meanwhile
+        return used / 2**20
+
+    def __quit_idle(self):
+        """
+        Quits every idle driver of the pool
+        """
+        while True:
+            try:
+                self.__quit(self.__idle.get_nowait())
+            except Empty:
+                return
+
+    def __quit(self, driver):
+        """
+        Quits the driver, ignoring any error of an already dead driver
+
+        Parameters
+        ----------
+        driver
+            Selenium driver
+        """
+        self.__pages.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            utils.warn('Error quitting a driver: %s', e)
+
+
+__pool = None
+__pool_size = config.DRIVER_POOL_SIZE
+__pool_lock = threading.Lock()
+
+
+def get_pool() -> DriverPool:
+    """
+    Gets the driver pool shared by the tasks of this process, creating it the first time
+
+    Returns
+    -------
+    The shared DriverPool
+    """
+    global __pool
+    with __pool_lock:
+        if __pool is None:
+            __pool = DriverPool(__pool_size)
+            atexit.register(__pool.close)
+    return __pool
+
+
+def set_size(size: int):
+    """
+    Sets the size of the pool of this process, before it is created. The scraper
+    processes split config.DRIVER_POOL_SIZE between them
+
+    Parameters
+    ----------
+    size : int
+        Maximum number of drivers alive at the same time
+    """
+    global __pool_size
+    __pool_size = size
+
+
+def shutdown():
+    """
+    Quits the drivers of the shared pool, if it was ever created
+    """
+    global __pool
+    with __pool_lock:
+        pool, __pool = __pool, None
+    if pool is not None:
+        atexit.unregister(pool.close)
+        pool.close()
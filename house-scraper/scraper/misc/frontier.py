@@ -0,0 +1,257 @@
+"""
+Durable crawl frontier. The URLs to visit live in an embedded SQLite
+database (WAL mode) instead of pickled queues: every URL is a row with
+its kind (navigation, house...), priority and state (pending, in-flight,
+done), so enqueueing, leasing and completing a URL only touch one
+indexed row, and resuming a crawl does not load the frontier in memory.
+"""
+
+import json
+import sqlite3
+import threading
+from time import time
+
+from . import utils
+
+PENDING = 0
+INFLIGHT = 1
+DONE = 2
+
+
+class Frontier():
+    """
+    Class used to represent the URLs a scraper has visited and has to visit
+
+    ...
+
+    Attributes
+    ----------
+    db_file : str
+        path to the SQLite database
+
+    Methods
+    -------
+    put(kind : str, url : str, priority : int, opt, payload : dict, opt, reset : bool, opt)
+        Adds a URL to visit, unless it is already in the frontier
+    lease(kind : str, timeout : float, opt)
+        Takes the pending URL with the best priority and marks it in-flight
+    complete(kind : str, urls : list)
+        Marks the URLs as visited
+    release(kind : str, url : str)
+        Returns an in-flight URL to the pending ones
+    requeue(older_than : float, opt)
+        Returns the URLs in-flight for too long to the pending ones
+    has(kind : str, state : int, opt)
+        Checks if there is any URL of a kind
+    clear()
+        Removes every URL, to crawl again from scratch
+    count(kind : str, state : int, opt)
+        Counts the URLs of a kind
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self.__lock = threading.Lock()
+        self.__changed = threading.Condition(self.__lock)
+        self.__db = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('''CREATE TABLE IF NOT EXISTS frontier (
+                                id INTEGER PRIMARY KEY,
+                                kind TEXT NOT NULL,
+                                url TEXT NOT NULL,
+                                priority INTEGER NOT NULL DEFAULT 0,
+                                state INTEGER NOT NULL DEFAULT 0,
+                                leased_at REAL,
+                                payload TEXT,
+                                UNIQUE (kind, url))''')
+        self.__db.execute('''CREATE INDEX IF NOT EXISTS frontier_queue
+                                ON frontier (kind, state, priority, id)''')
+
+        # the URLs in-flight when the last run stopped were not visited
+        requeued = self.requeue()
+        if requeued:
+            utils.log('Requeued %s in-flight URLs of %s', requeued, db_file)
+
+    def put(self, kind: str, url: str, priority: int = 0, payload: dict = None, reset: bool = False) -> bool:
+        """
+        Adds a URL to visit, unless it is already in the frontier. With reset, a URL
+        already visited is returned to the pending ones to be visited again
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URL (navigation, house...)
+        url : str
+            URL to visit
+        priority : int, opt
+            Priority of the URL. Less is better
+        payload : dict, opt
+            Data that travels with the URL
+        reset : bool, opt
+            Flag to visit the URL again if it was already visited. The URLs pending
+            or in-flight are left as they are
+
+        Returns
+        -------
+        True if the URL was added, or returned to the pending ones
+        """
+        payload = json.dumps(payload) if payload is not None else None
+        with self.__changed:
+            if reset:
+                added = self.__db.execute('''INSERT INTO frontier (kind, url, priority, payload) VALUES (?, ?, ?, ?)
+                                             ON CONFLICT (kind, url) DO UPDATE
+                                             SET state = ?, leased_at = NULL, priority = excluded.priority,
+                                                 payload = excluded.payload
+                                             WHERE state = ?''',
+                                          (kind, url, priority, payload, PENDING, DONE)).rowcount
+            else:
+                added = self.__db.execute('INSERT OR IGNORE INTO frontier (kind, url, priority, payload) VALUES (?, ?, ?, ?)',
+                                          (kind, url, priority, payload)).rowcount
+            if added:
+                self.__changed.notify_all()
+        return added > 0
+
+    def lease(self, kind: str, timeout: float = None) -> tuple:
+        """
+        Takes the pending URL of a kind with the best priority and marks it in-flight,
+        waiting for one up to timeout seconds
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URL (navigation, house...)
+        timeout : float, opt
+            Seconds to wait for a pending URL. By default, does not wait
+
+        Returns
+        -------
+        A tuple (url, priority, payload). None if there is no pending URL
+        """
+        deadline = time() + (timeout or 0)
+        with self.__changed:
+            while True:
+                row = self.__db.execute('''SELECT id, url, priority, payload FROM frontier
+                                           WHERE kind = ? AND state = ?
+                                           ORDER BY priority, id LIMIT 1''', (kind, PENDING)).fetchone()
+                if row is not None:
+                    self.__db.execute('UPDATE frontier SET state = ?, leased_at = ? WHERE id = ?',
+                                      (INFLIGHT, time(), row[0]))
+                    return row[1], row[2], json.loads(row[3]) if row[3] else None
+                if time() >= deadline:
+                    return None
+                self.__changed.wait(deadline - time())
+
+    def complete(self, kind: str, urls: list):
+        """
+        Marks the URLs of a kind as visited
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URLs (navigation, house...)
+        urls : list
+            URLs visited
+        """
+        with self.__lock:
+            self.__db.execute('BEGIN')
+            self.__db.executemany('UPDATE frontier SET state = ?, leased_at = NULL WHERE kind = ? AND url = ?',
+                                  [(DONE, kind, url) for url in urls])
+            self.__db.execute('COMMIT')
+
+    def requeue(self, older_than: float = 0) -> int:
+        """
+        Returns the URLs in-flight for too long to the pending ones
+
+        Parameters
+        ----------
+        older_than : float, opt
+            Seconds a URL has to be in-flight to be requeued. By default, all of them
+
+        Returns
+        -------
+        Number of URLs requeued
+        """
+        with self.__changed:
+            requeued = self.__db.execute('UPDATE frontier SET state = ?, leased_at = NULL WHERE state = ? AND leased_at <= ?',
+                                         (PENDING, INFLIGHT, time() - older_than)).rowcount
+            if requeued:
+                self.__changed.notify_all()
+        return requeued
+
+    def release(self, kind: str, url: str):
+        """
+        Returns an in-flight URL to the pending ones, to be visited again
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URL (navigation, house...)
+        url : str
+            URL not visited
+        """
+        with self.__changed:
+            self.__db.execute('UPDATE frontier SET state = ?, leased_at = NULL WHERE kind = ? AND url = ?',
+                              (PENDING, kind, url))
+            self.__changed.notify_all()
+
+    def has(self, kind: str, state: int = None) -> bool:
+        """
+        Checks if there is any URL of a kind, without counting all of them
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URLs (navigation, house...)
+        state : int, opt
+            PENDING, INFLIGHT or DONE. By default, any of them
+
+        Returns
+        -------
+        True if there is any URL
+        """
+        with self.__lock:
+            if state is None:
+                row = self.__db.execute('SELECT 1 FROM frontier WHERE kind = ? LIMIT 1',
+                                        (kind,)).fetchone()
+            else:
+                row = self.__db.execute('SELECT 1 FROM frontier WHERE kind = ? AND state = ? LIMIT 1',
+                                        (kind, state)).fetchone()
+        return row is not None
+
+    def count(self, kind: str, state: int = None) -> int:
+        """
+        Counts the URLs of a kind
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the URLs (navigation, house...)
+        state : int, opt
+            PENDING, INFLIGHT or DONE. By default, counts all of them
+
+        Returns
+        -------
+        Number of URLs
+        """
+        with self.__lock:
+            if state is None:
+                return self.__db.execute('SELECT COUNT(*) FROM frontier WHERE kind = ?',
+                                         (kind,)).fetchone()[0]
+            return self.__db.execute('SELECT COUNT(*) FROM frontier WHERE kind = ? AND state = ?',
+                                     (kind, state)).fetchone()[0]
+
+    def clear(self):
+        """
+        Removes every URL, visited or not, to crawl again from scratch
+        """
+        with self.__lock:
+            self.__db.execute('DELETE FROM frontier')
+
+    def close(self):
+        """
+        Closes the database
+        """
+        with self.__lock:
+            self.__db.close()
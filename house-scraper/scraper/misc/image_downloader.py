@@ -0,0 +1,203 @@
+"""
+Background image downloader. The page workers push the images to a
+bounded queue and go on scraping; a few threads drain the queue over
+pooled keep-alive connections. Images already in the image store are
+linked instead of downloaded again.
+"""
+
+import atexit
+import threading
+from queue import Full, Queue
+from time import time
+
+from requests.adapters import HTTPAdapter
+
+from . import config, image_store, metrics, utils
+
+
+class ImageDownloader():
+    """
+    Class used to represent the workers that download the images in the background
+
+    ...
+
+    Attributes
+    ----------
+    workers : int
+        number of threads downloading images
+
+    Methods
+    -------
+    submit(url : str, img_file : str, listing : str, opt)
+        Queues an image to be downloaded, without waiting for it
+    stats()
+        Gets the queue depth, throughput and failure counts
+    close()
+        Waits for the queued images and stops the workers
+    """
+
+    def __init__(self, workers: int = config.IMAGE_WORKERS, queue_size: int = config.IMAGE_QUEUE_SIZE):
+        self.workers = workers
+        self.__jobs = Queue(maxsize=queue_size)
+        self.__session = utils.get_http_session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.__session.mount('http://', adapter)
+        self.__session.mount('https://', adapter)
+
+        self.__lock = threading.Lock()
+        self.__counts = {'downloaded': 0, 'reused': 0,
+                         'failed': 0, 'dropped': 0, 'bytes': 0}
+        self.__start_time = time()
+        self.__threads = [threading.Thread(target=self.__worker, daemon=True)
+                          for _ in range(workers)]
+        [thread.start() for thread in self.__threads]
+
+    def submit(self, url: str, img_file: str, listing: str = None) -> bool:
+        """
+        Queues an image to be downloaded. Never blocks: if the queue is full the image
+        is dropped and counted as such
+
+        Parameters
+        ----------
+        url : str
+            URL of the image
+        img_file : str
+            Absolute path to the file the image is going to be saved at
+        listing : str, opt
+            Listing ID the image belongs to, as site:id
+
+        Returns
+        -------
+        True if the image was queued
+        """
+        try:
+            self.__jobs.put_nowait((url, img_file, listing))
+            return True
+        except Full:
+            self.__count('dropped')
+            utils.warn('Image queue full, dropping %s', url, url=url)
+            return False
+
+    def stats(self) -> dict:
+        """
+        Gets the state of the downloader
+
+        Returns
+        -------
+        Dictionary with the queue depth, the images downloaded, reused from the store,
+        failed and dropped, the bytes downloaded and the bytes per second since the start
+        """
+        with self.__lock:
+            stats = dict(self.__counts)
+        stats['queued'] = self.__jobs.qsize()
+        stats['bytes/s'] = stats['bytes'] / max(time() - self.__start_time, 1)
+        return stats
+
+    def close(self):
+        """
+        Waits for every queued image to be downloaded and stops the workers. The images
+        are not waited for if no worker is alive to download them
+        """
+        with self.__jobs.all_tasks_done:
+            while self.__jobs.unfinished_tasks:
+                if not any(thread.is_alive() for thread in self.__threads):
+                    utils.error('No image worker alive, %s images not downloaded', self.__jobs.unfinished_tasks)
+                    break
+                self.__jobs.all_tasks_done.wait(timeout=1)
+        alive = [thread for thread in self.__threads if thread.is_alive()]
+        for _ in alive:
+            self.__jobs.put(None)
+        [thread.join() for thread in alive]
+        utils.log('Image downloader finished: %s', self.stats())
+
+    def __worker(self):
+        """
+        Downloads the queued images until it gets the stop signal (None)
+        """
+        while True:
+            job = self.__jobs.get()
+            try:
+                if job is None:
+                    return
+                self.__download(*job)
+            except Exception as e:
+                # an image that cannot be stored must not stop the worker
+                self.__count('failed')
+                utils.error('Error downloading %s: %s', job[0], e, url=job[0])
+            finally:
+                self.__jobs.task_done()
+
+    def __download(self, url: str, img_file: str, listing: str):
+        """
+        Downloads an image into the store, retrying with exponential backoff, and
+        links it at img_file. Images already stored are not downloaded again
+
+        Parameters
+        ----------
+        url : str
+            URL of the image
+        img_file : str
+            Absolute path to the file the image is going to be saved at
+        listing : str
+            Listing ID the image belongs to, as site:id. Can be None
+        """
+        store = image_store.get_store()
+        key = store.get_key(url)
+        if key is not None:
+            self.__count('reused')
+        else:
+            tmp_file = store.get_tmp_path()
+            with metrics.IMAGE_DOWNLOAD.time():
+                for retry in range(config.IMAGE_MAX_RETRIES + 1):
+                    if retry > 0:
+                        metrics.RETRIES.inc(reason='image')
+                        utils.timed_sleep(config.IMAGE_RETRY_BACKOFF * 2 ** (retry - 1), 'backoff')
+                    size = utils.download_image(url, tmp_file, self.__session)
+                    if size is not None:
+                        key = store.add(url, tmp_file, listing)
+                        self.__count('downloaded')
+                        self.__count('bytes', size)
+                        break
+            if key is None:
+                self.__count('failed')
+                utils.error('Gave up downloading %s', url, url=url)
+                return
+        store.link(key, img_file, listing)
+
+    def __count(self, key: str, value: int = 1):
+        with self.__lock:
+            self.__counts[key] += value
+        if key != 'bytes':
+            metrics.IMAGES.inc(outcome=key)
+
+
+__downloader = None
+__downloader_lock = threading.Lock()
+
+
+def get_downloader() -> ImageDownloader:
+    """
+    Gets the image downloader shared by all the scrapers, creating it the first time
+
+    Returns
+    -------
+    The shared ImageDownloader
+    """
+    global __downloader
+    with __downloader_lock:
+        if __downloader is None:
+            __downloader = ImageDownloader()
+            atexit.register(__downloader.close)
+    return __downloader
+
+
+def shutdown():
+    """
+    Waits for the shared image downloader to finish, if it was ever created
+    """
+    global __downloader
+    with __downloader_lock:
+        downloader, __downloader = __downloader, None
+    if downloader is not None:
+        atexit.unregister(downloader.close)
+        downloader.close()
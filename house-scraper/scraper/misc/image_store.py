@@ -0,0 +1,204 @@
+"""
+Content-addressed image store. Each image is saved once, named after
+the hash of its content; the per-listing folders only hold links to
+the stored images. A small append-only index maps the image URLs and
+the listings to the stored images, so the images already downloaded
+in any run are not downloaded again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from . import config, utils
+
+
+class ImageStore():
+    """
+    Class used to represent a content-addressed store of images
+
+    ...
+
+    Attributes
+    ----------
+    root : str
+        folder of the store
+
+    Methods
+    -------
+    get_key(url : str)
+        Gets the key of an image already stored
+    add(url : str, img_file : str, listing : str, opt)
+        Moves a downloaded image into the store
+    link(key : str, dest : str, listing : str, opt)
+        Makes an image of the store appear at a path
+    """
+
+    def __init__(self, root: str = config.IMAGE_STORE_DIR):
+        self.root = root
+        self.__index_file = os.path.join(root, 'index.jsonl')
+        self.__lock = threading.Lock()
+        self.__urls = dict()        # url -> key
+        self.__listings = dict()    # listing -> set of keys
+
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        if utils.file_exists(self.__index_file):
+            with open(self.__index_file, 'r', encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        self.__index(json.loads(line))
+        utils.log('Image store with %s images in %s', len(self.__urls), root)
+
+    def get_key(self, url: str) -> str:
+        """
+        Gets the key of an image already stored
+
+        Parameters
+        ----------
+        url : str
+            URL of the image
+
+        Returns
+        -------
+        The key of the image, None if the image is not stored
+        """
+        with self.__lock:
+            return self.__urls.get(url)
+
+    def get_listing(self, listing: str) -> list:
+        """
+        Gets the keys of the images of a listing
+
+        Parameters
+        ----------
+        listing : str
+            Listing ID, as site:id
+
+        Returns
+        -------
+        List of the keys of the images of the listing
+        """
+        with self.__lock:
+            return sorted(self.__listings.get(listing, set()))
+
+    def add(self, url: str, img_file: str, listing: str = None) -> str:
+        """
+        Moves a downloaded image into the store. If an image with the same
+        content is already stored, the downloaded one is deleted
+
+        Parameters
+        ----------
+        url : str
+            URL of the image
+        img_file : str
+            Absolute path to the downloaded image
+        listing : str, opt
+            Listing ID the image belongs to, as site:id
+
+        Returns
+        -------
+        The key of the image
+        """
+        sha = hashlib.sha256()
+        with open(img_file, 'rb') as handler:
+            for chunk in iter(lambda: handler.read(64 * 1024), b''):
+                sha.update(chunk)
+        key = sha.hexdigest()
+
+        object_file = self.get_path(key)
+        if utils.file_exists(object_file):
+            os.remove(img_file)
+        else:
+            os.makedirs(os.path.dirname(object_file), exist_ok=True)
+            os.replace(img_file, object_file)
+        self.__record({'url': url, 'key': key, 'listing': listing})
+        return key
+
+    def link(self, key: str, dest: str, listing: str = None):
+        """
+        Makes a stored image appear at dest, hardlinking it if the file system allows it
+        and copying it otherwise
+
+        Parameters
+        ----------
+        key : str
+            Key of the image
+        dest : str
+            Absolute path where the image has to appear
+        listing : str, opt
+            Listing ID the image belongs to, as site:id
+        """
+        if os.path.lexists(dest):
+            os.remove(dest)
+        try:
+            os.link(self.get_path(key), dest)
+        except OSError:
+            shutil.copyfile(self.get_path(key), dest)
+        if listing and key not in self.get_listing(listing):
+            self.__record({'url': None, 'key': key, 'listing': listing})
+
+    def get_path(self, key: str) -> str:
+        """
+        Gets the path of a stored image
+
+        Parameters
+        ----------
+        key : str
+            Key of the image
+
+        Returns
+        -------
+        Absolute path of the image in the store
+        """
+        return os.path.join(self.root, 'objects', key[:2], key + '.jpg')
+
+    def get_tmp_path(self) -> str:
+        """
+        Gets a new temporary path, inside the store, to download an image to
+
+        Returns
+        -------
+        Absolute path to download the image to
+        """
+        return os.path.join(self.root, str(uuid.uuid4()) + '.download')
+
+    def __record(self, entry: dict):
+        """
+        Adds an entry to the index and appends it to the index file
+        """
+        with self.__lock:
+            self.__index(entry)
+            with open(self.__index_file, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + '\n')
+
+    def __index(self, entry: dict):
+        """
+        Adds an entry to the index in memory
+        """
+        if entry['url']:
+            self.__urls[entry['url']] = entry['key']
+        if entry['listing']:
+            self.__listings.setdefault(
+                entry['listing'], set()).add(entry['key'])
+
+
+__store = None
+__store_lock = threading.Lock()
+
+
+def get_store() -> ImageStore:
+    """
+    Gets the image store shared by all the scrapers, loading it the first time
+
+    Returns
+    -------
+    The shared ImageStore
+    """
+    global __store
+    with __store_lock:
+        if __store is None:
+            __store = ImageStore()
+    return __store
@@ -0,0 +1,153 @@
+"""
+Non-blocking structured logging. The scraper threads only put their records
+in an in-memory queue; a background thread formats them as JSON lines, with
+the scraper, the worker and the URL of each record, and writes them to a log
+file rotated by size. The messages are formatted lazily, in that thread, and
+only if the record is going to be written.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import numbers
+import os
+from queue import SimpleQueue
+from time import gmtime, strftime
+
+from . import config
+
+__scraper = None    # scraper of this process, for the records that do not set it
+__listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Class used to represent the format of the log file: a JSON object per line
+    with the 'time', 'level', 'scraper', 'worker', 'url' and 'message' of the
+    record, and any other field it was logged with
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': strftime('%Y-%m-%dT%H:%M:%S', gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+                 'level': record.levelname,
+                 'scraper': getattr(record, 'scraper', None),
+                 'worker': getattr(record, 'worker', record.threadName),
+                 'url': None,
+                 'message': record.getMessage()}
+        entry.update(getattr(record, 'fields', None) or dict())
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Class used to represent the context added to the records when they are logged,
+    in the thread logging them: the scraper and the worker
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'scraper', None) is None:
+            record.scraper = get_scraper()
+        if not hasattr(record, 'worker'):
+            record.worker = record.threadName
+        return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Class used to represent the handler putting the records in the in-memory queue
+    as they are, leaving the formatting of their messages to the writing thread
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class ProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    Class used to represent the handler sending the records of a scraper process to
+    the launcher, through a multiprocessing queue. The messages are formatted by the
+    writing thread of the launcher; here, the arguments that could not be pickled are
+    only turned into text
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = _get_picklable(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(_get_picklable(arg) for arg in record.args)
+        elif isinstance(record.args, dict):
+            record.args = {key: _get_picklable(value) for key, value in record.args.items()}
+        if getattr(record, 'fields', None):
+            record.fields = {key: _get_picklable(value) for key, value in record.fields.items()}
+        if record.exc_info:
+            # the tracebacks cannot be pickled
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _get_picklable(value):
+    """
+    Gets a value that can be sent to another process: strings and numbers as they
+    are, and any other value as its text
+    """
+    if value is None or isinstance(value, (str, numbers.Number)):
+        return value
+    return str(value)
+
+
+def set_scraper(id: str):
+    """
+    Sets the scraper of this process, logged with the records that do not set it
+
+    Parameters
+    ----------
+    id : str
+        ID of the scraper
+    """
+    global __scraper
+    __scraper = id
+
+
+def get_scraper() -> str:
+    return __scraper
+
+
+def setup(log_file: str = config.LOG_FILE):
+    """
+    Sends the records of every logger to the background thread writing the log file.
+    The log of the previous run is rotated out. Only the launcher process writes the
+    log file: the scraper processes send their records to it
+
+    Parameters
+    ----------
+    log_file : str, opt
+        Absolute path to the log file
+    """
+    global __listener
+    if __listener is not None:
+        return
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=config.LOG_MAX_MB * 1024 * 1024, backupCount=config.LOG_BACKUPS,
+        encoding='utf-8', delay=True)
+    if os.path.exists(log_file) and os.path.getsize(log_file) > 0:
+        file_handler.doRollover()
+    file_handler.setFormatter(JsonFormatter())
+
+    records = SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(handler)
+
+    __listener = logging.handlers.QueueListener(records, file_handler)
+    __listener.start()
+    # the records still queued are written before exiting
+    atexit.register(__listener.stop)
@@ -1,23 +1,172 @@
+"""
+Merges the partial datasets of the scrapers and zips the result. The CSV
+files are streamed in chunks, parsed ahead in parallel, deduplicated on
+their id with an index of the ids already written and appended to the
+merged file, so the memory does not grow with the size of the datasets.
+The values are copied as text, without being parsed. The merged CSV is
+deflated into the archive in parallel chunks, as pigz does.
+"""
+
 import os
 import re
-from zipfile import ZipFile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Event
+from time import localtime
+from zipfile import (ZIP64_LIMIT, ZIP_DEFLATED, ZIP_STORED, BadZipFile,
+                     ZipFile, ZipInfo)
 
 import pandas as pd
 
-from . import config, utils
+from . import config, dataset_writer, utils
+
+
+def _get_columns(sources: list) -> list:
+    """
+    Gets the union of the columns of the CSV files, in order of appearance,
+    reading only their headers
+
+    Parameters
+    ----------
+    sources : list
+        List of (CSV file, dictionary with the constant columns to add to its rows)
+
+    Returns
+    -------
+    List of the columns
+    """
+    columns = list()
+    for csv_file, extra in sources:
+        for column in list(pd.read_csv(csv_file, nrows=0).columns) + list(extra):
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def _read_chunks(csv_files: list):
+    """
+    Reads the CSV files in chunks of text values. Several files are parsed ahead
+    in parallel, holding a few chunks each; the chunks are yielded in order
+
+    Parameters
+    ----------
+    csv_files : list
+        List of the CSV files
+
+    Returns
+    -------
+    Generator of (index of the file, chunk)
+    """
+    queues = [Queue(maxsize=config.MERGE_PREFETCH) for _ in csv_files]
+    stop = Event()
+
+    def put(queue: Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read(i: int):
+        try:
+            for chunk in pd.read_csv(csv_files[i], dtype=str, keep_default_na=False,
+                                     chunksize=config.MERGE_CHUNK_ROWS):
+                if not put(queues[i], chunk):
+                    return
+            put(queues[i], None)
+        except Exception as e:
+            put(queues[i], e)
+
+    with ThreadPoolExecutor(max_workers=config.MERGE_WORKERS) as executor:
+        [executor.submit(read, i) for i in range(len(csv_files))]
+        try:
+            for i, queue in enumerate(queues):
+                while True:
+                    try:
+                        chunk = queue.get(timeout=1)
+                    except Empty:
+                        continue
+                    if chunk is None:
+                        break
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    yield i, chunk
+        finally:
+            stop.set()
+
+
+def _get_key(value: str):
+    """
+    Gets the deduplication key of an id: ids written as numbers are compared as numbers
+    """
+    value = value.strip()
+    if re.fullmatch(r'-?\d+(\.0+)?', value):
+        return int(float(value)) if '.' in value else int(value)
+    return value
+
+
+def _stream_merge(sources: list, out_file: str, key: str = None, index: bool = False) -> int:
+    """
+    Merges CSV files into one, chunk by chunk
+
+    Parameters
+    ----------
+    sources : list
+        List of (CSV file, dictionary with the constant columns to add to its rows)
+    out_file : str
+        Absolute path to the merged CSV file
+    key : str, opt
+        Column to deduplicate the rows on, keeping the first one. By default, no deduplication
+    index : bool, opt
+        Flag to write a first, unnamed column with the number of each row in its file
+
+    Returns
+    -------
+    Number of rows written
+    """
+    columns = _get_columns(sources)
+    seen = set()
+    rows = 0
+    file_rows = [0] * len(sources)
+    tmp_file = out_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as out:
+        pd.DataFrame(columns=columns).to_csv(out, index=index, header=True)
+        for i, chunk in _read_chunks([csv_file for csv_file, _ in sources]):
+            for column, value in sources[i][1].items():
+                chunk[column] = value
+            chunk.index = range(file_rows[i], file_rows[i] + len(chunk))
+            file_rows[i] += len(chunk)
+            if key is not None:
+                keys = chunk[key].map(_get_key) if key in chunk else pd.Series([''] * len(chunk),
+                                                                               index=chunk.index)
+                keep = ~keys.duplicated() & keys.map(lambda value: value not in seen)
+                seen.update(keys[keep])
+                chunk = chunk[keep]
+            chunk.reindex(columns=columns).to_csv(
+                out, index=index, header=False)
+            rows += len(chunk)
+    os.replace(tmp_file, out_file)
+    utils.log('Merged %s files into %s: %s rows', len(sources), out_file, rows)
+    return rows
 
 
 def merge_idealista_files():
     """
-    Merges files from idealista individual location scraping
+    Merges files from idealista individual location scraping, compacting first
+    the segments of an unfinished scraping
     """
+    if utils.directory_exists(config.IDEALISTA_SEGMENTS):
+        dataset_writer.DatasetWriter(
+            config.IDEALISTA_SEGMENTS).compact(config.IDEALISTA_FILE)
     regex = re.compile('.*idealista-.*[.]csv$')
     csvs = utils.get_files_in_directory(config.DATASET_DIR, extension='.csv')
-    dfs = [pd.read_csv(csv_file) for csv_file in csvs if regex.match(csv_file)]
-    if len(dfs) > 0:
-        idealista_csv = pd.concat(dfs).drop_duplicates('id')
-        idealista_csv.to_csv(config.IDEALISTA_FILE, encoding='utf-8',
-                             index=False, header=True)
+    sources = [(csv_file, dict()) for csv_file in csvs if regex.match(csv_file)]
+    if len(sources) > 0:
+        _stream_merge(sources, config.IDEALISTA_FILE, key='id')
 
 
 def merge_idealista_folders():
@@ -25,10 +174,11 @@ def merge_idealista_folders():
     Merges folders from idealista individual location scraping
     """
     regex = re.compile('.*idealista-.*$')
-    folders = [folder for folder in utils.get_directories(
-        config.DATASET_DIR) if regex.match(folder)]
+    # the archived pages are not maps of a location
+    folders = [folder for folder in utils.get_directories(config.DATASET_DIR)
+               if regex.match(folder) and os.path.normpath(folder) != os.path.normpath(config.IDEALISTA_ARCHIVE)]
     if not utils.directory_exists(config.IDEALISTA_MAPS):
-        [utils.duplicate_folder(dir=folder, dest=config.IDEALISTA_MAPS)
+        [utils.link_folder(dir=folder, dest=config.IDEALISTA_MAPS)
          for folder in folders]
 
 
@@ -38,11 +188,9 @@ def merge_fotocasa_files():
     """
     regex = re.compile('.*fotocasa.*[.]csv$')
     csvs = utils.get_files_in_directory(config.DATASET_DIR, extension='.csv')
-    dfs = [pd.read_csv(csv_file) for csv_file in csvs if regex.match(csv_file)]
-    if len(dfs) > 0:
-        fotocasa_csv = pd.concat(dfs).drop_duplicates('id')
-        fotocasa_csv.to_csv(config.FOTOCASA_FILE, encoding='utf-8',
-                            index=False, header=True)
+    sources = [(csv_file, dict()) for csv_file in csvs if regex.match(csv_file)]
+    if len(sources) > 0:
+        _stream_merge(sources, config.FOTOCASA_FILE, key='id')
 
 
 def merge_fotocasa_folders():
@@ -53,7 +201,7 @@ def merge_fotocasa_folders():
     folders = [folder for folder in utils.get_directories(
         config.DATASET_DIR) if regex.match(folder)]
     if not utils.directory_exists(config.FOTOCASA_IMG_DIR):
-        [utils.duplicate_folder(dir=folder, dest=config.FOTOCASA_IMG_DIR)
+        [utils.link_folder(dir=folder, dest=config.FOTOCASA_IMG_DIR)
          for folder in folders]
 
 
@@ -61,44 +209,208 @@ def merge_fotocasa_idealista():
     """
     Merges files from Fotocasa and Idealista .csv and creates a new column to identify its source
     """
-    # read dataframes
-    df_f = pd.read_csv(config.FOTOCASA_FILE)
-    df_i = pd.read_csv(config.IDEALISTA_FILE)
-    df_f['source'] = config.FOTOCASA_ID
-    df_i['source'] = config.IDEALISTA_ID
+    # concat the files, each row numbered within its file
+    _stream_merge([(config.FOTOCASA_FILE, {'source': config.FOTOCASA_ID}),
+                   (config.IDEALISTA_FILE, {'source': config.IDEALISTA_ID})],
+                  config.MERGED_FILE, index=True)
 
-    # concat dataframes
-    df_merged = pd.concat([df_f, df_i])
-    df_merged.to_csv(config.MERGED_FILE)
+
+def _get_media_files(folders: list) -> dict:
+    """
+    Gets the files inside the media folders, including the ones only mapped in
+    their manifests
+
+    Parameters
+    ----------
+    folders : list
+        Absolute paths of the folders
+
+    Returns
+    -------
+    Dictionary with the name of each file in the archive and its absolute path
+    """
+    media = dict()
+    for folder in folders:
+        for rel_name, file_name in utils.resolve_folder(folder).items():
+            media[os.path.basename(folder) + '/' + rel_name] = file_name
+    return media
+
+
+def _is_unchanged(info, file_name: str) -> bool:
+    """
+    Checks if a file is the same the archive has, by its size and modification time
+
+    Parameters
+    ----------
+    info : ZipInfo
+        Member of the archive
+    file_name : str
+        Absolute path of the file
+
+    Returns
+    -------
+    True if the file did not change since it was archived
+    """
+    if not utils.file_exists(file_name):
+        return False
+    stat = os.stat(file_name)
+    date_time = localtime(stat.st_mtime)[:6]
+    # the archive keeps the time with a resolution of 2 seconds
+    return (info.file_size == stat.st_size and
+            info.date_time == date_time[:5] + (date_time[5] // 2 * 2,))
+
+
+def _open_zip(csv_name: str, media: dict) -> ZipFile:
+    """
+    Opens the archive to be updated, if it only needs new media files and a new CSV,
+    or creates it from scratch otherwise
+
+    Parameters
+    ----------
+    csv_name : str
+        Name of the CSV file in the archive. It is always the last member
+    media : dict
+        Media files that have to be in the archive, as given by _get_media_files()
+
+    Returns
+    -------
+    The ZipFile ready to be written into, without the CSV file
+    """
+    if utils.file_exists(config.MERGED_ZIP_FILE):
+        try:
+            zip_file = ZipFile(config.MERGED_ZIP_FILE, 'a')
+            members = sorted(zip_file.infolist(),
+                             key=lambda info: info.header_offset)
+            stale = [info.filename for info in members if not info.is_dir() and info.filename != csv_name
+                     and (info.filename not in media or not _is_unchanged(info, media[info.filename]))]
+            csv_info = zip_file.NameToInfo.get(csv_name)
+            if not stale and (csv_info is None or members[-1] is csv_info):
+                if csv_info is not None:
+                    # the next members are written from the CSV offset on, over it
+                    zip_file.start_dir = csv_info.header_offset
+                    zip_file.filelist.remove(csv_info)
+                    del zip_file.NameToInfo[csv_name]
+                utils.log('Updating %s', config.MERGED_ZIP_FILE)
+                return zip_file
+            zip_file.close()
+            utils.log(
+                '%s archived files changed, rebuilding %s', len(stale), config.MERGED_ZIP_FILE)
+        except BadZipFile as e:
+            utils.warn('Rebuilding %s: %s', config.MERGED_ZIP_FILE, e)
+    return ZipFile(config.MERGED_ZIP_FILE, 'w')
+
+
+def _deflate_chunk(data: bytes, zdict: bytes, last: bool) -> bytes:
+    """
+    Deflates a chunk of a file as a piece of a single raw deflate stream. Runs in
+    the threads of _write_deflated()
+
+    Parameters
+    ----------
+    data : bytes
+        Chunk of the file
+    zdict : bytes
+        End of the previous chunk, to find repetitions across the chunks as a
+        single compressor would
+    last : bool
+        Flag to end the stream after this chunk
+
+    Returns
+    -------
+    The compressed chunk. If not the last one, it ends on a byte boundary, so the
+    next chunk can be appended
+    """
+    if zdict:
+        compressor = zlib.compressobj(config.MERGED_ZIP_CSV_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(config.MERGED_ZIP_CSV_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _write_deflated(zip_file: ZipFile, file_name: str, arc_name: str):
+    """
+    Deflates a file into the archive with several threads, instead of a single one:
+    its chunks are compressed at once and written in order, while the CRC is computed
+
+    Parameters
+    ----------
+    zip_file : ZipFile
+        Archive, open to be written into
+    file_name : str
+        File to archive
+    arc_name : str
+        Name of the file in the archive
+    """
+    info = ZipInfo.from_file(file_name, arc_name)
+    info.compress_type = ZIP_DEFLATED
+    info.CRC = info.compress_size = 0     # known once written
+    zip64 = info.file_size * 1.05 > ZIP64_LIMIT
+    chunk_size = int(config.MERGED_ZIP_CHUNK_MB * 1024 * 1024)
+    # written as ZipFile.write() does, with the data compressed by the threads
+    with zip_file._lock, open(file_name, 'rb') as file, \
+            ThreadPoolExecutor(max_workers=config.MERGED_ZIP_WORKERS) as executor:
+        zip_file.fp.seek(zip_file.start_dir)
+        info.header_offset = zip_file.fp.tell()
+        zip_file.fp.write(info.FileHeader(zip64))
+        data_offset = zip_file.fp.tell()
+
+        crc = size = 0
+        compressed = deque()
+        previous = b''
+        chunk = file.read(chunk_size)
+        while True:
+            following = file.read(chunk_size)
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            compressed.append(executor.submit(_deflate_chunk, chunk, previous[-32768:], not following))
+            # a bounded window of chunks in memory
+            while compressed and (len(compressed) > 2 * config.MERGED_ZIP_WORKERS or not following):
+                zip_file.fp.write(compressed.popleft().result())
+            if not following:
+                break
+            previous, chunk = chunk, following
+
+        info.CRC = crc
+        info.file_size = size
+        info.compress_size = zip_file.fp.tell() - data_offset
+        zip_file.start_dir = zip_file.fp.tell()
+        zip_file.fp.seek(info.header_offset)
+        zip_file.fp.write(info.FileHeader(zip64))
+        zip_file.fp.seek(zip_file.start_dir)
+        zip_file.filelist.append(info)
+        zip_file.NameToInfo[info.filename] = info
+        zip_file._didModify = True
 
 
 def zip_everything():
     """
-    Compresses resulting files
-    """
-    zip_file = ZipFile(config.MERGED_ZIP_FILE, 'w')
-    zip_file.write(filename=config.MERGED_FILE,
-                   arcname=os.path.basename(config.MERGED_FILE))
-    zip_file.write(filename=config.IDEALISTA_MAPS,
-                   arcname=os.path.basename(config.IDEALISTA_MAPS))
-    zip_file.write(filename=config.FOTOCASA_IMG_DIR,
-                   arcname=os.path.basename(config.FOTOCASA_IMG_DIR))
-
-    for folder_name, _, files in os.walk(config.IDEALISTA_MAPS):
-        for file in files:
-            file_name = os.path.join(folder_name, file)
-            arc_name = os.path.relpath(
-                file_name, os.path.join(config.IDEALISTA_MAPS, '..'))
-            zip_file.write(filename=file_name, arcname=arc_name)
-
-    for folder_name, _, files in os.walk(config.FOTOCASA_IMG_DIR):
-        for file in files:
-            file_name = os.path.join(folder_name, file)
-            arc_name = os.path.relpath(
-                file_name, os.path.join(config.FOTOCASA_IMG_DIR, '..'))
-            zip_file.write(filename=file_name, arcname=arc_name)
+    Compresses resulting files. The images, already compressed, are stored as they are
+    and the CSV is deflated in parallel. An existing archive is updated: only the images not archived
+    yet are added, and the CSV is replaced
+    """
+    csv_name = os.path.basename(config.MERGED_FILE)
+    folders = [folder for folder in (config.IDEALISTA_MAPS, config.FOTOCASA_IMG_DIR)
+               if utils.directory_exists(folder)]
+    media = _get_media_files(folders)
+
+    zip_file = _open_zip(csv_name, media)
+    archived = set(zip_file.namelist())
+    for folder in folders:
+        if os.path.basename(folder) + '/' not in archived:
+            zip_file.write(filename=folder, arcname=os.path.basename(folder))
+
+    added = 0
+    for arc_name, file_name in media.items():
+        if arc_name not in archived:
+            zip_file.write(filename=file_name, arcname=arc_name,
+                           compress_type=ZIP_STORED)
+            added += 1
 
+    # last, so the next update can replace it
+    _write_deflated(zip_file, config.MERGED_FILE, csv_name)
     zip_file.close()
+    utils.log(
+        'Zipped %s new files and %s into %s', added, csv_name, config.MERGED_ZIP_FILE)
 
 
 if __name__ == '__main__':
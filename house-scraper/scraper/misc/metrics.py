@@ -0,0 +1,273 @@
+"""
+Metrics of the scraping stages: counters and histograms labelled by
+scraper and worker (the thread), served on a local HTTP endpoint in the
+Prometheus text format while the crawl runs, and dumped to a file at the
+end. The metrics of every stage are defined at the end of this module.
+"""
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+
+from . import config, utils
+
+__scraper = None    # scraper of this process, the default 'scraper' label
+__metrics = list()
+__metrics_lock = threading.Lock()
+
+
+class Metric(ABC):
+    """
+    Class used to represent a metric, with a value per set of labels. Every
+    kind of metric renders its samples in its own way
+
+    ...
+
+    Attributes
+    ----------
+    name : str
+        name of the metric
+    help : str
+        description of the metric
+
+    Methods
+    -------
+    render()
+        Gets the samples of the metric in the Prometheus text format
+    """
+
+    type = None
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = dict()    # labels -> value
+        _register(self)
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for labels, value in sorted(values.items()):
+            lines.extend(self._render_sample(labels, value))
+        return lines
+
+    def _get_labels(self, labels: dict) -> tuple:
+        """
+        Gets the labels of a sample, with the scraper and the worker by default
+        """
+        labels = {'scraper': get_scraper() or '',
+                  'worker': threading.current_thread().name, **labels}
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @abstractmethod
+    def _render_sample(self, labels: tuple, value) -> list:
+        """
+        Gets the lines of a sample in the Prometheus text format
+        """
+
+
+class Counter(Metric):
+    """
+    Class used to represent a value that only goes up
+
+    ...
+
+    Methods
+    -------
+    inc(amount : float, opt, **labels)
+        Adds to the counter
+    """
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        labels = self._get_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _render_sample(self, labels: tuple, value: float) -> list:
+        return [f'{self.name}{_format_labels(labels)} {value:g}']
+
+
+class Histogram(Metric):
+    """
+    Class used to represent the distribution of some observations, in buckets
+
+    ...
+
+    Attributes
+    ----------
+    buckets : tuple
+        upper bounds of the buckets
+
+    Methods
+    -------
+    observe(value : float, **labels)
+        Adds an observation
+    time(**labels)
+        Context manager observing the seconds spent inside it
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: tuple = config.METRICS_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        labels = self._get_labels(labels)
+        with self._lock:
+            counts, total = self._values.get(labels, ([0] * (len(self.buckets) + 1), 0))
+            # buckets are cumulative; the last one is +Inf, the count of observations
+            counts = [count + (value <= bound) for count, bound in zip(counts, self.buckets)] + [counts[-1] + 1]
+            self._values[labels] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def _render_sample(self, labels: tuple, value: tuple) -> list:
+        counts, total = value
+        bounds = [f'{bound:g}' for bound in self.buckets] + ['+Inf']
+        lines = [f'{self.name}_bucket{_format_labels(labels + (("le", bound),))} {count}'
+                 for bound, count in zip(bounds, counts)]
+        lines.append(f'{self.name}_sum{_format_labels(labels)} {total:g}')
+        lines.append(f'{self.name}_count{_format_labels(labels)} {counts[-1]}')
+        return lines
+
+
+def _register(metric: Metric):
+    with __metrics_lock:
+        __metrics.append(metric)
+
+
+def _format_labels(labels: tuple) -> str:
+    """
+    Formats the labels of a sample, escaping their values
+    """
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+
+def set_scraper(id: str):
+    """
+    Sets the scraper of this process, the 'scraper' label of the samples that do not set it
+
+    Parameters
+    ----------
+    id : str
+        ID of the scraper
+    """
+    global __scraper
+    __scraper = id
+
+
+def get_scraper() -> str:
+    return __scraper
+
+
+def render() -> str:
+    """
+    Gets every metric in the Prometheus text format
+
+    Returns
+    -------
+    The text of the metrics
+    """
+    with __metrics_lock:
+        metrics = list(__metrics)
+    return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+def start_server(port: int = config.METRICS_PORT) -> str:
+    """
+    Serves the metrics on localhost in the background, at /metrics
+
+    Parameters
+    ----------
+    port : int, opt
+        Port to listen on
+
+    Returns
+    -------
+    The URL of the metrics, None if the port was not available
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(('localhost', port), Handler)
+    except OSError as e:
+        utils.warn('Could not serve the metrics on port %s: %s', port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://localhost:{server.server_address[1]}/metrics'
+    utils.log('Serving the metrics on %s', url)
+    return url
+
+
+def dump(metrics_file: str = None) -> str:
+    """
+    Writes every metric in the Prometheus text format
+
+    Parameters
+    ----------
+    metrics_file : str, opt
+        Absolute path to the file. By default, a file named after the scraper in METRICS_DIR
+
+    Returns
+    -------
+    Absolute path of the file
+    """
+    if metrics_file is None:
+        metrics_file = os.path.join(config.METRICS_DIR, f'{get_scraper() or "scraper"}.prom')
+    os.makedirs(os.path.dirname(metrics_file), exist_ok=True)
+    with open(metrics_file, 'w', encoding='utf-8') as file:
+        file.write(render())
+    utils.log('Metrics dumped into %s', metrics_file)
+    return metrics_file
+
+
+# metrics of the scraping stages
+NAVIGATION_FETCH = Histogram('scraper_navigation_fetch_seconds',
+                             'Seconds loading a navigation page, until its content is there')
+DETAIL_FETCH = Histogram('scraper_detail_fetch_seconds',
+                         'Seconds loading a house detail page, by method (browser or http)')
+EXTRACTION = Histogram('scraper_extraction_seconds',
+                       'Seconds extracting the data of a page, by page (navigation or house)')
+IMAGE_DOWNLOAD = Histogram('scraper_image_download_seconds',
+                           'Seconds downloading an image, retries included')
+IMAGES = Counter('scraper_images_total',
+                 'Images handled by the downloader, by outcome (downloaded, reused or failed)')
+CAPTCHA_SOLVE = Histogram('scraper_captcha_solve_seconds',
+                          'Seconds trying to solve a captcha')
+RETRIES = Counter('scraper_retries_total',
+                  'Requests retried, by reason (blocked, error, image or the status code)')
+CHECKPOINT = Histogram('scraper_checkpoint_seconds',
+                       'Seconds saving the progress, by step (dump or compact)')
+SLEEP = Counter('scraper_sleep_seconds_total',
+                'Seconds spent sleeping, by kind (wait, mini, mega, scroll, pacing or backoff)')
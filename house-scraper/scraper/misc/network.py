@@ -2,31 +2,91 @@
 Network related functions
 """
 
+import threading
+from random import choice
+
 import requests
 from bs4 import BeautifulSoup
 from random_user_agent.params import OperatingSystem, SoftwareName
 from random_user_agent.user_agent import UserAgent
 
 
+VIEWPORTS = [(1920, 1080), (1536, 864), (1440, 900), (1366, 768), (1600, 900)]
+
+# Accept header sent by each browser engine
+ACCEPT_HEADERS = {
+    'Blink': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Gecko': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+    'WebKit': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+}
+
+__fingerprints = list()
+__fingerprints_lock = threading.Lock()
+
+
 # https://medium.com/analytics-vidhya/the-art-of-not-getting-blocked-how-i-used-selenium-python-to-scrape-facebook-and-tiktok-fd6b31dbe85f
+def get_fingerprints() -> list:
+    """
+    Gets the pool of browser fingerprints, building it only the first time
+
+    Returns
+    -------
+    A list of fingerprints. Each fingerprint is an object with 'user_agent',
+    'engine', the matching 'headers' and a 'viewport' (width, height)
+    """
+    global __fingerprints
+    with __fingerprints_lock:
+        if not __fingerprints:
+            sw_names = [SoftwareName.FIREFOX.value, SoftwareName.BRAVE.value,
+                        SoftwareName.CHROME.value, SoftwareName.CHROMIUM.value,
+                        SoftwareName.EDGE.value, SoftwareName.OPERA.value,
+                        SoftwareName.SAFARI.value]
+            os_names = [OperatingSystem.LINUX.value,
+                        OperatingSystem.MAC_OS_X.value,
+                        OperatingSystem.WINDOWS.value]
+            user_agent_rotator = UserAgent(software_names=sw_names, operating_systems=os_names,
+                                           limit=100)
+            for user_agent in user_agent_rotator.get_user_agents():
+                engine = user_agent.get('software_engine')
+                __fingerprints.append({
+                    'user_agent': user_agent['user_agent'],
+                    'engine': engine,
+                    'headers': {'User-Agent': user_agent['user_agent'],
+                                'Accept': ACCEPT_HEADERS.get(engine, ACCEPT_HEADERS['WebKit']),
+                                'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8'},
+                    'viewport': choice(VIEWPORTS)})
+    return __fingerprints
+
+
+def get_fingerprint(engine: str = None) -> dict:
+    """
+    Picks a random fingerprint from the pool
+
+    Parameters
+    ----------
+    engine : str, opt
+        Browser engine the fingerprint must belong to ('Blink' for chrome drivers).
+        Any engine by default, or if the pool has none of the requested engine
+
+    Returns
+    -------
+    A fingerprint, as returned by get_fingerprints()
+    """
+    fingerprints = get_fingerprints()
+    matching = [fingerprint for fingerprint in fingerprints
+                if engine is None or fingerprint['engine'] == engine]
+    return choice(matching if matching else fingerprints)
+
+
 def get_user_agent():
     """
-    Generates a random user agent
+    Picks a random user agent from the fingerprint pool
 
     Returns
     -------
     A str with a random user agent
     """
-    sw_names = [SoftwareName.FIREFOX.value, SoftwareName.BRAVE.value,
-                SoftwareName.CHROME.value, SoftwareName.CHROMIUM.value,
-                SoftwareName.EDGE.value, SoftwareName.OPERA.value,
-                SoftwareName.SAFARI.value]
-    os_names = [OperatingSystem.LINUX.value,
-                OperatingSystem.MAC_OS_X.value,
-                OperatingSystem.WINDOWS.value]
-    user_agent_rotator = UserAgent(software_names=sw_names, operating_systems=os_names,
-                                   limit=100)
-    return user_agent_rotator.get_random_user_agent()
+    return get_fingerprint()['user_agent']
 
 # ---------------------------------------------------------
 
@@ -42,23 +102,27 @@ def get_proxies() -> list:
 
     Returns
     -------
-    A list of proxies. Each proxy is an object with 'ip' and 'port'
+    A list of proxies. Each proxy is an object with 'ip' and 'port'. Empty
+    if the list could not be obtained; it is tried again in the next call
     """
     global __proxy_list
     if not __proxy_list:
-        __proxy_list = list()
         try:
-            r_headers = {'User-Agent': get_user_agent()}
-            r = requests.get(PROXIES, headers=r_headers)
+            r = requests.get(
+                PROXIES, headers=get_fingerprint()['headers'], timeout=30)
             r.raise_for_status()    # if returned code is unsuccesful, raise error
             html = r.content
-        except (requests.HTTPError, requests.ConnectionError) as e:
+        except requests.RequestException as e:
             print(f'Error trying to get proxies {PROXIES}: {e}')
+            return list()
 
         # if there are no errors opening the URL, returns the soup
         soup = BeautifulSoup(html, 'html.parser')
-        table = soup.body.select(
-            'div.wrap > div.services_proxylist.services > div.inner > div.table_block > table > tbody')[0]
+        table = soup.select_one(
+            'div.wrap > div.services_proxylist.services > div.inner > div.table_block > table > tbody')
+        if table is None:
+            print(f'Error trying to get proxies {PROXIES}: unexpected markup')
+            return list()
         for proxy in table.find_all('tr'):
             features = proxy.find_all('td')
             __proxy_list.append(
@@ -0,0 +1,168 @@
+"""
+Asynchronous orchestration of the scraping, on trio. The pacing delays and
+the waits for new work are trio sleeps, which cost almost nothing, so many
+tasks can be waiting at once without parking a thread each. The blocking
+calls (selenium, HTTP requests, parsing, checkpoints) run in worker threads,
+bounded by a capacity limiter per stage, and a driver is only leased once
+its request is allowed: it is never kept idle while its task waits.
+"""
+
+import trio
+
+from . import config, metrics, rate_limiter, utils
+
+# stages of the blocking calls, each with its own bound
+FETCH = 'fetch'     # browser pages, up to a call per driver of the pool
+HTTP = 'http'   # pages downloaded over plain HTTP
+PARSE = 'parse'
+PERSIST = 'persist'     # checkpoints, one at a time
+
+
+class Orchestrator():
+    """
+    Class used to represent the stages of a scraping, run concurrently on trio
+
+    ...
+
+    Methods
+    -------
+    pace(url : str)
+        Waits, without blocking, until a request to the URL's domain is allowed
+    run_sync(fn : function, *args, stage : str, opt)
+        Runs a blocking function in a worker thread
+    lease(tasks, kind : str, finished : function)
+        Waits, without blocking, for a pending task of a frontier
+    pipeline(source : function, stages : list, buffer : int, opt)
+        Runs the items of a source through several stages of workers
+    """
+
+    def __init__(self, fetch_slots: int = config.DRIVER_POOL_SIZE,
+                 http_slots: int = config.IDEALISTA_HTTP_WORKERS,
+                 parse_slots: int = config.ORCHESTRATOR_PARSE_WORKERS):
+        self.__slots = {FETCH: trio.CapacityLimiter(fetch_slots),
+                        HTTP: trio.CapacityLimiter(http_slots),
+                        PARSE: trio.CapacityLimiter(parse_slots),
+                        PERSIST: trio.CapacityLimiter(1)}
+
+    async def pace(self, url: str):
+        """
+        Waits, without blocking, until a request to the URL's domain is allowed
+        by the shared rate limiter
+
+        Parameters
+        ----------
+        url : str
+            URL to request
+        """
+        # the limiter may be the coordinator's one, behind a request
+        delay = await self.run_sync(rate_limiter.get_limiter().reserve, url)
+        if delay > 0:
+            metrics.SLEEP.inc(delay, kind='pacing')
+        await trio.sleep(delay)
+
+    async def run_sync(self, fn, *args, stage: str = None):
+        """
+        Runs a blocking function in a worker thread
+
+        Parameters
+        ----------
+        fn : function
+            Function to run
+        *args
+            Arguments of the function
+        stage : str, opt
+            Stage of the call (FETCH, HTTP, PARSE, PERSIST), bounding how many calls of
+            the stage run at once. By default, bounded only by the threads of trio
+
+        Returns
+        -------
+        The result of the function
+        """
+        limiter = self.__slots[stage] if stage else None
+        return await trio.to_thread.run_sync(fn, *args, limiter=limiter)
+
+    async def lease(self, tasks, kind: str, finished) -> tuple:
+        """
+        Waits, without blocking, for a pending task of a frontier
+
+        Parameters
+        ----------
+        tasks : Frontier or BrokerClient
+            Frontier of the tasks
+        kind : str
+            Kind of the task (navigation, house...)
+        finished : function
+            Function telling if no more tasks of the kind will come
+
+        Returns
+        -------
+        The leased (url, priority, payload). None when there is no pending task and
+        no more will come
+        """
+        while True:
+            # checked before leasing, not to miss the tasks put in between
+            done = await self.run_sync(finished)
+            leased = await self.run_sync(tasks.lease, kind)
+            if leased is not None:
+                return leased
+            if done:
+                return None
+            await trio.sleep(config.ORCHESTRATOR_POLL)
+
+    async def pipeline(self, source, stages: list, buffer: int = config.ORCHESTRATOR_BUFFER):
+        """
+        Runs the items of a source through several stages, each with its own workers.
+        The stages are connected by bounded memory channels, so a slow stage holds
+        back the ones before it
+
+        Parameters
+        ----------
+        source : function
+            Async function giving the next item, None when there are no more
+        stages : list
+            List of (async function, number of workers). A stage gets an item and
+            returns the item for the next stage, or None to drop it
+        buffer : int, opt
+            Items waiting between two stages
+        """
+        async with trio.open_nursery() as nursery:
+            send, receive = trio.open_memory_channel(buffer)
+            nursery.start_soon(self.__feed, source, send)
+            for fn, workers in stages:
+                next_send, next_receive = trio.open_memory_channel(buffer)
+                async with receive, next_send:
+                    for _ in range(workers):
+                        nursery.start_soon(self.__work, fn,
+                                           receive.clone(), next_send.clone())
+                receive = next_receive
+            nursery.start_soon(self.__drain, receive)
+
+    async def __feed(self, source, send):
+        """
+        Sends the items of the source to the first stage
+        """
+        async with send:
+            while (item := await source()) is not None:
+                await send.send(item)
+
+    async def __work(self, fn, receive, send):
+        """
+        Runs a stage on the items received, and sends the results to the next stage
+        """
+        async with receive, send:
+            async for item in receive:
+                try:
+                    result = await fn(item)
+                except Exception as e:
+                    utils.error('Error in the stage %s: %s', fn.__name__, e)
+                    continue
+                if result is not None:
+                    await send.send(result)
+
+    async def __drain(self, receive):
+        """
+        Discards the results of the last stage
+        """
+        async with receive:
+            async for _ in receive:
+                pass
@@ -0,0 +1,214 @@
+"""
+Archive of the raw pages fetched, to extract them again offline when a
+selector breaks or a field is added, without crawling again. Every page
+is compressed as an independent gzip member appended to the current
+segment file (as WARC.gz does), and an SQLite index keeps where each one
+is, by URL and fetch time, so any page can be read with a single seek.
+Every process writes its own segments, so the processes of a crawl can
+share the archive.
+"""
+
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+from . import config, utils
+
+
+class PageArchive():
+    """
+    Class used to represent the raw pages fetched, compressed in segments
+
+    ...
+
+    Attributes
+    ----------
+    folder : str
+        folder of the segments and their index
+
+    Methods
+    -------
+    add(kind : str, url : str, html : str)
+        Archives a page
+    get(url : str)
+        Gets the latest version of a page
+    count(kind : str)
+        Counts the pages archived
+    extract(kind : str, parse : function, workers : int, opt)
+        Parses the latest version of every page of a kind, in parallel
+    close()
+        Closes the archive
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.__lock = threading.Lock()
+        if not utils.directory_exists(folder):
+            utils.create_directory(folder)
+        self.__db = sqlite3.connect(os.path.join(folder, 'index.sqlite'),
+                                    check_same_thread=False, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('''CREATE TABLE IF NOT EXISTS pages (
+                                 url TEXT NOT NULL,
+                                 kind TEXT NOT NULL,
+                                 fetched_at REAL NOT NULL,
+                                 segment TEXT NOT NULL,
+                                 offset INTEGER NOT NULL,
+                                 length INTEGER NOT NULL)''')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS pages_by_url ON pages (kind, url, fetched_at)')
+
+        # the segments of this process: an offset is only right if nobody else appends
+        self.__prefix = f'pages-{os.getpid()}-'
+        segments = sorted(file for file in os.listdir(folder)
+                          if re.match(rf'{self.__prefix}\d+\.gz$', file))
+        self.__segment = segments[-1] if segments else f'{self.__prefix}000001.gz'
+
+    def add(self, kind: str, url: str, html: str):
+        """
+        Archives a page. A record written right before a crash may stay out of the
+        index, and it is just ignored
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the page (navigation, house...)
+        url : str
+            URL of the page
+        html : str
+            HTML of the page
+        """
+        if not html:
+            return
+        fetched_at = time()
+        header = json.dumps({'url': url, 'kind': kind, 'fetched_at': fetched_at})
+        record = gzip.compress(f'{header}\n{html}'.encode('utf-8'),
+                               compresslevel=config.PAGE_ARCHIVE_LEVEL)
+        with self.__lock:
+            segment_file = os.path.join(self.folder, self.__segment)
+            if (utils.file_exists(segment_file) and
+                    os.path.getsize(segment_file) >= config.PAGE_ARCHIVE_SEGMENT_MB * 1024 * 1024):
+                number = int(re.search(r'(\d+)\.gz$', self.__segment).group(1)) + 1
+                self.__segment = f'{self.__prefix}{number:06d}.gz'
+                segment_file = os.path.join(self.folder, self.__segment)
+            with open(segment_file, 'ab') as file:
+                offset = file.tell()
+                file.write(record)
+            self.__db.execute('INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                              (url, kind, fetched_at, self.__segment, offset, len(record)))
+
+    def get(self, url: str) -> str:
+        """
+        Gets the latest version of a page
+
+        Parameters
+        ----------
+        url : str
+            URL of the page
+
+        Returns
+        -------
+        The HTML of the page, None if it was not archived
+        """
+        with self.__lock:
+            row = self.__db.execute('''SELECT segment, offset, length FROM pages WHERE url = ?
+                                       ORDER BY fetched_at DESC LIMIT 1''', (url,)).fetchone()
+        if row is None:
+            return None
+        return _read_records(self.folder, [(url, *row)])[0][1]
+
+    def count(self, kind: str) -> int:
+        with self.__lock:
+            return self.__db.execute('SELECT COUNT(DISTINCT url) FROM pages WHERE kind = ?',
+                                     (kind,)).fetchone()[0]
+
+    def extract(self, kind: str, parse, workers: int = config.PAGE_ARCHIVE_WORKERS) -> list:
+        """
+        Parses the latest version of every page of a kind, in a pool of processes.
+        Each process reads its pages in the order they are in the segments
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the pages (navigation, house...)
+        parse : function
+            Module-level function getting the HTML and the URL of a page, and returning
+            its row as a dictionary, or None to skip it
+        workers : int, opt
+            Processes parsing the pages
+
+        Returns
+        -------
+        List with the rows parsed
+        """
+        with self.__lock:
+            # the bare columns of a MAX() aggregate are taken from the row with the maximum
+            entries = self.__db.execute('''SELECT url, segment, offset, length, MAX(fetched_at) FROM pages
+                                           WHERE kind = ? GROUP BY url''', (kind,)).fetchall()
+        entries = sorted((entry[:4] for entry in entries), key=lambda entry: (entry[1], entry[2]))
+        chunks = [entries[i:i + config.PAGE_ARCHIVE_CHUNK]
+                  for i in range(0, len(entries), config.PAGE_ARCHIVE_CHUNK)]
+        utils.log('Extracting %s %s pages from %s with %s processes', len(entries), kind, self.folder, workers)
+
+        rows = list()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_rows in executor.map(_extract_chunk, [self.folder] * len(chunks),
+                                           [parse] * len(chunks), chunks):
+                rows.extend(chunk_rows)
+        utils.log('Extracted %s rows from %s %s pages', len(rows), len(entries), kind)
+        return rows
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+def _read_records(folder: str, entries: list) -> list:
+    """
+    Reads some archived pages
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the archive
+    entries : list
+        List of (url, segment, offset, length)
+
+    Returns
+    -------
+    List of (url, html)
+    """
+    pages = list()
+    files = dict()
+    try:
+        for url, segment, offset, length in entries:
+            if segment not in files:
+                files[segment] = open(os.path.join(folder, segment), 'rb')
+            files[segment].seek(offset)
+            record = gzip.decompress(files[segment].read(length)).decode('utf-8')
+            pages.append((url, record.split('\n', 1)[1]))
+    finally:
+        for file in files.values():
+            file.close()
+    return pages
+
+
+def _extract_chunk(folder: str, parse, entries: list) -> list:
+    """
+    Parses some archived pages. Runs in the processes of PageArchive.extract()
+    """
+    rows = list()
+    for url, html in _read_records(folder, entries):
+        try:
+            row = parse(html, url)
+        except Exception as e:
+            utils.warn('Could not extract %s: %s', url, e)
+            continue
+        if row is not None:
+            rows.append(row)
+    return rows
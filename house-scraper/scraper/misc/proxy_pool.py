@@ -0,0 +1,194 @@
+"""
+Proxy pool. Validates the candidate proxies concurrently against a probe
+URL, scores them by latency and success rate, evicts the dead ones for a
+while and hands the fastest healthy ones to the drivers and HTTP clients.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from random import choice
+from time import time
+
+import requests
+
+from . import config, network, utils
+
+
+class ProxyPool():
+    """
+    Class used to represent a pool of validated proxies
+
+    ...
+
+    Attributes
+    ----------
+    probe_url : str
+        URL requested through each proxy to validate it
+    timeout : float
+        seconds before a probe is considered failed
+
+    Methods
+    -------
+    refresh()
+        Validates the candidate proxies not evicted and adds the healthy ones to the pool
+    best()
+        Gets one of the fastest healthy proxies
+    report(proxy : dict, success : bool, latency : float, opt)
+        Records the outcome of a request made through a proxy
+    """
+
+    def __init__(self, candidates: list = None, probe_url: str = config.PROXY_PROBE_URL,
+                 timeout: float = config.PROXY_TIMEOUT):
+        self.probe_url = probe_url
+        self.timeout = timeout
+        self.__candidates = candidates
+        self.__lock = threading.Lock()
+        self.__refresh_lock = threading.Lock()
+        self.__scores = dict()  # 'ip:port' -> proxy with its score
+        self.__evicted = dict()     # 'ip:port' -> time until which it is not validated again
+
+    def refresh(self) -> int:
+        """
+        Validates the candidate proxies concurrently. The candidates are the ones given
+        when creating the pool or, by default, the ones found by network.get_proxies(),
+        except the ones evicted less than PROXY_EVICTION_SECONDS ago
+
+        Returns
+        -------
+        The number of healthy proxies in the pool
+        """
+        candidates = self.__candidates if self.__candidates is not None else network.get_proxies()
+        now = time()
+        with self.__lock:
+            self.__evicted = {key: until for key, until in self.__evicted.items() if until > now}
+            candidates = [proxy for proxy in candidates
+                          if f'{proxy["ip"]}:{proxy["port"]}' not in self.__evicted]
+        with ThreadPoolExecutor(max_workers=config.PROXY_VALIDATION_WORKERS) as executor:
+            list(executor.map(self.probe, candidates))
+        healthy = len(self.get_healthy())
+        utils.log(
+            'Validated %s proxies, %s healthy', len(candidates), healthy)
+        return healthy
+
+    def probe(self, proxy: dict) -> bool:
+        """
+        Requests the probe URL through a proxy and records the outcome
+
+        Parameters
+        ----------
+        proxy : dict
+            Proxy, an object with 'ip' and 'port'
+
+        Returns
+        -------
+        True if the probe succeeded
+        """
+        start = time()
+        try:
+            r = requests.get(self.probe_url, proxies=get_requests_proxies(proxy),
+                             headers=network.get_fingerprint()['headers'], timeout=self.timeout)
+            success = r.status_code < 400
+        except requests.RequestException:
+            success = False
+        self.report(proxy, success, time() - start)
+        return success
+
+    def report(self, proxy: dict, success: bool, latency: float = None):
+        """
+        Records the outcome of a request made through a proxy. Evicts the proxy if it
+        fails too often
+
+        Parameters
+        ----------
+        proxy : dict
+            Proxy, an object with 'ip' and 'port'
+        success : bool
+            If the request succeeded
+        latency : float, opt
+            Seconds the request took
+        """
+        key = f'{proxy["ip"]}:{proxy["port"]}'
+        with self.__lock:
+            score = self.__scores.setdefault(key, {'ip': proxy['ip'], 'port': proxy['port'],
+                                                   'latency': None, 'successes': 0, 'failures': 0})
+            if success:
+                score['successes'] += 1
+                if latency is not None:
+                    # exponentially weighted moving average
+                    score['latency'] = latency if score['latency'] is None else \
+                        0.7 * score['latency'] + 0.3 * latency
+            else:
+                score['failures'] += 1
+
+            attempts = score['successes'] + score['failures']
+            if (attempts >= config.PROXY_MIN_ATTEMPTS and
+                    score['successes'] / attempts < config.PROXY_MIN_SUCCESS_RATE):
+                del self.__scores[key]
+                self.__evicted[key] = time() + config.PROXY_EVICTION_SECONDS
+                utils.log('Evicting proxy %s', key)
+
+    def get_healthy(self) -> list:
+        """
+        Gets the healthy proxies, fastest first
+
+        Returns
+        -------
+        A list of proxies with their 'latency', 'successes' and 'failures'
+        """
+        with self.__lock:
+            healthy = [dict(score) for score in self.__scores.values()
+                       if score['successes'] > 0 and score['latency'] is not None]
+        return sorted(healthy, key=lambda score: score['latency'])
+
+    def best(self) -> dict:
+        """
+        Gets one of the fastest healthy proxies, validating the candidates if there is none
+
+        Returns
+        -------
+        A proxy, an object with 'ip' and 'port'. None if no proxy is healthy
+        """
+        with self.__refresh_lock:
+            healthy = self.get_healthy()
+            if not healthy and self.refresh() > 0:
+                healthy = self.get_healthy()
+        if not healthy:
+            utils.warn('No healthy proxies available')
+            return None
+        return choice(healthy[:config.PROXY_TOP])
+
+
+def get_requests_proxies(proxy: dict) -> dict:
+    """
+    Gets the proxies argument of a requests call
+
+    Parameters
+    ----------
+    proxy : dict
+        Proxy, an object with 'ip' and 'port'
+
+    Returns
+    -------
+    Dictionary with the proxy for each scheme
+    """
+    address = f'http://{proxy["ip"]}:{proxy["port"]}'
+    return {'http': address, 'https': address}
+
+
+__pool = None
+__pool_lock = threading.Lock()
+
+
+def get_pool() -> ProxyPool:
+    """
+    Gets the proxy pool shared by all the scrapers, creating it the first time
+
+    Returns
+    -------
+    The shared ProxyPool
+    """
+    global __pool
+    with __pool_lock:
+        if __pool is None:
+            __pool = ProxyPool()
+    return __pool
@@ -0,0 +1,159 @@
+"""
+Adaptive per-domain rate limiter shared by every worker of every scraper.
+Each domain has a token bucket whose rate grows additively while the
+responses are clean and is cut multiplicatively when the site pushes
+back (403, captcha, retries): additive increase, multiplicative decrease.
+"""
+
+import threading
+from random import uniform
+from time import time
+from urllib.parse import urlparse
+
+from . import config, utils
+
+
+class RateLimiter():
+    """
+    Class used to represent the pacing of the requests to each domain
+
+    ...
+
+    Methods
+    -------
+    reserve(url : str)
+        Reserves a request to the URL's domain and gets how long to wait for it
+    wait(url : str)
+        Waits until a request to the URL's domain is allowed
+    success(url : str)
+        Speeds up the requests to the URL's domain
+    blocked(url : str)
+        Slows down the requests to the URL's domain
+    get_rate(url : str)
+        Gets the current requests per second allowed to the URL's domain
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__buckets = dict()     # domain -> rate, tokens and last update
+
+    def reserve(self, url: str) -> float:
+        """
+        Reserves a request to the URL's domain. The caller has to wait the returned
+        seconds before making it
+
+        Parameters
+        ----------
+        url : str
+            URL to request
+
+        Returns
+        -------
+        Seconds to wait before the request
+        """
+        with self.__lock:
+            bucket = self.__get_bucket(url)
+            now = time()
+            bucket['tokens'] = min(config.RATE_BURST,
+                                   bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+            bucket['updated'] = now
+            bucket['tokens'] -= 1
+            delay = 0 if bucket['tokens'] >= 0 else -bucket['tokens'] / bucket['rate']
+        return delay * uniform(1, 1 + config.RATE_JITTER) * config.WAIT_SCALE
+
+    def wait(self, url: str):
+        """
+        Waits until a request to the URL's domain is allowed
+
+        Parameters
+        ----------
+        url : str
+            URL to request
+        """
+        utils.timed_sleep(self.reserve(url), 'pacing')
+
+    def success(self, url: str):
+        """
+        Speeds up the requests to the URL's domain after a clean response
+
+        Parameters
+        ----------
+        url : str
+            URL that answered
+        """
+        with self.__lock:
+            bucket = self.__get_bucket(url)
+            bucket['rate'] = min(config.RATE_MAX,
+                                 bucket['rate'] + config.RATE_INCREASE)
+
+    def blocked(self, url: str):
+        """
+        Slows down the requests to the URL's domain after the site pushed back
+
+        Parameters
+        ----------
+        url : str
+            URL that was blocked
+        """
+        with self.__lock:
+            bucket = self.__get_bucket(url)
+            bucket['rate'] = max(config.RATE_MIN,
+                                 bucket['rate'] * config.RATE_DECREASE)
+            rate = bucket['rate']
+        utils.warn(
+            'Slowing down %s to %.3f requests/s', urlparse(url).netloc, rate)
+
+    def get_rate(self, url: str) -> float:
+        """
+        Gets the requests per second currently allowed to the URL's domain
+
+        Parameters
+        ----------
+        url : str
+            URL of the domain
+
+        Returns
+        -------
+        Requests per second
+        """
+        with self.__lock:
+            return self.__get_bucket(url)['rate']
+
+    def __get_bucket(self, url: str) -> dict:
+        """
+        Gets the bucket of the URL's domain, creating it the first time. Must be
+        called holding the lock
+        """
+        domain = urlparse(url).netloc
+        if domain not in self.__buckets:
+            self.__buckets[domain] = {'rate': config.RATE_INITIAL,
+                                      'tokens': 1, 'updated': time()}
+        return self.__buckets[domain]
+
+
+__limiter = RateLimiter()
+
+
+def get_limiter() -> RateLimiter:
+    """
+    Gets the rate limiter shared by all the scrapers
+
+    Returns
+    -------
+    The shared RateLimiter
+    """
+    return __limiter
+
+
+def set_limiter(limiter):
+    """
+    Replaces the rate limiter shared by all the scrapers. The workers of a distributed
+    crawl use the coordinator's one, so the requests of all of them are paced together
+
+    Parameters
+    ----------
+    limiter : RateLimiter or RemoteRateLimiter
+        The rate limiter to share
+    """
+    global __limiter
+    __limiter = limiter
@@ -0,0 +1,371 @@
+"""
+Index of the listings already scraped, shared by all the scrapers and
+kept between runs. The URLs are reduced to site:id before checking them,
+so the same listing reached through different URLs is the same key. The
+index is an exact set by default, or a Bloom filter for very large crawls
+(less memory, with a small chance of skipping a new listing).
+
+The exact index also keeps a summary of each listing (price, rooms, m2),
+so an incremental crawl only scrapes again the listings whose navigation
+card has changed.
+"""
+
+import atexit
+import hashlib
+import math
+import os
+import re
+import threading
+from time import time
+from urllib.parse import urlparse
+
+import pandas as pd
+
+from . import config, utils
+
+
+def get_listing_id(url: str) -> str:
+    """
+    Gets the ID of a listing from its URL: the number after /inmueble/ in idealista,
+    and the first number of the path in fotocasa
+
+    Parameters
+    ----------
+    url : str
+        URL of the listing
+
+    Returns
+    -------
+    The ID of the listing. None if the URL has no listing ID
+    """
+    parsed = urlparse(url)
+    if config.IDEALISTA_ID in parsed.netloc.lower():
+        match = re.search(r'/inmueble/(\d+)', parsed.path)
+    else:
+        match = re.search(r'(\d+)', parsed.path)
+    return match.group(1) if match else None
+
+
+def canonicalize(url: str) -> str:
+    """
+    Reduces the URL of a listing to its site and ID
+
+    Parameters
+    ----------
+    url : str
+        URL of the listing
+
+    Returns
+    -------
+    The key of the listing, as site:id. None if the URL has no listing ID
+    """
+    host = urlparse(url).netloc.lower()
+    site = next((id for id in (config.IDEALISTA_ID, config.FOTOCASA_ID) if id in host),
+                host.replace('www.', ''))
+    id = get_listing_id(url)
+    if id is None:
+        return None
+    return f'{site}:{id}'
+
+
+def summarize(price, rooms, m2) -> str:
+    """
+    Gets the summary of a listing, comparable between the navigation cards, the
+    house pages and the datasets: only the numbers of its price, rooms and m2
+
+    Parameters
+    ----------
+    price
+        Price of the listing, as number or text ('250.000 €')
+    rooms
+        Rooms of the listing, as number or text ('3 hab.')
+    m2
+        Surface of the listing, as number or text ('90 m²')
+
+    Returns
+    -------
+    The summary, as price|rooms|m2
+    """
+    def number(value) -> str:
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        match = re.search(r'\d[\d.]*', str(value))
+        return match.group(0).replace('.', '') if match else ''
+
+    return '|'.join(number(value) for value in (price, rooms, m2))
+
+
+class BloomFilter():
+    """
+    Class used to represent a Bloom filter: a set that can answer 'maybe' to
+    keys it does not have, with a bounded probability, in a fixed amount of memory
+
+    ...
+
+    Attributes
+    ----------
+    capacity : int
+        keys expected
+    error_rate : float
+        probability of a false positive when the filter holds capacity keys
+
+    Methods
+    -------
+    add(key : str)
+        Adds a key
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.__bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.__hashes = max(1, round(self.__bits / capacity * math.log(2)))
+        self.__array = bytearray((self.__bits + 7) // 8)
+
+    def add(self, key: str):
+        for position in self.__positions(key):
+            self.__array[position // 8] |= 1 << (position % 8)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.__array[position // 8] & (1 << (position % 8))
+                   for position in self.__positions(key))
+
+    def __positions(self, key: str):
+        """
+        Gets the bits of a key, by double hashing
+        """
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        return [(first + i * second) % self.__bits for i in range(self.__hashes)]
+
+
+class SeenIndex():
+    """
+    Class used to represent the listings already scraped
+
+    ...
+
+    Attributes
+    ----------
+    index_file : str
+        file with a key per line, appended while crawling and compacted on close
+
+    Methods
+    -------
+    has(url : str)
+        Checks if the listing of a URL was already scraped
+    get_summary(url : str)
+        Gets the summary of a listing when it was last scraped
+    add(urls : list, summaries : list, opt)
+        Records the listings of the URLs as scraped
+    touch(urls : list)
+        Records the listings of the URLs as seen, unchanged
+    close()
+        Compacts the index file to a line per listing
+    """
+
+    def __init__(self, index_file: str = config.SEEN_INDEX_FILE, bloom: bool = config.SEEN_INDEX_BLOOM):
+        self.index_file = index_file
+        self.__lock = threading.Lock()
+        self.__keys = BloomFilter(config.SEEN_BLOOM_CAPACITY, config.SEEN_BLOOM_ERROR_RATE) \
+            if bloom else set()
+        self.__summaries = None if bloom else dict()    # key -> summary
+
+        if not utils.file_exists(index_file):
+            self.__bootstrap()
+        # each line is key, or key summary last-seen separated by tabs
+        with open(index_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0]:
+                    self.__keys.add(fields[0])
+                    if self.__summaries is not None and len(fields) > 1:
+                        self.__summaries[fields[0]] = fields[1]
+        utils.log('Seen index loaded from %s', index_file)
+
+    def has(self, url: str) -> bool:
+        """
+        Checks if the listing of a URL was already scraped
+
+        Parameters
+        ----------
+        url : str
+            URL of the listing, or its key
+
+        Returns
+        -------
+        True if the listing was scraped
+        """
+        key = self.__get_key(url)
+        if key is None:
+            return False
+        with self.__lock:
+            return key in self.__keys
+
+    def get_summary(self, url: str) -> str:
+        """
+        Gets the summary of a listing when it was last scraped
+
+        Parameters
+        ----------
+        url : str
+            URL of the listing, or its key
+
+        Returns
+        -------
+        The summary, as given by summarize(). None if unknown, or if the index is a Bloom filter
+        """
+        key = self.__get_key(url)
+        if key is None or self.__summaries is None:
+            return None
+        with self.__lock:
+            return self.__summaries.get(key)
+
+    def add(self, urls: list, summaries: list = None):
+        """
+        Records the listings of the URLs as scraped
+
+        Parameters
+        ----------
+        urls : list
+            URLs of the listings, or their keys
+        summaries : list, opt
+            Summary of each listing, as given by summarize()
+        """
+        entries = zip([self.__get_key(url) for url in urls], summaries or [None] * len(urls))
+        with self.__lock:
+            entries = [(key, summary) for key, summary in entries if key is not None and
+                       (key not in self.__keys or (summary is not None and self.__summaries is not None
+                                                   and self.__summaries.get(key) != summary))]
+            self.__write(entries)
+
+    def touch(self, urls: list):
+        """
+        Records the listings of the URLs as seen, unchanged, with the current time
+
+        Parameters
+        ----------
+        urls : list
+            URLs of the listings, or their keys
+        """
+        keys = [self.__get_key(url) for url in urls]
+        with self.__lock:
+            self.__write([(key, self.__summaries.get(key) if self.__summaries is not None else None)
+                          for key in keys if key is not None])
+
+    def close(self):
+        """
+        Compacts the index file to a line per listing, the last one written: every
+        add() and touch() appends a line while crawling
+        """
+        with self.__lock:
+            entries = dict()
+            lines = 0
+            with open(self.index_file, 'rb') as file:
+                for line in file:
+                    lines += 1
+                    key = line.split(b'\t', 1)[0].strip()
+                    if key:
+                        entries[key] = line if line.endswith(b'\n') else line + b'\n'
+                size = file.tell()
+            if lines == len(entries):
+                return
+            tmp_file = f'{self.index_file}.tmp'
+            try:
+                with open(tmp_file, 'wb') as file:
+                    file.writelines(entries.values())
+                    # keeps the lines appended meanwhile by the other scraper's process
+                    with open(self.index_file, 'rb') as index:
+                        index.seek(size)
+                        file.write(index.read())
+                os.replace(tmp_file, self.index_file)
+                utils.log('Seen index compacted from %s to %s lines', lines, len(entries))
+            except OSError as e:
+                utils.warn('Could not compact the seen index: %s', e)
+
+    def __write(self, entries: list):
+        """
+        Adds the (key, summary) entries to the index and appends them to the index file,
+        with the current time. Must be called holding the lock
+        """
+        if not entries:
+            return
+        now = int(time())
+        with open(self.index_file, 'a', encoding='utf-8') as file:
+            for key, summary in entries:
+                self.__keys.add(key)
+                if summary is not None and self.__summaries is not None:
+                    self.__summaries[key] = summary
+                file.write(f'{key}\t{summary or ""}\t{now}\n')
+
+    def __get_key(self, url: str) -> str:
+        """
+        Gets the key of a URL, or the key itself if it already is one
+        """
+        return url if '://' not in url else canonicalize(url)
+
+    def __bootstrap(self):
+        """
+        Creates the index file with the listings of the datasets already scraped: the
+        idealista and fotocasa ones, and the fotocasa ones of each location not merged yet.
+        The merged dataset is not read, its ids do not tell the site of each listing
+        """
+        summaries = dict()
+        # the dataset of each site, and the fotocasa ones of each location not merged yet
+        sources = [(config.IDEALISTA_ID, config.IDEALISTA_FILE), (config.FOTOCASA_ID, config.FOTOCASA_FILE)] + \
+            [(config.FOTOCASA_ID, csv_file)
+             for csv_file in utils.get_files_in_directory(config.DATASET_DIR, extension='.csv')
+             if csv_file.startswith(f'{config.FOTOCASA_FILE}-')]
+        for site, csv_file in sources:
+            if not utils.file_exists(csv_file):
+                continue
+            try:
+                df = pd.read_csv(csv_file, dtype=str, usecols=lambda column: column in
+                                 ('id', 'price', 'rooms', 'm2'))
+                for row in df.dropna(subset=['id']).itertuples(index=False):
+                    if row.id.isdigit():
+                        summaries[f'{site}:{row.id}'] = summarize(getattr(row, 'price', None),
+                                                                  getattr(row, 'rooms', None),
+                                                                  getattr(row, 'm2', None))
+            except (ValueError, KeyError, pd.errors.ParserError) as e:
+                utils.warn('Could not read the listings of %s: %s', csv_file, e)
+
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        with open(self.index_file, 'w', encoding='utf-8') as file:
+            for key in sorted(summaries):
+                file.write(f'{key}\t{summaries[key]}\t\n')
+        utils.log('Seen index bootstrapped with %s listings', len(summaries))
+
+
+__index = None
+__index_lock = threading.Lock()
+
+
+def get_index() -> SeenIndex:
+    """
+    Gets the seen index shared by all the scrapers, loading it the first time
+
+    Returns
+    -------
+    The shared SeenIndex
+    """
+    global __index
+    with __index_lock:
+        if __index is None:
+            __index = SeenIndex()
+            atexit.register(__index.close)
+    return __index
+
+
+def shutdown():
+    """
+    Compacts the index file of the shared seen index, if it was ever loaded
+    """
+    global __index
+    with __index_lock:
+        index, __index = __index, None
+    if index is not None:
+        atexit.unregister(index.close)
+        index.close()
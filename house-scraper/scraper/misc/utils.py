@@ -3,18 +3,19 @@ Miscellaneous utilities; including file utilities,
 selenium driver utilities, logging utilities and
 internet utilities
 """
+import json
 import logging
 import os
 import shutil
 import uuid
-from random import randint, random, uniform
-from time import sleep
+from random import random, uniform
+from time import sleep, time
 
 import requests
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 
-from . import config, network
+from . import config, metrics, network, proxy_pool
 
 # =========================================================
 # FILE UTILITIES
@@ -32,7 +33,7 @@ def delete_directory(dir_name: str):
     """
     if os.path.exists(dir_name) and os.path.isdir(dir_name):
         shutil.rmtree(dir_name)
-        log(f'{dir_name} has been deleted')
+        log('%s has been deleted', dir_name)
 
 
 def create_directory(dir_name: str):
@@ -46,7 +47,7 @@ def create_directory(dir_name: str):
     """
     delete_directory(dir_name)
     os.mkdir(dir_name)
-    log(f'{dir_name} has been created')
+    log('%s has been created', dir_name)
 
 
 def create_file(dir: str, file_name: str):
@@ -64,7 +65,7 @@ def create_file(dir: str, file_name: str):
     -------
     File handler ready to be written into
     """
-    log(f'{os.path.join(dir, file_name)} created')
+    log('%s created', os.path.join(dir, file_name))
     return open(os.path.join(dir, file_name), 'w+', encoding='UTF8')
 
 
@@ -80,7 +81,87 @@ def duplicate_folder(dir: str, dest: str):
         Absolute folder path in which to paste the folder
     """
     shutil.copytree(dir, dest, dirs_exist_ok=True)
-    log(f'{dir} has been copy-pasted to {dest}')
+    log('%s has been copy-pasted to %s', dir, dest)
+
+
+def link_folder(dir: str, dest: str) -> int:
+    """
+    Makes the files of a folder appear in dest without copying them: hardlinks them if
+    the file system allows it and, otherwise, maps them in the manifest of dest
+    (config.FOLDER_MANIFEST, relative path in dest -> absolute source path)
+
+    Parameters
+    ----------
+    dir : str
+        Absolute folder path to link
+    dest : str
+        Absolute folder path in which to make the files appear
+
+    Returns
+    -------
+    Number of files mapped in the manifest instead of hardlinked
+    """
+    manifest_file = os.path.join(dest, config.FOLDER_MANIFEST)
+    manifest = dict()
+    if file_exists(manifest_file):
+        with open(manifest_file, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+
+    linked = 0
+    mapped = 0
+    for folder_name, _, files in os.walk(dir):
+        for file in files:
+            if file == config.FOLDER_MANIFEST:
+                continue
+            src_file = os.path.join(folder_name, file)
+            rel_file = os.path.relpath(src_file, dir).replace(os.sep, '/')
+            dest_file = os.path.join(dest, rel_file)
+            os.makedirs(os.path.dirname(dest_file), exist_ok=True)
+            if os.path.lexists(dest_file):
+                if os.path.samefile(src_file, dest_file):
+                    continue
+                os.remove(dest_file)
+            try:
+                os.link(src_file, dest_file)
+                manifest.pop(rel_file, None)
+                linked += 1
+            except OSError:
+                manifest[rel_file] = os.path.abspath(src_file)
+                mapped += 1
+
+    if manifest or file_exists(manifest_file):
+        os.makedirs(dest, exist_ok=True)
+        with open(manifest_file, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2)
+    log('%s has been linked to %s: %s hardlinks, %s in the manifest', dir, dest, linked, mapped)
+    return mapped
+
+
+def resolve_folder(dir: str) -> dict:
+    """
+    Gets the files of a folder, including the ones mapped in its manifest by link_folder()
+
+    Parameters
+    ----------
+    dir : str
+        Absolute folder path
+
+    Returns
+    -------
+    Dictionary with the relative path of each file in the folder and its absolute path
+    """
+    files = dict()
+    manifest_file = os.path.join(dir, config.FOLDER_MANIFEST)
+    if file_exists(manifest_file):
+        with open(manifest_file, 'r', encoding='utf-8') as file:
+            files.update(json.load(file))
+    for folder_name, _, names in os.walk(dir):
+        for name in names:
+            file_name = os.path.join(folder_name, name)
+            if file_name != manifest_file:
+                files[os.path.relpath(file_name, dir).replace(
+                    os.sep, '/')] = file_name
+    return files
 
 
 def directory_exists(dir_name: str) -> bool:
@@ -150,7 +231,7 @@ def get_files_in_directory(dir_name: str, extension: str = '') -> list:
     -------
     List of files ending in extension contained in dir_name
     """
-    log(f'Getting files ending with "{extension}" in {dir_name}')
+    log('Getting files ending with "%s" in %s', extension, dir_name)
     if directory_exists(dir_name):
         return [os.path.join(dir_name, file) for file in os.listdir(dir_name)
                 if os.path.isfile(os.path.join(dir_name, file))
@@ -163,30 +244,70 @@ def get_files_in_directory(dir_name: str, extension: str = '') -> list:
 # INTERNET CAPABILITIES
 # =========================================================
 
-def get_http_code(url: str) -> int:
+def get_http_session(fingerprint: dict = None, cookies: list = None,
+                     use_proxy: bool = False) -> requests.Session:
     """
-    Gets the HTTP status code returned by querying a url
+    Creates an HTTP session pinned to a browser fingerprint for its whole lifetime.
+    Given the fingerprint and cookies of a driver, it looks like the driver's session
 
     Parameters
     ----------
+    fingerprint : dict, opt
+        Fingerprint of the session. A random one from the pool by default
+    cookies : list, opt
+        Cookies of the session, as returned by a selenium driver's get_cookies()
+    use_proxy : bool, opt
+        Flag to go through one of the fastest healthy proxies. False by default
+
+    Returns
+    -------
+    A requests session. The proxy it goes through is available as session.proxy
+    """
+    session = requests.Session()
+    session.proxy = proxy_pool.get_pool().best() if use_proxy else None
+    if session.proxy:
+        session.proxies.update(proxy_pool.get_requests_proxies(session.proxy))
+    session.headers.update(
+        (fingerprint if fingerprint else network.get_fingerprint())['headers'])
+    for cookie in cookies or []:
+        session.cookies.set(cookie['name'], cookie['value'],
+                            domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    return session
+
+
+def fetch_page(session: requests.Session, url: str) -> tuple:
+    """
+    Downloads a page over plain HTTP, without a browser
+
+    Parameters
+    ----------
+    session : requests.Session
+        HTTP session to download the page with
     url : str
-        URL to check
+        URL to download
 
     Returns
     -------
-    Status code of the response
+    The status code, the final URL (after redirections) and the HTML of the page.
+    The status code is None if the page could not be reached
     """
+    start = time()
     try:
-        r_headers = {'User-Agent': network.get_user_agent()}
-        r = requests.get(url, headers=r_headers)
-        return r.status_code
-    except (requests.HTTPError, requests.ConnectionError) as e:
-        error(f'Error trying to get status code for {url}: {e.msg}')
+        r = session.get(url, timeout=30)
+        if getattr(session, 'proxy', None):
+            proxy_pool.get_pool().report(session.proxy, True, time() - start)
+        return r.status_code, r.url, r.text
+    except requests.RequestException as e:
+        if getattr(session, 'proxy', None):
+            proxy_pool.get_pool().report(session.proxy, False)
+        warn('Error trying to fetch %s: %s', url, e)
+        return None, url, ''
 
 
-def download_image(url: str, img_file: str):
+def download_image(url: str, img_file: str, session: requests.Session = None) -> int:
     """
-    Downloads the image given in a url and saves it to img_file
+    Downloads the image given in a url and saves it to img_file. The image is
+    streamed to disk in chunks and only appears in img_file once complete
 
     Parameters
     ----------
@@ -194,25 +315,43 @@ def download_image(url: str, img_file: str):
         URL to check
     img_file : str
         Absolute path to the file the image is going to be saved at 
+    session : requests.Session, opt
+        HTTP session to reuse its pooled connections. A new one by default
+
+    Returns
+    -------
+    The number of bytes downloaded, None if the download failed
     """
     try:
-        r_headers = {'User-Agent': network.get_user_agent()}
-        r = requests.get(url, headers=r_headers)
-        r.raise_for_status()
-        with open(img_file, 'wb') as handler:
-            handler.write(r.content)
-    except Exception as e:
-        warn(f'Error {r.status_code} trying to download image from {url}')
+        if session is None:
+            session = get_http_session()
+        with session.get(url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            size = 0
+            with open(img_file + '.part', 'wb') as handler:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    handler.write(chunk)
+                    size += len(chunk)
+        os.replace(img_file + '.part', img_file)
+        return size
+    except (requests.RequestException, OSError) as e:
+        warn('Error trying to download image from %s: %s', url, e)
+        return None
 
 
 # =========================================================
 # SELENIUM UTILITIES
 # =========================================================
 
-def set_human_options() -> Options:
+def set_human_options(fingerprint: dict) -> Options:
     """
     Create the options for the selenium web driver. Makes it look like a human
 
+    Parameters
+    ----------
+    fingerprint : dict
+        Fingerprint (user agent, viewport) the driver is pinned to
+
     Returns
     -------
     An Options object for the driver
@@ -233,24 +372,32 @@ def set_human_options() -> Options:
     options.add_argument(f'user-data-dir={session}')
     options.add_argument('no-sandbox')
     options.add_argument('--disable-gpu')
-    options.add_argument('--window-size=1920,1080')
+    options.add_argument(f'--user-agent={fingerprint["user_agent"]}')
+    options.add_argument(
+        f'--window-size={fingerprint["viewport"][0]},{fingerprint["viewport"][1]}')
+    options.add_argument('--lang=es-ES')
     options.add_argument('--disk-cache-size=0')
     options.add_argument('--disable-application-cache')
+    # network events, to know the status of the pages the browser receives
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
     return options
 
 
 def proxify():
     """
-    Configures a proxy for a selenium web driver
+    Configures one of the fastest healthy proxies for a selenium web driver
 
     Returns
     -------
-    The desired capabilities of the selenium driver
+    The desired capabilities of the selenium driver. Without proxy if there is
+    no healthy proxy
     """
-    available_proxies = network.get_proxies()
-    selected = available_proxies[randint(0, len(available_proxies)-1)]
+    capabilities = webdriver.DesiredCapabilities.CHROME.copy()
+    selected = proxy_pool.get_pool().best()
+    if selected is None:
+        warn('Creating the driver without proxy')
+        return capabilities
 
-    capabilities = webdriver.DesiredCapabilities.CHROME
     capabilities['marionette'] = True
     capabilities['proxy'] = {
         'proxyType': 'MANUAL',
@@ -258,13 +405,14 @@ def proxify():
         'ftpProxy': f'{selected["ip"]}:{selected["port"]}',
         'sslProxy': f'{selected["ip"]}:{selected["port"]}'
     }
-    log(f'Setting the driver`s proxy to {selected["ip"]}:{selected["port"]}')
+    log('Setting the driver`s proxy to %s:%s', selected["ip"], selected["port"])
     return capabilities
 
 
 def get_selenium(use_proxy: bool = False):
     """
-    Creates a new selenium web driver that looks like a human
+    Creates a new selenium web driver that looks like a human. The driver is pinned
+    to a chrome fingerprint for its lifetime, available as driver.fingerprint
 
     Parameters
     ----------
@@ -276,13 +424,49 @@ def get_selenium(use_proxy: bool = False):
     A selenium driver
     """
     log('Creating new driver')
+    fingerprint = network.get_fingerprint('Blink')
     driver_path = os.path.join(config.ROOT_DIR, 'chromedriver.exe')
-    driver = webdriver.Chrome(executable_path=driver_path, options=set_human_options(),
+    driver = webdriver.Chrome(executable_path=driver_path, options=set_human_options(fingerprint),
                               desired_capabilities=proxify() if use_proxy else webdriver.DesiredCapabilities.CHROME)
     driver.implicitly_wait(15)
+    driver.fingerprint = fingerprint
     return driver
 
 
+def get_browser_response(driver) -> tuple:
+    """
+    Gets the status code and headers of the last main document the browser received
+    since the log was last read, from its performance log. No request is made. Reading
+    the log empties it
+
+    Parameters
+    ----------
+    driver
+        Selenium driver
+
+    Returns
+    -------
+    The status code and a dictionary with the headers. None and an empty dictionary
+    if the browser has not received any document since the log was last read
+    """
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        warn('Error reading the browser performance log: %s', e)
+        entries = []
+
+    response = (None, dict())
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        params = message.get('params', {})
+        if message.get('method') == 'Page.frameNavigated' and not params['frame'].get('parentId'):
+            driver.main_frame_id = params['frame']['id']
+        elif (message.get('method') == 'Network.responseReceived' and params.get('type') == 'Document'
+              and params.get('frameId') in (None, getattr(driver, 'main_frame_id', params.get('frameId')))):
+            response = (params['response']['status'], params['response'].get('headers', {}))
+    return response
+
+
 # =========================================================
 # WAITING UTILITIES
 # =========================================================
@@ -298,72 +482,88 @@ def flip_coin() -> bool:
     return random() < config.CHANCE_MEGA_WAIT
 
 
+def timed_sleep(seconds: float, kind: str):
+    """
+    Sleeps, counting the time slept in the metrics
+
+    Parameters
+    ----------
+    seconds : float
+        Seconds to sleep
+    kind : str
+        Kind of the sleep (wait, mini, mega, scroll, pacing...)
+    """
+    if seconds > 0:
+        metrics.SLEEP.inc(seconds, kind=kind)
+        sleep(seconds)
+
+
 def mega_wait():
     """
     Waits a lot of time
     """
-    sleep(uniform(config.MEGA_MIN_WAIT, config.MEGA_MAX_WAIT))
+    timed_sleep(uniform(config.MEGA_MIN_WAIT, config.MEGA_MAX_WAIT) * config.WAIT_SCALE, 'mega')
 
 
 def wait():
     """
     Waits a moderate ammount of time
     """
-    sleep(uniform(config.RANDOM_MIN_WAIT, config.RANDOM_MAX_WAIT))
+    timed_sleep(uniform(config.RANDOM_MIN_WAIT, config.RANDOM_MAX_WAIT) * config.WAIT_SCALE, 'wait')
 
 
 def mini_wait():
     """
     Waits a little bit of time
     """
-    sleep(uniform(config.RANDOM_SMALL_MIN_WAIT, config.RANDOM_SMALL_MAX_WAIT))
+    timed_sleep(uniform(config.RANDOM_SMALL_MIN_WAIT, config.RANDOM_SMALL_MAX_WAIT) * config.WAIT_SCALE, 'mini')
 
 
 def scroll_wait():
     """
     Waits a little bit of time during scroll
     """
-    sleep(config.SCROLL_WAIT)
+    timed_sleep(config.SCROLL_WAIT * config.WAIT_SCALE, 'scroll')
 
 # =========================================================
 # LOGGING UTILITIES
 # =========================================================
 
+# The utilities log messages with each correspondent priority level, without waiting
+# for them to be written. The launcher process starts the log file with logger.setup()
 
-"""
-Starts a log file. The utilities log messages in the file with each correspondent
-priority level
-"""
 
-# starts a log to file
-logging.basicConfig(filename=os.path.join(config.ROOT_DIR, 'house-scraper.log'),
-                    filemode='w', encoding='utf-8', level=logging.INFO,
-                    format='%(asctime)s | %(levelname)s | %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+def __log(level: int, msg: str, args: tuple, fields: dict):
+    """
+    Logs a message, formatted with the arguments only if it is written. The fields
+    (url, scraper...) are written as keys of the JSON line
+    """
+    logging.log(level, msg, *args, extra={'fields': fields})
 
 
-def debug(msg: str):
+def debug(msg: str, *args, **fields):
     """
     Logs an DEBUG message to the log
     """
-    logging.debug(msg)
+    __log(logging.DEBUG, msg, args, fields)
 
 
-def log(msg: str):
+def log(msg: str, *args, **fields):
     """
     Logs an INFO message to the log
     """
-    logging.info(msg)
+    __log(logging.INFO, msg, args, fields)
 
 
-def warn(msg: str):
+def warn(msg: str, *args, **fields):
     """
     Logs a WARN message to the log
     """
-    logging.warn(msg)
+    __log(logging.WARNING, msg, args, fields)
 
 
-def error(msg: str):
+def error(msg: str, *args, **fields):
     """
     Logs an ERROR message to the log
     """
-    logging.error(msg)
+    __log(logging.ERROR, msg, args, fields)
@@ -1,8 +1,10 @@
 import re
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 
 import pandas as pd
-from misc import config, utils
+from misc import (config, driver_pool, image_downloader, metrics,
+                  rate_limiter, seen_index, utils)
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
@@ -10,6 +12,28 @@ from selenium.webdriver.common.keys import Keys
 
 from .scraper_base import HouseScraper
 
+# button accepting the cookies, shown by every new browser
+COOKIES_BUTTON = '#App > div.re-SharedCmp > div > div > div > footer > div > button.sui-AtomButton.sui-AtomButton--primary.sui-AtomButton--solid.sui-AtomButton--center'
+
+
+def summarize_card(text: str) -> str:
+    """
+    Gets the summary of a house from the text of its navigation card
+
+    Parameters
+    ----------
+    text : str
+        Visible text of the card ('185.000 € ... 3 habs 2 baños 90 m² ...')
+
+    Returns
+    -------
+    The summary of the house, as given by seen_index.summarize()
+    """
+    price = re.search(r'\d[\d.]*\s*€', text)
+    rooms = re.search(r'\d+\s*hab', text)
+    m2 = re.search(r'\d+\s*m²', text)
+    return seen_index.summarize(*(match.group(0) if match else None for match in (price, rooms, m2)))
+
 
 class FotocasaScraper(HouseScraper):
 
@@ -32,18 +56,21 @@ class FotocasaScraper(HouseScraper):
         Dictionary with all the info from the house
         """
 
-        # gets conexion with Selenium driver
-        with utils.get_selenium() as driver:
+        # paces the request before leasing a driver, not to hold it while waiting
+        utils.log('[fotocasa:%s] Scraping %s', location, url, url=url)
+        rate_limiter.get_limiter().wait(url)
+
+        # leases a Selenium driver from the shared pool
+        with driver_pool.get_pool().lease() as driver:
             try:
 
                 # defines header dictionary for data
                 house = {'id': '', 'url': '', 'title': '', 'location': '',
                          'price': '', 'm2': '', 'rooms': '', 'floor': '', 'num-photos': '', 'floor-plan': '', 'view3d': '',
                          'video': '', 'home-staging': '', 'description': '', 'photo_urls': ''}
-                utils.log(f'[fotocasa:{location}] Scraping {url}')
-                utils.mini_wait()
-                driver.get(url)
-                id = re.findall('\d+', url)[0]
+                with metrics.DETAIL_FETCH.time(method='browser'):
+                    driver.get(url)
+                id = seen_index.get_listing_id(url)
 
                 # checks if download directory exists, crates it otherwise
                 download_dir = f"{config.FOTOCASA_IMG_DIR}-{location}-imgs/{id}"
@@ -51,68 +78,68 @@ class FotocasaScraper(HouseScraper):
                     utils.create_directory(download_dir)
 
                 # scrolls down the page
+                photo_list = []
                 for scroll_i in range(config.FOTOCASA_SCROLL_HOUSE_PAGE):
 
-                    # read photo data and download them
-                    photo_list = []
-                    num_img = 1
+                    # read photo data and download the ones not seen in previous scrolls
                     resultSet = driver.find_element(
                         by=By.CSS_SELECTOR, value='#App > div.re-Page > main > section')
                     image_list = resultSet.find_elements_by_tag_name("figure")
                     for image in image_list:
                         img_src = image.find_element(
                             by=By.CSS_SELECTOR, value='img').get_attribute('src')
+                        if img_src in photo_list:
+                            continue
                         photo_list.append(img_src)
-                        utils.download_image(
-                            img_src, f"{download_dir}/{num_img}.jpg")
-                        num_img = num_img + 1
+                        image_downloader.get_downloader().submit(
+                            img_src, f"{download_dir}/{len(photo_list)}.jpg", f'{self.id}:{id}')
 
                     # retrieve data from each house container
                     main_content = self.try_page(driver, lambda: driver.find_element(
                         by=By.CSS_SELECTOR, value='#App > div.re-Page > main > div.re-LayoutContainer.re-LayoutContainer--large > div.re-ContentDetail-topContainer'))
-                    house['id'] = id
-                    house['url'] = driver.current_url
-                    house['title'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > h1').text
-                    house['location'] = location
-                    house['price'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-userActionContainer > div.re-DetailHeader-priceContainer > span').text.replace(' €', '')
-                    house['description'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.fc-DetailDescriptionContainer > div.sui-MoleculeCollapsible.sui-MoleculeCollapsible--withGradient.is-collapsed > div > div > p').text.strip()
-                    house['m2'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(3) > span:nth-child(2) > span').text
-                    house['rooms'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(1) > span:nth-child(2) > span').text
-                    house['floor'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(4) > span:nth-child(2) > span').text
-                    house['baths'] = main_content.find_element(
-                        by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(2) > span:nth-child(2) > span').text
-                    house['num-photos'] = driver.find_element(
-                        by=By.CSS_SELECTOR, value='#App > div.re-Page > main > ul > li > button > span > span.sui-AtomButton-text').text.replace(" Fotos", "")
-                    house['floor-plan'] = 0
-                    house['video'] = 0
-                    house['home-staging'] = 0
+                    with metrics.EXTRACTION.time(page='house'):
+                        house['id'] = id
+                        house['url'] = driver.current_url
+                        house['title'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > h1').text
+                        house['location'] = location
+                        house['price'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-userActionContainer > div.re-DetailHeader-priceContainer > span').text.replace(' €', '')
+                        house['description'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.fc-DetailDescriptionContainer > div.sui-MoleculeCollapsible.sui-MoleculeCollapsible--withGradient.is-collapsed > div > div > p').text.strip()
+                        house['m2'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(3) > span:nth-child(2) > span').text
+                        house['rooms'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(1) > span:nth-child(2) > span').text
+                        house['floor'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(4) > span:nth-child(2) > span').text
+                        house['baths'] = main_content.find_element(
+                            by=By.CSS_SELECTOR, value='div > section:nth-child(1) > div > div.re-DetailHeader-header > div.re-DetailHeader-propertyTitleContainer > ul > li:nth-child(2) > span:nth-child(2) > span').text
+                        house['num-photos'] = driver.find_element(
+                            by=By.CSS_SELECTOR, value='#App > div.re-Page > main > ul > li > button > span > span.sui-AtomButton-text').text.replace(" Fotos", "")
+                        house['floor-plan'] = 0
+                        house['video'] = 0
+                        house['home-staging'] = 0
 
-                    try:
-                        driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > main > ul > li:nth-child(2) > button')
-                        house['view3d'] = 1
-                    except NoSuchElementException:
-                        house['view3d'] = 0
+                        try:
+                            driver.find_element(
+                                by=By.CSS_SELECTOR, value='#App > div.re-Page > main > ul > li:nth-child(2) > button')
+                            house['view3d'] = 1
+                        except NoSuchElementException:
+                            house['view3d'] = 0
 
-                    house['photo_urls'] = photo_list
+                        house['photo_urls'] = photo_list
 
                     # scrolls down action and waits
                     ActionChains(driver).key_down(
                         Keys.PAGE_DOWN).key_up(Keys.PAGE_DOWN).perform()
                     utils.mini_wait()
 
-                utils.mini_wait()
                 return house
 
             except NoSuchElementException as e:
-                utils.error(f'[{self.id}] Something happened!')
-                utils.error(f'Exception: {e.msg}')
+                utils.error('[%s] Something happened!', self.id)
+                utils.error('Exception: %s', e.msg)
                 return None
 
     def _scrape_houses_details(self, location, houses_list) -> list:
@@ -134,18 +161,12 @@ class FotocasaScraper(HouseScraper):
         houses = list()
         with ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
             futures = []
-            max_houses_before_wait = 5
-            house_number = 0
             # for url, location in self.__urls.items()
             for house_url in houses_list:
 
-                # creates threads to process each URL house
+                # creates threads to process each URL house; the rate limiter paces them
                 futures.append(executor.submit(
                     self._scrape_house_page, location, house_url))
-                house_number = house_number + 1
-                if house_number >= max_houses_before_wait:
-                    house_number = 0
-                    utils.mega_wait()
 
             # Once all houses were processed, the list with data is created
             for future in as_completed(futures):
@@ -156,7 +177,8 @@ class FotocasaScraper(HouseScraper):
 
     def try_page(self, driver, fn):
         """
-        Tries to access the element provided in fn (find_element() usually)
+        Tries to access the element provided in fn (find_element() usually). Reports
+        to the rate limiter if the site let it through or pushed back
 
         Parameters
         ----------
@@ -169,7 +191,9 @@ class FotocasaScraper(HouseScraper):
         -------
         The result of executing fn() and if the request was successful
         """
+        limiter = rate_limiter.get_limiter()
         madeit = False
+        pushed_back = False
         while not madeit:
             try:
                 result = fn()
@@ -177,209 +201,386 @@ class FotocasaScraper(HouseScraper):
 
             except NoSuchElementException:
                 utils.error(NoSuchElementException)
+                pushed_back = True
+                limiter.blocked(driver.current_url)
+                metrics.RETRIES.inc(reason='blocked')
+                limiter.wait(driver.current_url)
                 madeit = False
+        if not pushed_back:
+            limiter.success(driver.current_url)
         return result
 
-    def _scrape_navigation(self, url: str, location: str) -> list:
+    def _card_summary(self, article) -> str:
         """
-        Scrapes the navigation pages for a location (given in the starting url).
+        Gets the summary the navigation card shows of a house. The text of the card is
+        read at once: looking for elements that are not there costs the implicit wait
 
         Parameters
         ----------
-        url : str
-            URL to start the scraping
-
-        location : str
-            literal name of the location to scrape
+        article
+            Card of the house in the navigation page
 
         Returns
         -------
-            List of the URL of the houses that are present in the navigation pages to scrape one by one
+        The summary of the house, as given by seen_index.summarize()
         """
+        return summarize_card(article.text)
 
-        # checks if download directory exists
-        download_dir = f"{config.FOTOCASA_IMG_DIR}-{location}-imgs"
-        if utils.directory_exists(download_dir) == False:
-            utils.create_directory(download_dir)
+    def _enqueue(self, houses_to_visit: list, url: str, location: str, article=None):
+        """
+        Adds a house URL to visit, unless the listing is already in the list or was
+        scraped in a previous run (and no refresh was requested). In incremental mode,
+        the listings scraped whose card changed are visited again
 
-        # gets url conexion using Selenium
-        driver = utils.get_selenium()
-        driver.get(url)
+        Parameters
+        ----------
+        houses_to_visit : list
+            List of the URL of the houses to scrape
+        url : str
+            URL of the house
+        location : str
+            literal name of the location of the house
+        article : opt
+            Card of the house in the navigation page
+        """
+        key = seen_index.canonicalize(url) or url
+        if key in self.__urls:
+            return
+        # the card is only looked at once, even if it is read again while scrolling
+        self.__urls[key] = location
+        seen = seen_index.get_index()
+        if not self.refresh and seen.has(key):
+            if not self.incremental or article is None:
+                return
+            if seen.get_summary(key) == self._card_summary(article):
+                seen.touch([key])
+                return
+        houses_to_visit.append(url)
+
+    def _read_navigation_page(self, driver, location: str, num_page: int, houses_to_visit: list) -> list:
+        """
+        Scrolls down the navigation page loaded in the driver and reads the URLs of its houses
 
-        # accepts cookies
-        acc = driver.find_element(
-            by=By.CSS_SELECTOR, value='#App > div.re-SharedCmp > div > div > div > footer > div > button.sui-AtomButton.sui-AtomButton--primary.sui-AtomButton--solid.sui-AtomButton--center')
-        utils.mini_wait()
-        acc.click()
+        Parameters
+        ----------
+        driver
+            Selenium driver, with the navigation page loaded
+        location : str
+            literal name of the location to scrape
+        num_page : int
+            Number of the navigation page; the first pages show bigger cards
+        houses_to_visit : list
+            List of the URL of the houses to scrape, to add the new ones to
 
-        # creates a list and stores each URL's house while scrolling down
-        houses_to_visit = []
-        last_page = False
-        num_page = 0
-        while last_page == False:
-            num_page = num_page + 1
-            utils.log(f"fotocasa - current page {num_page}")
+        Returns
+        -------
+            List of the URL of the houses to scrape, with the ones of the page
+        """
+        # evaluates location to take into account the tags including href
+        if location == 'villaverde':
+
+            # scrolls down and reads each house
+            for scroll_i in range(config.FOTOCASA_SCROLL_LOCATION_PAGE):
+                ActionChains(driver).key_down(
+                    Keys.PAGE_DOWN).key_up(Keys.PAGE_DOWN).perform()
+                utils.scroll_wait()
+
+                # evaluates the page number and reads the container to get house's urls
+                if num_page == 1:
+                    main_content = driver.find_element(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
+                    try:
+                        articles = main_content.find_elements(
+                            by=By.CSS_SELECTOR, value='article.re-CardPackPremium')
+                    except Exception as e:
+                        articles = main_content.find_elements(
+                            by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
 
-            # evaluates location to take into account the tags including href
-            if location == 'villaverde':
+                    for article in articles:
+                        # gets each article url
+                        try:
+                            house_urls = article.find_element(
+                                by=By.CSS_SELECTOR, value='a.re-CardPackPremium-carousel').get_attribute('href')
+                            self._enqueue(houses_to_visit, house_urls, location, article)
+                        except Exception as e:
+                            utils.error(e)
 
-                # scrolls down and reads each house
-                for scroll_i in range(config.FOTOCASA_SCROLL_LOCATION_PAGE):
-                    ActionChains(driver).key_down(
-                        Keys.PAGE_DOWN).key_up(Keys.PAGE_DOWN).perform()
-                    utils.scroll_wait()
+                elif num_page == 2:
+                    main_content = driver.find_element(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
+                    articles = main_content.find_elements(
+                        by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
 
-                    # evaluates the page number and reads the container to get house's urls
-                    if num_page == 1:
-                        main_content = driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
+                    for article in articles:
                         try:
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackPremium')
+                            house_urls = article.find_element(
+                                by=By.CSS_SELECTOR, value='a.re-CardPackAdvance-slider').get_attribute('href')
+                            self._enqueue(houses_to_visit, house_urls, location, article)
                         except Exception as e:
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
-
-                        for article in articles:
-                            # gets each article url
-                            try:
-                                house_urls = article.find_element(
-                                    by=By.CSS_SELECTOR, value='a.re-CardPackPremium-carousel').get_attribute('href')
-                                houses_to_visit.append(house_urls)
-                                self.__urls.update(
-                                    dict.fromkeys(house_urls, location))
-                            except Exception as e:
-                                utils.error(e)
+                            utils.error(e)
 
-                    elif num_page == 2:
+                else:
+                    try:
                         main_content = driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
+                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
                         articles = main_content.find_elements(
-                            by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
+                            by=By.CSS_SELECTOR, value='article.re-CardPackMinimal')
 
                         for article in articles:
                             try:
                                 house_urls = article.find_element(
-                                    by=By.CSS_SELECTOR, value='a.re-CardPackAdvance-slider').get_attribute('href')
-                                houses_to_visit.append(house_urls)
-                                self.__urls.update(
-                                    dict.fromkeys(house_urls, location))
+                                    by=By.CSS_SELECTOR, value='a.re-CardPackMinimal-slider').get_attribute('href')
+                                self._enqueue(houses_to_visit, house_urls, location, article)
                             except Exception as e:
                                 utils.error(e)
+                    except Exception as e:
+                        utils.log(e)
 
-                    else:
-                        try:
-                            main_content = driver.find_element(
-                                by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackMinimal')
-
-                            for article in articles:
-                                try:
-                                    house_urls = article.find_element(
-                                        by=By.CSS_SELECTOR, value='a.re-CardPackMinimal-slider').get_attribute('href')
-                                    houses_to_visit.append(house_urls)
-                                    self.__urls.update(
-                                        dict.fromkeys(house_urls, location))
-                                except Exception as e:
-                                    utils.error(e)
-                        except Exception as e:
-                            utils.log(e)
+        # evaluates location to take into account the tags including href
+        elif location == 'barrio-de-salamanca':
 
-            # evaluates location to take into account the tags including href
-            elif location == 'barrio-de-salamanca':
+            for scroll_i in range(config.FOTOCASA_SCROLL_LOCATION_PAGE):
+                ActionChains(driver).key_down(
+                    Keys.PAGE_DOWN).key_up(Keys.PAGE_DOWN).perform()
+                utils.scroll_wait()
 
-                for scroll_i in range(config.FOTOCASA_SCROLL_LOCATION_PAGE):
-                    ActionChains(driver).key_down(
-                        Keys.PAGE_DOWN).key_up(Keys.PAGE_DOWN).perform()
-                    utils.scroll_wait()
+                if num_page == 1 or num_page == 2 or num_page == 3:
+                    main_content = driver.find_element(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
 
-                    if num_page == 1 or num_page == 2 or num_page == 3:
-                        main_content = driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage > main > div > div.re-SearchResult-wrapper > section')
+                    try:
+                        articles = main_content.find_elements(
+                            by=By.CSS_SELECTOR, value='article.re-CardPackPremium')
+                    except Exception as e:
+                        utils.error(e)
 
+                    for article in articles:
+                        # get each article url
                         try:
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackPremium')
+                            house_urls = article.find_element(
+                                by=By.CSS_SELECTOR, value='a.re-CardPackPremium-carousel').get_attribute('href')
+                            self._enqueue(houses_to_visit, house_urls, location, article)
                         except Exception as e:
                             utils.error(e)
 
-                        for article in articles:
-                            # get each article url
-                            try:
-                                house_urls = article.find_element(
-                                    by=By.CSS_SELECTOR, value='a.re-CardPackPremium-carousel').get_attribute('href')
-                                houses_to_visit.append(house_urls)
-                                self.__urls.update(
-                                    dict.fromkeys(house_urls, location))
-                            except Exception as e:
-                                utils.error(e)
+                elif num_page == 4:
+                    main_content = driver.find_element(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
 
-                    elif num_page == 4:
-                        main_content = driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
+                    try:
+                        articles = main_content.find_elements(
+                            by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
+                    except Exception as e:
+                        utils.error(e)
 
+                    for article in articles:
+                        # get each article url
                         try:
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackAdvance')
+                            house_urls = article.find_element(
+                                by=By.CSS_SELECTOR, value='a.re-CardPackAdvance-slider').get_attribute('href')
+                            self._enqueue(houses_to_visit, house_urls, location, article)
                         except Exception as e:
                             utils.error(e)
 
-                        for article in articles:
-                            # get each article url
-                            try:
-                                house_urls = article.find_element(
-                                    by=By.CSS_SELECTOR, value='a.re-CardPackAdvance-slider').get_attribute('href')
-                                houses_to_visit.append(house_urls)
-                                self.__urls.update(
-                                    dict.fromkeys(house_urls, location))
-                            except Exception as e:
-                                utils.error(e)
+                else:
+                    main_content = driver.find_element(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
 
-                    else:
-                        main_content = driver.find_element(
-                            by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-SearchResult-wrapper > section')
+                    try:
+                        articles = main_content.find_elements(
+                            by=By.CSS_SELECTOR, value='article.re-CardPackMinimal')
+                    except Exception as e:
+                        utils.error(e)
 
+                    for article in articles:
+                        # get each article url
                         try:
-                            articles = main_content.find_elements(
-                                by=By.CSS_SELECTOR, value='article.re-CardPackMinimal')
+                            house_urls = article.find_element(
+                                by=By.CSS_SELECTOR, value='a.re-CardPackMinimal-slider').get_attribute('href')
+                            self._enqueue(houses_to_visit, house_urls, location, article)
                         except Exception as e:
                             utils.error(e)
 
-                        for article in articles:
-                            # get each article url
-                            try:
-                                house_urls = article.find_element(
-                                    by=By.CSS_SELECTOR, value='a.re-CardPackMinimal-slider').get_attribute('href')
-                                houses_to_visit.append(house_urls)
-                                self.__urls.update(
-                                    dict.fromkeys(house_urls, location))
-                            except Exception as e:
-                                utils.error(e)
+            # delete duplicates houses
+            houses_set = set(houses_to_visit)
+            houses_to_visit = list(houses_set)
 
-                # delete duplicates houses
-                houses_set = set(houses_to_visit)
-                houses_to_visit = list(houses_set)
+        return houses_to_visit
 
-            # when finishes, checks next page
-            try:
+    def _get_result_count(self, driver) -> int:
+        """
+        Gets the number of houses of the search, shown in the title of the navigation page
+
+        Parameters
+        ----------
+        driver
+            Selenium driver, with the navigation page loaded
+
+        Returns
+        -------
+            The number of houses, None if the title does not show it
+        """
+        titles = driver.find_elements(by=By.CSS_SELECTOR, value='h1')
+        match = re.search(r'\d[\d.]*', titles[0].text) if titles else None
+        return int(match.group(0).replace('.', '')) if match else None
+
+    def _get_page_urls(self, url: str, pages: int) -> list:
+        """
+        Builds the URLs of the navigation pages of a search, following the pattern
+        of the site (.../l/N), without loading them
+
+        Parameters
+        ----------
+        url : str
+            URL of any navigation page of the search
+        pages : int
+            Number of navigation pages
+
+        Returns
+        -------
+            List with the URLs of the pages after the first one
+        """
+        parts = urlparse(url)
+        path = re.sub(r'/l(/\d+)?/?$', '/l', parts.path)
+        return [parts._replace(path=f'{path}/{page}').geturl() for page in range(2, pages + 1)]
+
+    def _scrape_navigation_page(self, url: str, location: str, num_page: int) -> list:
+        """
+        Leases a Selenium driver and reads the URLs of the houses of a navigation page
+
+        Parameters
+        ----------
+        url : str
+            URL of the navigation page
+        location : str
+            literal name of the location to scrape
+        num_page : int
+            Number of the navigation page
+
+        Returns
+        -------
+            List of the URL of the houses of the page to scrape
+        """
+        utils.log('[fotocasa:%s] Reading page %s', location, num_page, url=url)
+        try:
+            rate_limiter.get_limiter().wait(url)
+            with driver_pool.get_pool().lease() as driver:
+                with metrics.NAVIGATION_FETCH.time():
+                    driver.get(url)
+                # a pooled driver keeps the cookies accepted: looking for the button costs the implicit wait
+                if not getattr(driver, 'cookies_accepted', False):
+                    for button in driver.find_elements(by=By.CSS_SELECTOR, value=COOKIES_BUTTON):
+                        button.click()
+                    driver.cookies_accepted = True
+                return self._read_navigation_page(driver, location, num_page, list())
+        except Exception as e:
+            utils.error('[fotocasa:%s] Could not read %s: %s', location, url, e, url=url)
+            return list()
+
+    def _scrape_navigation_pages(self, url: str, location: str, pages: int, houses_to_visit: list) -> list:
+        """
+        Reads the navigation pages after the first one all at once, with several threads
+
+        Parameters
+        ----------
+        url : str
+            URL of the first navigation page
+        location : str
+            literal name of the location to scrape
+        pages : int
+            Number of navigation pages
+        houses_to_visit : list
+            List of the URL of the houses of the first page to scrape
+
+        Returns
+        -------
+            List of the URL of the houses of every page to scrape
+        """
+        page_urls = self._get_page_urls(url, pages)
+        utils.log('[fotocasa:%s] Reading %s more pages in parallel', location, len(page_urls))
+        with ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
+            futures = [executor.submit(self._scrape_navigation_page, page_url, location, num_page)
+                       for num_page, page_url in enumerate(page_urls, start=2)]
+            for future in as_completed(futures):
+                houses_to_visit.extend(future.result())
+        # delete duplicated houses, keeping their order
+        return list(dict.fromkeys(houses_to_visit))
+
+    def _scrape_navigation(self, url: str, location: str) -> list:
+        """
+        Scrapes the navigation pages for a location (given in the starting url).
+
+        Parameters
+        ----------
+        url : str
+            URL to start the scraping
+
+        location : str
+            literal name of the location to scrape
+
+        Returns
+        -------
+            List of the URL of the houses that are present in the navigation pages to scrape one by one
+        """
+
+        # checks if download directory exists
+        download_dir = f"{config.FOTOCASA_IMG_DIR}-{location}-imgs"
+        if utils.directory_exists(download_dir) == False:
+            utils.create_directory(download_dir)
+
+        # paces the first page before leasing a driver, not to hold it while waiting
+        rate_limiter.get_limiter().wait(url)
+        houses_to_visit = []
+        pages = None
+        with driver_pool.get_pool().lease() as driver:
+            with metrics.NAVIGATION_FETCH.time():
+                driver.get(url)
+
+            # accepts cookies, unless the pooled driver already did
+            if not getattr(driver, 'cookies_accepted', False):
+                acc = driver.find_element(by=By.CSS_SELECTOR, value=COOKIES_BUTTON)
                 utils.mini_wait()
-                items = driver.find_elements(
-                    by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-Pagination > ul > li.sui-MoleculePagination-item')
-                for item in items:
-                    url_next = item.find_element(by=By.CSS_SELECTOR, value='a')
-                driver.get(url_next.get_attribute('href'))
-            except Exception as e:
-                utils.log(e)
-                last_page = True
-
-            # controls the maximun pages to process
-            if config.FOTOCASA_NUM_PAGES_TO_READ == num_page:
-                last_page = True
-
-        utils.mini_wait()
-        driver.quit()
-        utils.log(f"Num of houses_to_visit: {len(houses_to_visit)}")
+                acc.click()
+                driver.cookies_accepted = True
+
+            # creates a list and stores each URL's house while scrolling down
+            last_page = False
+            num_page = 0
+            while last_page == False:
+                num_page = num_page + 1
+                utils.log('fotocasa - current page %s', num_page)
+
+                houses_to_visit = self._read_navigation_page(driver, location, num_page, houses_to_visit)
+
+                # with the number of houses, the rest of the pages are read in parallel
+                if config.FOTOCASA_PAGINATION_SYNTHESIS and num_page == 1:
+                    results = self._get_result_count(driver)
+                    if results is not None:
+                        pages = min(-(-results // config.FOTOCASA_RESULTS_PER_PAGE),
+                                    config.FOTOCASA_NUM_PAGES_TO_READ)
+                        break
+
+                # when finishes, checks next page
+                try:
+                    items = driver.find_elements(
+                        by=By.CSS_SELECTOR, value='#App > div.re-Page > div.re-SearchPage.re-SearchPage--withMap > main > div > div.re-Pagination > ul > li.sui-MoleculePagination-item')
+                    for item in items:
+                        url_next = item.find_element(by=By.CSS_SELECTOR, value='a')
+                    rate_limiter.get_limiter().wait(url)
+                    with metrics.NAVIGATION_FETCH.time():
+                        driver.get(url_next.get_attribute('href'))
+                except Exception as e:
+                    utils.log(e)
+                    last_page = True
+
+                # controls the maximun pages to process
+                if config.FOTOCASA_NUM_PAGES_TO_READ == num_page:
+                    last_page = True
+
+        # the driver is given back first: the pages read in parallel lease their own ones
+        if pages is not None:
+            houses_to_visit = self._scrape_navigation_pages(url, location, pages, houses_to_visit)
+        utils.log('Num of houses_to_visit: %s', len(houses_to_visit))
         return houses_to_visit
 
     def scrape(self, urls: list = None):
@@ -393,6 +594,10 @@ class FotocasaScraper(HouseScraper):
         ----------
         urls : list, opt
             List of the navigation pages URLs to scrape
+
+        Returns
+        -------
+        True once the houses are dumped
         """
         utils.log("Starting Fotocasa dataset")
 
@@ -417,7 +622,7 @@ class FotocasaScraper(HouseScraper):
         house_fields = ['id', 'url', 'title', 'location', 'price',
                         'm2', 'rooms', 'floor', 'num-photos', 'floor-plan', 'view3d', 'video',
                         'home-staging', 'description', 'photo_urls']
-        utils.debug(f"Writing dataframe")
+        utils.debug('Writing dataframe')
         df = pd.DataFrame(houses, columns=house_fields).drop_duplicates('id')
 
         # creates directory to store data if it does not exist
@@ -426,7 +631,10 @@ class FotocasaScraper(HouseScraper):
 
         # writes dataframe into a CSV
         utils.log(
-            f'Dumping dataset into {config.FOTOCASA_FILE}-{location}.csv')
+            'Dumping dataset into %s-%s.csv', config.FOTOCASA_FILE, location)
         final_df = f"{config.FOTOCASA_FILE}-{location}.csv"
         df.to_csv(final_df, mode='a')
-        utils.log(f'Dumped dataset into {config.FOTOCASA_FILE}-{location}.csv')
+        seen_index.get_index().add(list(df['url']), [seen_index.summarize(row['price'], row['rooms'], row['m2'])
+                                                     for _, row in df.iterrows()])
+        utils.log('Dumped dataset into %s-%s.csv', config.FOTOCASA_FILE, location)
+        return True
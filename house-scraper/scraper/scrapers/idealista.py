@@ -1,7 +1,8 @@
 """
-Idealista web scraper. Launches a thread to scrape the 
-navigation - collects the houses URLs - and a thread to
-scrape the houses - getting the details of each house.
+Idealista web scraper. Runs on trio a task to scrape the
+navigation - collects the houses URLs - and a pipeline to
+scrape the houses - fetching, parsing and persisting the
+details of each house.
 
 Includes saving of state objects and dataframe periodically
 so it can be relaunched  if it fails.
@@ -12,72 +13,188 @@ import os
 import pickle
 import re
 import threading
-from queue import PriorityQueue, Queue
 from time import sleep
 
 import pandas as pd
-from misc import captcha_solver, config, utils
+import trio
+from misc import (broker, captcha_solver, config, dataset_writer,
+                  driver_pool, frontier, image_downloader, metrics,
+                  orchestrator, page_archive, rate_limiter, seen_index,
+                  utils)
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.common.by import By
 
+from . import idealista_parser
 from .scraper_base import HouseScraper
 
 
+# kinds of URLs in the frontier
+NAVIGATION = 'navigation'
+HOUSE = 'house'
+FALLBACK = 'fallback'   # houses that could not be scraped over HTTP
+
+HOUSE_FIELDS = ['id', 'url', 'title', 'location', 'price',
+                'm2', 'rooms', 'floor', 'num-photos', 'floor-plan', 'view3d', 'video',
+                'home-staging', 'description', 'photo_urls']
+
+
 class IdealistaScraper(HouseScraper):
 
     # state holding objects
     __scrape_navigation = True
     __scrape_houses = True
-    __navigations_to_visit = PriorityQueue()
-    __houses_to_visit = Queue()
+    __frontier = None
+    __writer = None
+    __seen = None
+    __archive = None    # raw pages fetched
+    __broker = None     # server of the coordinator of a distributed crawl
+    __worker = False    # if the frontier is served by a coordinator
     __houses_visited = list()
+    __houses_done = list()  # (kind, url) scraped since the last backup
 
-    # config for the periodic backup
-    __urls_before_cleanup = config.IDEALISTA_BACKUP_AFTER
-    __cleaner_semaphore = threading.Semaphore(value=__urls_before_cleanup)
-    __cleaner_signal = threading.Event()
+    __orchestrator = None
+    __http_done = False     # if the HTTP workers will not hand over more houses
 
-    def __init__(self, id: str):
-        super().__init__(id)
+    # browser identity shared with the HTTP workers
+    __http_identity = {'version': 0, 'fingerprint': None, 'cookies': list()}
+    __http_local = threading.local()    # an HTTP session per worker thread
+
+    # URLs visited since the last backup
+    __visits = 0
+
+    def __init__(self, id: str, refresh: bool = False, incremental: bool = False,
+                 broker_address: str = None, coordinator: bool = False):
+        super().__init__(id, refresh, incremental)
         atexit.register(self.cleanup)   # at exit, backup
+        self.__orchestrator = orchestrator.Orchestrator(driver_pool.get_pool().size)
+        if config.IDEALISTA_ARCHIVE_PAGES:
+            self.__archive = page_archive.PageArchive(config.IDEALISTA_ARCHIVE)
 
         if not utils.directory_exists(config.IDEALISTA_TMP):
             utils.create_directory(config.IDEALISTA_TMP)
 
-        # recover the pickled state holding objects
-        if utils.file_exists(os.path.join(config.IDEALISTA_TMP, 'navigations-to-scrap.pkl')):
-            with open(os.path.join(config.IDEALISTA_TMP, 'navigations-to-scrap.pkl'), 'rb') as file:
-                for nav in pickle.load(file):
-                    self.__navigations_to_visit.put(nav)
-                utils.log(f'{list(self.__navigations_to_visit.queue)}')
-                self.__scrape_navigation = not self.__navigations_to_visit.empty()
-        if utils.file_exists(os.path.join(config.IDEALISTA_TMP, 'houses-to-scrap.pkl')):
-            with open(os.path.join(config.IDEALISTA_TMP, 'houses-to-scrap.pkl'), 'rb') as file:
-                for house in pickle.load(file):
-                    self.__houses_to_visit.put(house)
-                self.__scrape_houses = not self.__houses_to_visit.empty()
+        if broker_address and not coordinator:
+            # worker of a distributed crawl: the coordinator keeps the state
+            client = broker.BrokerClient(broker_address)
+            self.__worker = True
+            self.__frontier = self.__writer = client
+            self.__seen = client.seen
+            rate_limiter.set_limiter(client.limiter)
+        else:
+            # recover the state: the frontier is read on demand, only the houses
+            # scraped but not dumped yet are pickled
+            self.__frontier = frontier.Frontier(config.IDEALISTA_FRONTIER)
+            self.__writer = dataset_writer.DatasetWriter(
+                config.IDEALISTA_SEGMENTS)
+            self.__seen = seen_index.get_index()
+            self._migrate_pickled_queues()
+            if ((refresh or incremental) and self.__frontier.has(NAVIGATION) and
+                    not any(self.__frontier.has(kind, frontier.PENDING) for kind in (NAVIGATION, HOUSE, FALLBACK))):
+                utils.log('[%s] Last crawl finished, crawling again from scratch', self.id)
+                self.__frontier.clear()
+            if coordinator:
+                self.__broker = broker.Broker(
+                    broker_address, self.__frontier, self.__writer)
+        self.__scrape_navigation = (not self.__frontier.has(NAVIGATION) or
+                                    self.__frontier.has(NAVIGATION, frontier.PENDING))
+        self.__scrape_houses = (self.__scrape_navigation or
+                                self.__frontier.has(HOUSE, frontier.PENDING) or
+                                self.__frontier.has(FALLBACK, frontier.PENDING))
         if utils.file_exists(os.path.join(config.IDEALISTA_TMP, 'visited-houses.pkl')):
             with open(os.path.join(config.IDEALISTA_TMP, 'visited-houses.pkl'), 'rb') as file:
                 self.__houses_visited = pickle.load(file)
 
+    def _migrate_pickled_queues(self):
+        """
+        Moves the pickled queues of a run made before the frontier existed into the frontier
+        """
+        for pkl, kind in (('navigations-to-scrap.pkl', NAVIGATION), ('houses-to-scrap.pkl', HOUSE)):
+            pkl_file = os.path.join(config.IDEALISTA_TMP, pkl)
+            if utils.file_exists(pkl_file):
+                with open(pkl_file, 'rb') as file:
+                    for item in pickle.load(file):
+                        if kind == NAVIGATION:
+                            self.__frontier.put(kind, item[1], item[0])
+                        else:
+                            self.__frontier.put(kind, item)
+                os.remove(pkl_file)
+                utils.log('[%s] Moved %s into the frontier', self.id, pkl)
+
     def cleanup(self):
         """
-        Backs up the state holding objects into pickle files
+        Backs up the houses scraped but not dumped yet into a pickle file, and
+        marks the houses scraped as visited in the frontier
         """
-        utils.log(f'Back-upping data')
-        with open(os.path.join(config.IDEALISTA_TMP, 'navigations-to-scrap.pkl'), 'wb') as file:
-            pickle.dump(list(self.__navigations_to_visit.queue),
-                        file, pickle.HIGHEST_PROTOCOL)
-        with open(os.path.join(config.IDEALISTA_TMP, 'houses-to-scrap.pkl'), 'wb') as file:
-            pickle.dump(list(self.__houses_to_visit.queue),
-                        file, pickle.HIGHEST_PROTOCOL)
+        utils.log('Back-upping data')
         with open(os.path.join(config.IDEALISTA_TMP, 'visited-houses.pkl'), 'wb') as file:
             pickle.dump(self.__houses_visited, file, pickle.HIGHEST_PROTOCOL)
 
+        done = self.__houses_done[:]
+        del self.__houses_done[:len(done)]
+        for kind in (HOUSE, FALLBACK):
+            self.__frontier.complete(
+                kind, [url for url_kind, url in done if url_kind == kind])
+
+    async def _count_visit(self):
+        """
+        Counts a visited URL; dumps the houses and backs up when the maximum URLs
+        visited before a backup is reached
+        """
+        self.__visits += 1
+        if self.__visits >= config.IDEALISTA_BACKUP_AFTER:
+            self.__visits = 0
+            await self.__orchestrator.run_sync(self.checkpoint, stage=orchestrator.PERSIST)
+
+    def checkpoint(self):
+        """
+        Dumps the houses scraped since the last dump and backs up the rest of the state
+        """
+        self.dump_houses()
+        self.cleanup()
+
+    def _share_identity(self, driver):
+        """
+        Shares the fingerprint and cookies of the driver with the HTTP workers, so
+        their requests belong to a session the web has already validated
+
+        Parameters
+        ----------
+        driver
+            Selenium driver
+        """
+        try:
+            self.__http_identity.update({
+                'version': self.__http_identity['version'] + 1,
+                'fingerprint': driver.fingerprint,
+                'cookies': driver.get_cookies()})
+        except Exception as e:
+            utils.warn('[%s] Could not share the browser identity: %s', self.id, e)
+
+    def _archive_page(self, kind: str, url: str, html: str):
+        """
+        Archives the raw HTML of a page fetched, to extract it again offline
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the page (NAVIGATION or HOUSE)
+        url : str
+            Final URL of the page
+        html : str
+            HTML of the page
+        """
+        if self.__archive is None:
+            return
+        try:
+            self.__archive.add(kind, url, html)
+        except Exception as e:
+            utils.warn('[%s] Could not archive %s: %s', self.id, url, e, url=url)
+
     def try_page(self, driver, fn):
         """
         Tries to access the element provided in fn (find_element() usually) and
-        solves any errors and captchas in its way.
+        solves any errors and captchas in its way. Reports to the rate limiter if
+        the site let it through or pushed back.
 
         Parameters
         ----------
@@ -90,7 +207,9 @@ class IdealistaScraper(HouseScraper):
         -------
         The result of executing fn() and if the request was successful
         """
+        limiter = rate_limiter.get_limiter()
         madeit = False
+        pushed_back = False
         retries = 0
         while not madeit:
             try:
@@ -98,109 +217,140 @@ class IdealistaScraper(HouseScraper):
                 madeit = True
             except NoSuchElementException:
                 try:
-                    #utils.wait() if utils.flip_coin() else utils.mega_wait()
-                    status_code = utils.get_http_code(driver.current_url)
-                    utils.warn(
-                        f'[{self.id}] Error {status_code}, trying to solve it...')
+                    status_code, _ = utils.get_browser_response(driver)
+                    utils.warn('[%s] Error %s, trying to solve it...', self.id, status_code,
+                               url=driver.current_url)
                     if status_code == 403 or captcha_solver.check(driver):
+                        pushed_back = True
+                        metrics.RETRIES.inc(reason='blocked')
+                        limiter.blocked(driver.current_url)
                         captcha_solver.solve(driver)
                     elif status_code == 404:
-                        utils.warn(
-                            f'[{self.id}] Error 404 in {driver.current_url}')
+                        utils.warn('[%s] Error 404 in %s', self.id, driver.current_url,
+                                   url=driver.current_url)
                         return None, False
                     else:
+                        pushed_back = True
+                        limiter.blocked(driver.current_url)
+                        metrics.RETRIES.inc(reason=status_code or 'unknown')
                         retries += 1
                         if retries > config.IDEALISTA_MAX_RETRIES:
                             return None, False
-                        utils.mega_wait()
+                        limiter.wait(driver.current_url)
                         driver.refresh()
                 except:
-                    utils.error(
-                        f'[{self.id}] Error retrieving {driver.current_url}')
+                    utils.error('[%s] Error retrieving %s', self.id, driver.current_url,
+                                url=driver.current_url)
+                    pushed_back = True
+                    limiter.blocked(driver.current_url)
+                    metrics.RETRIES.inc(reason='error')
                     retries += 1
                     if retries > config.IDEALISTA_MAX_RETRIES:
                         return None, False
-                    utils.mega_wait()
+                    limiter.wait(driver.current_url)
                     driver.refresh()
                 madeit = False
+        if not pushed_back:
+            limiter.success(driver.current_url)
         return result, True
 
-    def _scrape_navigation(self, driver, url: str, priority: int = 0):
+    def _scrape_navigation(self, url: str, priority: int = 0):
         """
-        Scrapes the navigation page given in the URL for houses URLs.
-        Updates the state holding objects with new houses URLs and new
-        pages to navigate
+        Leases a Selenium driver and scrapes the navigation page given in the URL
+        for houses URLs. Updates the state holding objects with new houses URLs and
+        new pages to navigate. The request must have been paced already
 
         Parameters
         ----------
-        driver
-            Selenium driver
         url : str
             URL to scrape
         priority : int, opt
             The priority of the URL and subsequent navigation pages. Less is better
         """
-        utils.mini_wait()
-        driver.get(url)
+        with driver_pool.get_pool().lease() as driver:
+            self._scrape_navigation_page(driver, url, priority)
 
-        # see how much we have to wait
-        utils.wait() if utils.flip_coin() else utils.mini_wait()
+    def _scrape_navigation_page(self, driver, url: str, priority: int):
+        """
+        Scrapes the navigation page given in the URL with a driver. See _scrape_navigation()
+        """
+        with metrics.NAVIGATION_FETCH.time():
+            driver.get(url)
 
-        # browse all pages
-        main_content, success = self.try_page(driver, lambda: driver.find_element(by=By.CSS_SELECTOR,
-                                                                                  value='main#main-content > section.items-container'))
+            # browse all pages
+            _, success = self.try_page(driver, lambda: driver.find_element(by=By.CSS_SELECTOR,
+                                                                           value='main#main-content > section.items-container'))
         if not success:
-            utils.warn(f'[{self.id}] Page unavailable: {url}')
+            utils.warn('[%s] Page unavailable: %s', self.id, url, url=url)
             return
-        articles = main_content.find_elements(
-            by=By.CSS_SELECTOR, value='article.item')
-        for article in articles:
-            # get each article url
-            article_url = article.find_element(by=By.CSS_SELECTOR,
-                                               value='div.item-info-container > a.item-link').get_attribute('href')
-            self.__houses_to_visit.put(article_url)
-        try:
-            next_page = main_content.find_element(
-                by=By.CSS_SELECTOR, value='div.pagination > ul > li.next > a')
-            next_page_link = next_page.get_attribute('href')
-            self.__navigations_to_visit.put((priority, next_page_link))
-        except NoSuchElementException as e:
-            utils.log(f'[{self.id}] No more pages to visit')
-            utils.warn(f'[{self.id}] {e.msg}')
 
-    def _get_house_features(self, driver, anchors, features, house: dict) -> dict:
+        # read the whole page in a single round trip
+        html, final_url = driver.page_source, driver.current_url
+        self._archive_page(NAVIGATION, final_url, html)
+        with metrics.EXTRACTION.time(page=NAVIGATION):
+            navigation = idealista_parser.parse_navigation(html, final_url)
+        if navigation is None:
+            utils.warn('[%s] Page unavailable: %s', self.id, url, url=url)
+            return
+        house_urls, next_page_link, summaries = navigation
+        if config.IDEALISTA_PAGINATION_SYNTHESIS and idealista_parser.get_page_number(final_url) == 1:
+            self._enqueue_pages(final_url, idealista_parser.parse_result_count(html), priority)
+        seen = self.__seen
+        unchanged = list()
+        for article_url in house_urls:
+            if self.refresh or not seen.has(article_url):
+                # a house visited in a resumed crawl is scraped again when refreshing
+                self.__frontier.put(HOUSE, article_url, reset=self.refresh)
+            elif self.incremental:
+                card = summaries[article_url]
+                if seen.get_summary(article_url) == seen_index.summarize(card['price'], card['rooms'], card['m2']):
+                    unchanged.append(article_url)
+                else:
+                    # the card changed: scraped again even if visited in this crawl
+                    self.__frontier.put(HOUSE, article_url, reset=True)
+        seen.touch(unchanged)
+        # already enqueued if the pages were built, unless the count fell short
+        if next_page_link:
+            self.__frontier.put(NAVIGATION, next_page_link, priority)
+        else:
+            utils.log('[%s] No more pages to visit', self.id)
+        self._share_identity(driver)
+
+    def _enqueue_pages(self, url: str, results: int, priority: int):
         """
-        Gets some features from the house: number of photos, if there is a map, video and 3D view 
-        available in the web, if there exists a home staging feature, the m2, number of rooms and
-        the floor the house is in. Download the floor plan if it exists.
+        Enqueues at once all the navigation pages of a location after the first one,
+        built from its number of houses, so several workers can navigate them in parallel
 
         Parameters
         ----------
-        anchors : WebElement
-            the div where the photos, view3D, etc are located
-        features : WebElement
-            the div where the main (basic) features are located
-        house : dict
-            Dictionary to append the information to
+        url : str
+            URL of the first navigation page of the location
+        results : int
+            Number of houses of the location. Nothing is enqueued if it is None
+        priority : int
+            The priority of the pages. Less is better
+        """
+        if results is None:
+            return
+        pages = idealista_parser.get_page_urls(url, results, config.IDEALISTA_RESULTS_PER_PAGE)
+        added = sum(self.__frontier.put(NAVIGATION, page_url, priority) for page_url in pages)
+        if added:
+            utils.log('[%s] Enqueued %s navigation pages of %s', self.id, added, url, url=url)
 
-        Returns
-        -------
-        Updated house dictionary
+    def _download_floor_plan(self, driver, house: dict):
         """
-        photos = 0
-        try:
-            photos_text = anchors.find_element(
-                by=By.CSS_SELECTOR, value='button.icon-no-pics > span').text
-            # '10 fotos' -> 10
-            photos = int(re.search(r'\d+', photos_text).group(0))
-        except NoSuchElementException as e:
-            pass    # no photos
-        house['num-photos'] = photos
+        Opens the floor plan in the gallery and downloads it
 
-        map = False
+        Parameters
+        ----------
+        driver
+            Selenium driver
+        house : dict
+            Dictionary with the info from the house
+        """
         try:
-            map_button = anchors.find_element(
-                by=By.CSS_SELECTOR, value='button.icon-plan')
+            map_button = driver.find_element(
+                by=By.CSS_SELECTOR, value='main.detail-container > section.detail-info div.fake-anchors button.icon-plan')
 
             # get image
             map_button.click()
@@ -213,148 +363,192 @@ class IdealistaScraper(HouseScraper):
                                           ' div.image-gallery-slide.center > figure.item-gallery > img')
 
             map_url = map_img.get_attribute('src')
-            utils.download_image(map_url, os.path.join(
-                config.IDEALISTA_MAPS, str(house['id']) + '.jpg'))
+            image_downloader.get_downloader().submit(map_url, os.path.join(
+                config.IDEALISTA_MAPS, str(house['id']) + '.jpg'), f'{self.id}:{house["id"]}')
 
             close_button.click()
             utils.mini_wait()
-
-            map = True  # checks if map button exists
         except NoSuchElementException as e:
-            pass    # map button does not exist
-        house['floor-plan'] = 1 if map else 0
+            utils.warn('[%s] Could not open the floor plan: %s', self.id, e.msg)
 
-        view3d = False
-        try:
-            anchors.find_element(by=By.CSS_SELECTOR,
-                                 value='button.icon-3d-tour-outline')
-            view3d = True  # checks if view3d button exists
-        except NoSuchElementException as e:
-            pass    # view3d button does not exist
-        house['view3d'] = 1 if view3d else 0
+    def _fetch_house_page(self, url: str) -> dict:
+        """
+        Leases a Selenium driver and fetches a certain house detail page. The page is
+        kept as snapshots of its HTML; the driver is only used again to open the photos
+        and the floor plan. The request must have been paced already
 
-        video = False
-        try:
-            anchors.find_element(by=By.CSS_SELECTOR,
-                                 value='button.icon-videos')
-            video = True  # checks if video button exists
-        except NoSuchElementException as e:
-            pass    # video button does not exist
-        house['video'] = 1 if video else 0
+        Parameters
+        ----------
+        url : str
+            URL to scrap
 
-        staging = False
+        Returns
+        -------
+        Dictionary with the 'html' of the page, its 'final_url', the 'photos_html'
+        once the photos are shown and the 'house' parsed from the html (None if the
+        markup was unexpected). None if the page is unavailable
+        """
         try:
-            anchors.find_element(by=By.CSS_SELECTOR,
-                                 value='button.icon-homestaging')
-            staging = True  # checks if staging button exists
-        except NoSuchElementException as e:
-            pass    # staging button does not exist
-        house['home-staging'] = 1 if staging else 0
-
-        house_features = features.find_elements(
-            by=By.CSS_SELECTOR, value='div.info-features > span')
-        if len(house_features) >= 1:
-            house['m2'] = house_features[0].find_element(
-                by=By.CSS_SELECTOR, value='span').text
-        if len(house_features) >= 2:
-            maybe_rooms = house_features[1].find_element(
-                by=By.CSS_SELECTOR, value='span').text
-            if re.search(r'\d+ hab.', maybe_rooms):
-                house['rooms'] = maybe_rooms
-            else:
-                house['floor'] = maybe_rooms
-        if len(house_features) >= 3:
-            house['floor'] = house_features[2].text
-        if not re.search(r'Planta', house['floor']):
-            house['floor'] = 'Sin planta'
+            utils.log('[%s] Scraping %s', self.id, url, url=url)
+            with driver_pool.get_pool().lease() as driver:
+                with metrics.DETAIL_FETCH.time(method='browser'):
+                    driver.get(url)
+                    _, success = self.try_page(driver, lambda: driver.find_element(
+                        by=By.CSS_SELECTOR, value='main.detail-container > section.detail-info'))
 
-        return house
+                if not success:
+                    utils.warn('[%s] Page unavailable: %s', self.id, url, url=url)
+                    return None
+
+                page = {'html': driver.page_source, 'final_url': driver.current_url,
+                        'photos_html': None}
+                # the snapshot tells if the driver has to open the floor plan and the photos:
+                # looking for elements that are not there costs the implicit wait
+                with metrics.EXTRACTION.time(page=HOUSE):
+                    page['house'] = idealista_parser.parse_house(page['html'], page['final_url'])
+                house = page['house']
+                if house is not None and house['floor-plan']:
+                    self._download_floor_plan(
+                        driver, {'id': idealista_parser.get_house_id(url)})
+
+                # check if there is a button of 'show all the photos'
+                if house is not None and house['num-photos'] > 0:
+                    photo_buttons = driver.find_elements(
+                        by=By.CSS_SELECTOR, value='div#multimedia-container > div#main-multimedia div.more')
+                    if len(photo_buttons) > 0:
+                        photo_buttons[0].click()
+                        utils.mini_wait()
+                page['photos_html'] = driver.page_source
+                self._archive_page(HOUSE, page['final_url'], page['photos_html'])
+                self._share_identity(driver)
+                return page
+        except NoSuchElementException as e:
+            utils.error('[%s] Something happened!', self.id)
+            utils.error('Exception: %s', e.msg)
+        except:
+            utils.error('[%s] Something happened!', self.id)
+        return None
 
-    def _scrape_house_page(self, driver, url: str):
+    def _parse_house_page(self, url: str, page: dict) -> dict:
         """
-        Scrapes a certain house detail page. Updates the state holding objects.
+        Parses a house detail page fetched with a browser
 
         Parameters
         ----------
-        driver
-            Selenium driver
         url : str
-            URL to scrap
-        """
-        try:
-            house = {'id': '', 'url': '', 'title': '', 'location': '', 'price': '',
-                     'm2': '', 'rooms': '', 'floor': '', 'num-photos': '', 'floor-plan': '', 'view3d': '',
-                     'video': '', 'home-staging': '', 'description': ''}
-            utils.log(f'[idealista] Scraping {url}')
-            utils.mini_wait()
-            driver.get(url)
-            utils.mini_wait()
-            main_content, success = self.try_page(driver, lambda: driver.find_element(
-                by=By.CSS_SELECTOR, value='main.detail-container > section.detail-info'))
+            URL of the house
+        page : dict
+            The snapshots of the page, as given by _fetch_house_page()
 
-            if not success:
-                utils.warn(f'[{self.id}] Page unavailable: {url}')
-                return
+        Returns
+        -------
+        Dictionary with all the info from the house, None if the markup was unexpected
+        """
+        house = page['house']
+        if house is None:
+            utils.error('[%s] Something happened!', self.id)
+            utils.error('Unexpected markup in %s', url, url=url)
+            return None
+        house['id'] = idealista_parser.get_house_id(url)
+        if house['num-photos'] > 0:
+            house['photo_urls'] = idealista_parser.parse_photo_urls(
+                page['photos_html'])
+        return house
 
-            house['id'] = int(re.search(r'\d+', url).group(0))
-            house['url'] = driver.current_url
-            house['title'] = main_content.find_element(
-                by=By.CSS_SELECTOR, value='div.main-info__title > h1 > span').text
-            house['location'] = main_content.find_element(
-                by=By.CSS_SELECTOR, value='div.main-info__title > span > span').text
-            house['price'] = int(main_content.find_element(by=By.CSS_SELECTOR,
-                                                           value='div.info-data > span.info-data-price > span').text.replace('.', ''))
-
-            anchors = main_content.find_element(
-                by=By.CSS_SELECTOR, value='div.fake-anchors')
-            house = self._get_house_features(
-                driver, anchors, main_content, house)
-
-            house['description'] = main_content.find_element(by=By.CSS_SELECTOR,
-                                                             value='div.commentsContainer > div.comment > div.adCommentsLanguage > p').text.rstrip()
-            house['description'] = house['description'].replace(
-                '\n', ' ').rstrip()
-
-            if house['num-photos'] > 0:
-                photo_container = driver.find_element(
-                    by=By.CSS_SELECTOR, value='div#multimedia-container > div#main-multimedia')
+    def _get_http_session(self):
+        """
+        Gets the HTTP session of the current worker thread, renewed whenever
+        the browsers share a new identity
+        """
+        local = self.__http_local
+        if getattr(local, 'version', None) != self.__http_identity['version']:
+            local.version = self.__http_identity['version']
+            local.session = utils.get_http_session(self.__http_identity['fingerprint'],
+                                                   self.__http_identity['cookies'])
+        return local.session
+
+    def _fetch_house_http(self, url: str) -> dict:
+        """
+        Fetches a certain house detail page over plain HTTP. The request must have
+        been paced already
 
-                # check if there is a button of 'show all the photos'
-                photo_buttons = photo_container.find_elements(
-                    by=By.CSS_SELECTOR, value='div.more')
-                if len(photo_buttons) > 0:
-                    photo_buttons[0].click()
+        Parameters
+        ----------
+        url : str
+            URL to scrap
 
-                utils.mini_wait()
+        Returns
+        -------
+        Dictionary with the 'html' of the page and its 'final_url'; with 'html' None if
+        the page does not exist. None if the page needs to be scraped with a browser:
+        it returned a 403 or a captcha
+        """
+        limiter = rate_limiter.get_limiter()
+        utils.log('[%s] Scraping over HTTP %s', self.id, url, url=url)
+        with metrics.DETAIL_FETCH.time(method='http'):
+            status_code, final_url, html = utils.fetch_page(
+                self._get_http_session(), url)
+        if status_code == 404:
+            utils.warn('[%s] Error 404 in %s', self.id, url, url=url)
+            return {'html': None, 'final_url': final_url}
+        captcha = status_code == 200 and captcha_solver.check_html(html)
+        if status_code in (403, 429) or captcha:
+            limiter.blocked(url)
+        if status_code != 200 or captcha:
+            utils.warn('[%s] Error %s in %s, falling back to the browser', self.id, status_code, url,
+                       url=url)
+            return None
+        limiter.success(url)
+        self._archive_page(HOUSE, final_url, html)
+        return {'html': html, 'final_url': final_url}
+
+    def _parse_house_http(self, url: str, page: dict) -> dict:
+        """
+        Parses a house detail page fetched over plain HTTP
 
-                photos = photo_container.find_elements(
-                    by=By.CSS_SELECTOR, value='div.image > img')
-                house['photo_urls'] = [photo.get_attribute(
-                    'data-ondemand-img') for photo in photos]
+        Parameters
+        ----------
+        url : str
+            URL of the house
+        page : dict
+            The page, as given by _fetch_house_http()
 
-            self.__houses_visited.append(house)
-        except NoSuchElementException as e:
-            utils.error(f'[{self.id}] Something happened!')
-            utils.error(f'Exception: {e.msg}')
-        except:
-            utils.error(f'[{self.id}] Something happened!')
+        Returns
+        -------
+        Dictionary with all the info from the house, None if the page needs to be
+        scraped with a browser: the expected markup is missing, the photos are
+        rendered by javascript or the floor plan has to be opened in the gallery
+        """
+        try:
+            with metrics.EXTRACTION.time(page=HOUSE):
+                house = idealista_parser.parse_house(page['html'], page['final_url'])
+        except Exception as e:
+            utils.warn('[%s] Could not parse %s: %s', self.id, url, e, url=url)
+            return None
+        if house is None or house['floor-plan']:
+            return None
+        if house['num-photos'] > 0:
+            house['photo_urls'] = idealista_parser.parse_photo_urls(
+                page['html'])
+            if not house['photo_urls']:
+                return None    # the photos are rendered by javascript
+        return house
 
     def _scrape_first_time_nav(self):
         """
-        Creates a new Selenium driver and gets the URLs of the navigation pages of all the
+        Leases a Selenium driver and gets the URLs of the navigation pages of all the
         provinces/regions. Updates the state holding objects
         """
         try:
-            with utils.get_selenium() as driver:
-                utils.mini_wait()
+            with driver_pool.get_pool().lease() as driver:
+                rate_limiter.get_limiter().wait(config.IDEALISTA_URL)
                 driver.get(config.IDEALISTA_URL)
-                utils.mini_wait()
                 _, success = self.try_page(driver, lambda: driver.find_element(
                     by=By.CSS_SELECTOR, value='section#municipality-search'))
 
                 if not success:
                     utils.warn(
-                        f'[{self.id}] Page unavailable: {config.IDEALISTA_URL}')
+                        '[%s] Page unavailable: %s', self.id, config.IDEALISTA_URL)
                     return
 
                 locations_list = driver.find_elements(by=By.CSS_SELECTOR,
@@ -368,141 +562,286 @@ class IdealistaScraper(HouseScraper):
                     loc_number = int(location.find_element(
                         by=By.CSS_SELECTOR, value='p').text.replace('.', ''))
                     # bypass choosing a sublocation
-                    self.__navigations_to_visit.put(
-                        (loc_number, re.sub(r'municipios$', '', loc_link.get_attribute('href'))))
+                    loc_url = re.sub(r'municipios$', '', loc_link.get_attribute('href'))
+                    self.__frontier.put(NAVIGATION, loc_url, loc_number)
+                    if config.IDEALISTA_PAGINATION_SYNTHESIS:
+                        self._enqueue_pages(loc_url, loc_number, loc_number)
                 utils.mini_wait()
         except Exception as e:
-            utils.error(f'[{self.id}]: {e.msg}')
+            utils.error('[%s]: %s', self.id, e.msg)
 
-    def start_navigating(self):
+    async def start_navigating(self):
         """
-        Begins navigating the URLs provided by the state holding objects
+        Begins navigating the URLs provided by the state holding objects, with up to
+        IDEALISTA_NAVIGATION_WORKERS workers pulling from the shared frontier
         """
-        with utils.get_selenium() as driver:
-            try:
-                while not self.__navigations_to_visit.empty():
-                    if not self.__cleaner_semaphore.acquire(blocking=True, timeout=100):
-                        # reached maximum URLs visited before dump
-                        self.__cleaner_signal.set()
-                        self.__cleaner_semaphore.acquire(
-                            blocking=True, timeout=0)
-                    navigation = self.__navigations_to_visit.get()
-                    self._scrape_navigation(
-                        driver, navigation[1], navigation[0])
-                self.__scrape_navigation = False
-            except:
-                utils.error(f'[{self.id}] Error while navigating')
+        try:
+            async with trio.open_nursery() as nursery:
+                for index in range(config.IDEALISTA_NAVIGATION_WORKERS):
+                    nursery.start_soon(self._navigation_worker, index)
+        finally:
+            self.__scrape_navigation = False
 
-    def start_house_scraping(self):
+    def _get_navigation_workers(self) -> int:
         """
-        Launches some workers that will scrape the houses
+        Gets how many navigation workers should be navigating, from the depth of the
+        queues: one per navigation page pending while the houses waiting to be scraped
+        are few, so the house workers are never starved, and only one otherwise, so the
+        drivers go to the house pages
+
+        Returns
+        -------
+        The number of navigation workers that should be navigating, at least one
         """
-        threads = [threading.Thread(target=self.house_scraper)
-                   for _ in range(config.MAX_WORKERS)]
-        [thread.start() for thread in threads]
-        [thread.join() for thread in threads]
+        houses = sum(self.__frontier.count(kind, frontier.PENDING) for kind in (HOUSE, FALLBACK))
+        if houses >= config.IDEALISTA_HOUSES_BACKLOG:
+            return 1
+        pending = self.__frontier.count(NAVIGATION, frontier.PENDING)
+        return max(1, min(config.IDEALISTA_NAVIGATION_WORKERS, pending))
 
-    def house_scraper(self):
+    async def _navigation_worker(self, index: int):
         """
-        Begins scraping the house URLs provided by the state holding objects
+        Navigates the pages of the frontier while the depth of the queues calls for this
+        worker. The first worker always navigates
+
+        Parameters
+        ----------
+        index : int
+            Index of the worker
         """
-        with utils.get_selenium() as driver:
+        tasks = self.__orchestrator
+
+        def finished() -> bool:
+            # other workers may still find more pages
+            return not self.__frontier.has(NAVIGATION, frontier.INFLIGHT)
+
+        while True:
+            if index > 0 and index >= await tasks.run_sync(self._get_navigation_workers):
+                if await tasks.run_sync(finished) and not await tasks.run_sync(
+                        self.__frontier.has, NAVIGATION, frontier.PENDING):
+                    return
+                await trio.sleep(config.ORCHESTRATOR_POLL)
+                continue
+            navigation = await tasks.lease(self.__frontier, NAVIGATION, finished)
+            if navigation is None:
+                return
+            url, priority, _ = navigation
+            await tasks.pace(url)
             try:
-                utils.mini_wait()
-                while self.__scrape_houses:
-                    try:
-                        if not self.__cleaner_semaphore.acquire(blocking=True, timeout=100):
-                            self.__cleaner_signal.set()
-                            self.__cleaner_semaphore.acquire(
-                                blocking=True, timeout=0)
-                        house = self.__houses_to_visit.get(timeout=500)
-                    except Exception:
-                        # navigation scraped and houses scraped
-                        if not self.__scrape_navigation:
-                            self.__scrape_houses = False
-                            continue
-                    self._scrape_house_page(driver, house)
-                    utils.mega_wait() if utils.flip_coin() else utils.wait(
-                    ) if utils.flip_coin() else utils.mini_wait()
-            except:
-                utils.error(f'[{self.id}] Error while scraping')
+                await tasks.run_sync(self._scrape_navigation, url, priority, stage=orchestrator.FETCH)
+            except Exception as e:
+                utils.error('[%s] Error while navigating %s: %s', self.id, url, e, url=url)
+            await tasks.run_sync(self.__frontier.complete, NAVIGATION, [url])
+            await self._count_visit()
 
-    def dump_houses(self):
+    async def start_house_scraping(self):
         """
-        Dumps the houses info into a CSV file
+        Runs the houses through the fetch, parse and persist stages. In HTTP-first mode,
+        the browsers only scrape the houses the HTTP workers could not
         """
-        # mix all the data, keep unique IDs
-        utils.log(f'Dumping houses CSV')
-        house_fields = ['id', 'url', 'title', 'location', 'price',
-                        'm2', 'rooms', 'floor', 'num-photos', 'floor-plan', 'view3d', 'video',
-                        'home-staging', 'description', 'photo_urls']
-        df = pd.DataFrame(self.__houses_visited,
-                          columns=house_fields).drop_duplicates('id')
+        tasks = self.__orchestrator
+        browser_stages = [(self._fetch_page_stage, driver_pool.get_pool().size),
+                          (self._parse_page_stage, config.ORCHESTRATOR_PARSE_WORKERS),
+                          (self._persist_stage, 1)]
+        if not config.IDEALISTA_HTTP_FETCH:
+            await tasks.pipeline(self._house_source(HOUSE, lambda: not self.__scrape_navigation),
+                                 browser_stages)
+            return
+
+        async def http_pipeline():
+            try:
+                await tasks.pipeline(self._house_source(HOUSE, lambda: not self.__scrape_navigation),
+                                     [(self._fetch_http_stage, config.IDEALISTA_HTTP_WORKERS),
+                                      (self._parse_http_stage, config.ORCHESTRATOR_PARSE_WORKERS),
+                                      (self._persist_stage, 1)])
+            finally:
+                self.__http_done = True
+
+        self.__http_done = False
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(http_pipeline)
+            nursery.start_soon(tasks.pipeline, self._house_source(
+                FALLBACK, lambda: self.__http_done), browser_stages)
+
+    def _house_source(self, kind: str, finished):
+        """
+        Gets the source of the houses of a kind to scrape, for a pipeline
+
+        Parameters
+        ----------
+        kind : str
+            Kind of the houses in the frontier (HOUSE or FALLBACK)
+        finished : function
+            Function telling if no more houses of the kind will come
+
+        Returns
+        -------
+        Async function giving the next house, as a dictionary with its 'kind' and 'url'
+        """
+        async def source():
+            leased = await self.__orchestrator.lease(self.__frontier, kind, finished)
+            return {'kind': kind, 'url': leased[0]} if leased is not None else None
+        return source
 
+    async def _fetch_page_stage(self, item: dict) -> dict:
+        """
+        Fetches the page of the house with a browser, once its request is allowed
+        """
+        await self.__orchestrator.pace(item['url'])
+        item['page'] = await self.__orchestrator.run_sync(
+            self._fetch_house_page, item['url'], stage=orchestrator.FETCH)
+        return item
+
+    async def _parse_page_stage(self, item: dict) -> dict:
+        """
+        Parses the page of the house fetched with a browser
+        """
+        if item['page'] is not None:
+            item['house'] = await self.__orchestrator.run_sync(
+                self._parse_house_page, item['url'], item['page'], stage=orchestrator.PARSE)
+        return item
+
+    async def _fetch_http_stage(self, item: dict) -> dict:
+        """
+        Fetches the page of the house over HTTP, once its request is allowed
+        """
+        await self.__orchestrator.pace(item['url'])
+        item['page'] = await self.__orchestrator.run_sync(
+            self._fetch_house_http, item['url'], stage=orchestrator.HTTP)
+        item['fallback'] = item['page'] is None
+        return item
+
+    async def _parse_http_stage(self, item: dict) -> dict:
+        """
+        Parses the page of the house fetched over HTTP
+        """
+        if item['page'] is not None and item['page']['html'] is not None:
+            item['house'] = await self.__orchestrator.run_sync(
+                self._parse_house_http, item['url'], item['page'], stage=orchestrator.PARSE)
+            item['fallback'] = item['house'] is None
+        return item
+
+    async def _persist_stage(self, item: dict):
+        """
+        Keeps the house scraped, or hands it over to the browsers, and counts the visit
+        """
+        if item.get('house') is not None:
+            self.__houses_visited.append(item['house'])
+        elif item.get('fallback'):
+            await self.__orchestrator.run_sync(self.__frontier.put, FALLBACK, item['url'])
+        self.__houses_done.append((item['kind'], item['url']))
+        await self._count_visit()
+
+    async def _orchestrate(self):
+        """
+        Runs the navigation and the house scraping concurrently
+        """
+        async with trio.open_nursery() as nursery:
+            if self.__scrape_navigation:
+                nursery.start_soon(self.start_navigating)
+            if self.__scrape_houses:
+                nursery.start_soon(self.start_house_scraping)
+
+    def dump_houses(self):
+        """
+        Dumps the houses scraped since the last dump into a new segment. Only the
+        new houses are written
+        """
+        with metrics.CHECKPOINT.time(step='dump'):
+            houses = self.__houses_visited[:]
+            self.__writer.append(
+                [{field: house.get(field) for field in HOUSE_FIELDS} for house in houses])
+            self.__seen.add([f'{self.id}:{house["id"]}' for house in houses],
+                            [seen_index.summarize(house['price'], house['rooms'], house['m2'])
+                             for house in houses])
+            del self.__houses_visited[:len(houses)]
+
+    def compact_houses(self):
+        """
+        Compacts the dumped segments into the houses CSV file, keeping the newest
+        version of each house. The workers of a distributed crawl leave it to the coordinator
+        """
+        if self.__worker:
+            return
         if not utils.directory_exists(config.DATASET_DIR):
             utils.create_directory(config.DATASET_DIR)
-        if utils.file_exists(config.IDEALISTA_FILE):
-            existing_df = pd.read_csv(config.IDEALISTA_FILE)
-            df = pd.concat([df, existing_df]).drop_duplicates('id')
-        utils.log(f'Dumping dataset into {config.IDEALISTA_FILE}')
-        df.to_csv(config.IDEALISTA_FILE, encoding='utf-8',
-                  index=False, header=True)
-        self.__houses_visited.clear()
-        utils.log(f'Dumped dataset of {df.shape} into {config.IDEALISTA_FILE}')
+        utils.log('Dumping dataset into %s', config.IDEALISTA_FILE)
+        with metrics.CHECKPOINT.time(step='compact'):
+            self.__writer.compact(config.IDEALISTA_FILE, 'id', HOUSE_FIELDS)
 
     def scrape(self, urls: list = None):
         """
-        Scrapes the entire idealista website or just a subset of it
-        Creates a thread for navigation scraping and a thread for 
-        house scraping; then synchronises both threads every
-        X scraped URLs to backup the data
+        Scrapes the entire idealista website or just a subset of it.
+        Runs the navigation and the house scraping on trio, backing up
+        the data every X scraped URLs
 
         Parameters
         ----------
         urls : list, opt
             List of the navigation pages URLs to scrape
+
+        Returns
+        -------
+        True if the crawl was finished, False if it stopped with URLs left to visit
         """
+        finished = False
         try:
             utils.create_directory(config.IDEALISTA_MAPS)
-            nav_thread = None
+            if self.__broker:
+                self.__broker.start()
 
             if self.__scrape_navigation:
-                if self.__navigations_to_visit.empty():
+                if not self.__worker and not self.__frontier.has(NAVIGATION, frontier.PENDING):
                     if not urls:
                         utils.log(
                             '[idealista] Started navigating all idealista')
                         self._scrape_first_time_nav()
                     else:
                         utils.log(
-                            f'[idealista] Started navigating only {len(urls)} idealista locations')
+                            '[idealista] Started navigating only %s idealista locations', len(urls))
                         for i, url in enumerate(urls):
-                            self.__navigations_to_visit.put((i, url))
-                nav_thread = threading.Thread(target=self.start_navigating)
-
-            houses_thread = None
-            if self.__scrape_houses:
-                houses_thread = threading.Thread(
-                    target=self.start_house_scraping)
+                            self.__frontier.put(NAVIGATION, url, i)
 
-            if nav_thread:
-                nav_thread.start()
-            if houses_thread:
-                houses_thread.start()
+            trio.run(self._orchestrate)
 
-            while ((nav_thread.is_alive() if nav_thread else False) or
-                    (houses_thread.is_alive() if houses_thread else False)):
-                self.__cleaner_signal.wait()
+            # the coordinator keeps collecting the results until the workers finish
+            while self.__broker and not self.__broker.is_idle([NAVIGATION, HOUSE, FALLBACK]):
+                self.checkpoint()
                 sleep(config.SYNCHRO_MAX_WAIT)
-
-                self.dump_houses()
-                self.cleanup()
-
-                self.__cleaner_signal.clear()
-                self.__cleaner_semaphore.release(n=self.__urls_before_cleanup)
+            finished = not any(self.__frontier.has(kind, frontier.PENDING)
+                               for kind in (NAVIGATION, HOUSE, FALLBACK))
         except:
-            utils.error(f'[idealista] Something went wrong (?)')
+            utils.error('[idealista] Something went wrong (?)')
         finally:
             # whatever happens, backup and dump!
             # final backup and dump
             self.cleanup()
             self.dump_houses()
+            self.compact_houses()
+            if self.__broker:
+                self.__broker.close()
+        return finished
+
+
+def reextract() -> int:
+    """
+    Regenerates the houses CSV file from the archived pages, in a pool of processes
+    and without any request. The houses of the CSV file not archived are kept
+
+    Returns
+    -------
+    The number of houses extracted
+    """
+    archive = page_archive.PageArchive(config.IDEALISTA_ARCHIVE)
+    try:
+        houses = archive.extract(HOUSE, idealista_parser.parse_archived_house)
+    finally:
+        archive.close()
+
+    dfs = [pd.read_csv(config.IDEALISTA_FILE)] if utils.file_exists(config.IDEALISTA_FILE) else []
+    dfs.append(pd.DataFrame(houses, columns=HOUSE_FIELDS))
+    df = pd.concat(dfs).drop_duplicates('id', keep='last').reindex(columns=HOUSE_FIELDS)
+    df.to_csv(config.IDEALISTA_FILE + '.tmp', encoding='utf-8', index=False, header=True)
+    os.replace(config.IDEALISTA_FILE + '.tmp', config.IDEALISTA_FILE)
+    utils.log('Re-extracted %s houses into %s: %s', len(houses), config.IDEALISTA_FILE, df.shape)
+    return len(houses)
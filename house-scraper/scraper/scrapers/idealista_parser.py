@@ -0,0 +1,311 @@
+"""
+Idealista HTML parser. Extracts the house details and the navigation
+links from a snapshot of the page HTML, either downloaded without a
+browser or taken from a driver in a single round trip.
+"""
+
+import re
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+
+def _select_text(root, selector: str) -> str:
+    """
+    Gets the visible text of the first element matching the selector
+
+    Parameters
+    ----------
+    root : Tag
+        Element to search in
+    selector : str
+        CSS selector of the element
+
+    Returns
+    -------
+    The text with its whitespace collapsed, None if the element does not exist
+    """
+    element = root.select_one(selector)
+    if element is None:
+        return None
+    return ' '.join(element.get_text(' ').split())
+
+
+def get_house_id(url: str) -> int:
+    """
+    Gets the ID of a house from its URL
+
+    Parameters
+    ----------
+    url : str
+        URL of the house detail page
+
+    Returns
+    -------
+    The ID of the house. It is read from the path, not to take a port for it
+    """
+    return int(re.search(r'\d+', urlparse(url).path).group(0))
+
+
+def _parse_house_features(anchors, features, house: dict) -> dict:
+    """
+    Gets some features from the house: number of photos, if there is a map, video and 3D view
+    available in the web, if there exists a home staging feature, the m2, number of rooms and
+    the floor the house is in.
+
+    Parameters
+    ----------
+    anchors : Tag
+        the div where the photos, view3D, etc are located
+    features : Tag
+        the div where the main (basic) features are located
+    house : dict
+        Dictionary to append the information to
+
+    Returns
+    -------
+    Updated house dictionary
+    """
+    photos = 0
+    photos_text = _select_text(anchors, 'button.icon-no-pics > span')
+    if photos_text and re.search(r'\d+', photos_text):
+        # '10 fotos' -> 10
+        photos = int(re.search(r'\d+', photos_text).group(0))
+    house['num-photos'] = photos
+
+    house['floor-plan'] = 1 if anchors.select_one('button.icon-plan') else 0
+    house['view3d'] = 1 if anchors.select_one(
+        'button.icon-3d-tour-outline') else 0
+    house['video'] = 1 if anchors.select_one('button.icon-videos') else 0
+    house['home-staging'] = 1 if anchors.select_one(
+        'button.icon-homestaging') else 0
+
+    house_features = features.select('div.info-features > span')
+    if len(house_features) >= 1:
+        house['m2'] = _select_text(house_features[0], 'span') or ''
+    if len(house_features) >= 2:
+        maybe_rooms = _select_text(house_features[1], 'span') or ''
+        if re.search(r'\d+ hab.', maybe_rooms):
+            house['rooms'] = maybe_rooms
+        else:
+            house['floor'] = maybe_rooms
+    if len(house_features) >= 3:
+        house['floor'] = ' '.join(house_features[2].get_text(' ').split())
+    if not re.search(r'Planta', house['floor']):
+        house['floor'] = 'Sin planta'
+
+    return house
+
+
+def parse_house(html: str, url: str) -> dict:
+    """
+    Parses a house detail page. The photo URLs are parsed apart, with parse_photo_urls()
+
+    Parameters
+    ----------
+    html : str
+        HTML of the page
+    url : str
+        Final URL of the page
+
+    Returns
+    -------
+    Dictionary with all the info from the house, or None if the page
+    does not have the expected markup
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content = soup.select_one('main.detail-container > section.detail-info')
+    if main_content is None:
+        return None
+
+    house = {'id': '', 'url': '', 'title': '', 'location': '', 'price': '',
+             'm2': '', 'rooms': '', 'floor': '', 'num-photos': '', 'floor-plan': '', 'view3d': '',
+             'video': '', 'home-staging': '', 'description': ''}
+    house['id'] = get_house_id(url)
+    house['url'] = url
+    house['title'] = _select_text(
+        main_content, 'div.main-info__title > h1 > span')
+    house['location'] = _select_text(
+        main_content, 'div.main-info__title > span > span')
+    price = _select_text(
+        main_content, 'div.info-data > span.info-data-price > span')
+    anchors = main_content.select_one('div.fake-anchors')
+    description = _select_text(main_content,
+                               'div.commentsContainer > div.comment > div.adCommentsLanguage > p')
+    if None in (house['title'], house['location'], price, anchors, description):
+        return None
+
+    # some listings show no price, e.g. 'A consultar'
+    house['price'] = int(re.sub(r'\D', '', price)) if re.search(r'\d', price) else None
+    house = _parse_house_features(anchors, main_content, house)
+    house['description'] = description
+
+    return house
+
+
+def parse_photo_urls(html: str) -> list:
+    """
+    Parses the URLs of the photos of a house detail page
+
+    Parameters
+    ----------
+    html : str
+        HTML of the page
+
+    Returns
+    -------
+    List of the photo URLs
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    photos = soup.select(
+        'div#multimedia-container > div#main-multimedia div.image > img')
+    return [photo.get('data-ondemand-img') for photo in photos]
+
+
+def parse_archived_house(html: str, url: str) -> dict:
+    """
+    Parses a house detail page archived, with its photos shown
+
+    Parameters
+    ----------
+    html : str
+        HTML of the page
+    url : str
+        Final URL of the page
+
+    Returns
+    -------
+    Dictionary with all the info from the house and its photo URLs, or None
+    if the page does not have the expected markup
+    """
+    house = parse_house(html, url)
+    if house is None:
+        return None
+    if house['num-photos'] > 0:
+        house['photo_urls'] = parse_photo_urls(html)
+    return house
+
+
+def _parse_card(card) -> dict:
+    """
+    Gets the summary a navigation card shows of a house: price, rooms and m2
+
+    Parameters
+    ----------
+    card : Tag
+        the div with the info of the house in the navigation page
+
+    Returns
+    -------
+    Dictionary with the 'price', 'rooms' and 'm2' of the house, None if unknown
+    """
+    summary = {'price': None, 'rooms': None, 'm2': None}
+    price = _select_text(card, 'span.item-price')
+    if price and re.search(r'\d', price):
+        summary['price'] = int(re.sub(r'\D', '', price))
+    for detail in card.select('span.item-detail'):
+        text = ' '.join(detail.get_text(' ').split())
+        if re.search(r'\d+ hab', text):
+            summary['rooms'] = text
+        elif re.search(r'\d+ m²', text):
+            summary['m2'] = text
+    return summary
+
+
+def parse_navigation(html: str, url: str) -> tuple:
+    """
+    Parses a navigation page
+
+    Parameters
+    ----------
+    html : str
+        HTML of the page
+    url : str
+        URL of the page, to resolve the relative links
+
+    Returns
+    -------
+    The list of the houses URLs, the URL of the next navigation page (None if
+    it is the last one) and a dictionary with the summary of each house in its
+    card (house URL -> summary). None if the page does not have the expected markup
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    main_content = soup.select_one('main#main-content > section.items-container')
+    if main_content is None:
+        return None
+
+    house_urls = list()
+    summaries = dict()
+    for card in main_content.select('article.item div.item-info-container'):
+        link = card.select_one(':scope > a.item-link')
+        if link is None or not link.get('href'):
+            continue
+        house_url = urljoin(url, link.get('href'))
+        house_urls.append(house_url)
+        summaries[house_url] = _parse_card(card)
+    next_page = main_content.select_one('div.pagination > ul > li.next > a')
+    next_page_url = urljoin(url, next_page.get(
+        'href')) if next_page and next_page.get('href') else None
+    return house_urls, next_page_url, summaries
+
+
+def parse_result_count(html: str) -> int:
+    """
+    Parses the number of houses of a search, shown in the title of its navigation pages
+
+    Parameters
+    ----------
+    html : str
+        HTML of a navigation page
+
+    Returns
+    -------
+    The number of houses, None if the title does not show it
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    title = _select_text(soup, 'h1')
+    match = re.search(r'\d[\d.]*', title or '')
+    return int(match.group(0).replace('.', '')) if match else None
+
+
+def get_page_number(url: str) -> int:
+    """
+    Gets the number of a navigation page from its URL
+
+    Parameters
+    ----------
+    url : str
+        URL of the navigation page
+
+    Returns
+    -------
+    The number of the page; the first page has no number in its URL
+    """
+    match = re.search(r'/pagina-(\d+)\.htm$', urlparse(url).path)
+    return int(match.group(1)) if match else 1
+
+
+def get_page_urls(url: str, results: int, per_page: int) -> list:
+    """
+    Builds the URLs of the navigation pages of a search, following the
+    pattern of the site (.../pagina-N.htm), without loading them
+
+    Parameters
+    ----------
+    url : str
+        URL of any navigation page of the search
+    results : int
+        Number of houses of the search
+    per_page : int
+        Houses in each navigation page
+
+    Returns
+    -------
+    List with the URLs of the pages after the first one
+    """
+    parts = urlparse(url)
+    path = re.sub(r'pagina-\d+\.htm$', '', parts.path)
+    if not path.endswith('/'):
+        path += '/'
+    pages = -(-results // per_page)
+    return [parts._replace(path=f'{path}pagina-{page}.htm').geturl() for page in range(2, pages + 1)]
@@ -9,15 +9,22 @@ class HouseScraper():
     ----------
     id : str
         identifier for the scraper
+    refresh : bool
+        if the listings already scraped are scraped again
+    incremental : bool
+        if the listings already scraped are scraped again only when their navigation card changed
 
     Methods
     -------
     scrape(urls : str, opt)
-        Crawls through a web or a subset of pages in the web
+        Crawls through a web or a subset of pages in the web. Returns True if
+        the crawl was finished
 
     """
 
-    def __init__(self, id: str):
+    def __init__(self, id: str, refresh: bool = False, incremental: bool = False):
         self.id = id
+        self.refresh = refresh
+        self.incremental = incremental
 
-    def scrape(self, urls: list = None): raise NotImplementedError
+    def scrape(self, urls: list = None) -> bool: raise NotImplementedError
@@ -14,10 +14,11 @@ from .scraper_base import HouseScraper
 class ScraperFactory():
 
     @staticmethod
-    def create_scraper(id: str) -> HouseScraper:
+    def create_scraper(id: str, refresh: bool = False, incremental: bool = False,
+                       broker: str = None, coordinator: bool = False) -> HouseScraper:
         if id == config.FOTOCASA_ID:
-            return FotocasaScraper(id)
+            return FotocasaScraper(id, refresh, incremental)
         elif id == config.IDEALISTA_ID:
-            return IdealistaScraper(id)
+            return IdealistaScraper(id, refresh, incremental, broker, coordinator)
         else:
             raise TypeError(f'No scraper found for the id [{id}]')
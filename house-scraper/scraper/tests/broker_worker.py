@@ -0,0 +1,29 @@
+"""
+Worker process of the broker tests: leases the house tasks of a local broker,
+completes them and sends a row for each one, until there are no more. With
+--die, it leases a task and exits without completing it
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from misc import broker  # noqa: E402
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('address')
+    argparser.add_argument('token')
+    argparser.add_argument('--die', action='store_true')
+    args = argparser.parse_args()
+
+    client = broker.BrokerClient(args.address, args.token)
+    while True:
+        leased = client.lease('house')
+        if leased is None or args.die:
+            break
+        url = leased[0]
+        client.append([{'id': url, 'worker': os.getpid()}])
+        client.complete('house', [url])
+        print(url, flush=True)
@@ -0,0 +1,12 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# the configuration derives the root folder from the script launched: the files
+# written by the tests go to a temporary one
+ROOT_DIR = tempfile.mkdtemp(prefix='house-scraper-tests-')
+atexit.register(shutil.rmtree, ROOT_DIR, ignore_errors=True)
+sys.argv[0] = os.path.join(ROOT_DIR, 'scraper', '__main__.py')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+import os
+import socket
+import subprocess
+import sys
+from time import sleep, time
+
+import pytest
+from misc import broker, config, dataset_writer, frontier
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'broker_worker.py')
+TOKEN = 'secret'
+
+
+def get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    # the tasks of a silent worker are requeued after half a second
+    monkeypatch.setattr(config, 'BROKER_LEASE_TIMEOUT', 0.5)
+    tasks = frontier.Frontier(str(tmp_path / 'frontier.sqlite'))
+    writer = dataset_writer.DatasetWriter(str(tmp_path / 'segments'))
+    server = broker.Broker(f'127.0.0.1:{get_free_port()}', tasks, writer, token=TOKEN)
+    server.start()
+    yield server, tasks, writer
+    server.close()
+    tasks.close()
+
+
+def start_worker(address: str, *args) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, WORKER, address, TOKEN, *args],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+
+def test_two_workers_share_the_crawl(coordinator):
+    server, tasks, writer = coordinator
+    urls = [f'https://www.idealista.com/inmueble/{id}/' for id in range(20)]
+    for url in urls:
+        tasks.put('house', url)
+
+    # a worker dies with a task leased: the broker gives it to another one
+    dying = start_worker(server.address, '--die')
+    assert dying.wait(timeout=30) == 0
+    assert tasks.count('house', frontier.INFLIGHT) == 1
+    deadline = time() + 10
+    while tasks.count('house', frontier.PENDING) < len(urls) and time() < deadline:
+        sleep(0.1)
+    assert tasks.count('house', frontier.PENDING) == len(urls)
+
+    workers = [start_worker(server.address) for _ in range(2)]
+    done = list()
+    for worker in workers:
+        stdout, stderr = worker.communicate(timeout=60)
+        assert worker.returncode == 0, stderr
+        done += stdout.split()
+
+    assert sorted(done) == sorted(urls)
+    assert tasks.count('house', frontier.DONE) == len(urls)
+    assert server.is_idle(['house'])
+    rows = 0
+    for segment in writer.get_segments():
+        with open(segment, 'r', encoding='utf-8') as file:
+            rows += sum(1 for _ in file)
+    assert rows == len(urls)
+
+
+def test_requests_without_the_token_are_refused(coordinator):
+    server, tasks, _ = coordinator
+    tasks.put('house', 'a')
+
+    with pytest.raises(RuntimeError, match='Invalid token'):
+        broker.BrokerClient(server.address, 'wrong').lease('house')
+    with pytest.raises(RuntimeError, match='Invalid token'):
+        broker.BrokerClient(server.address, None).lease('house')
+    assert tasks.count('house', frontier.PENDING) == 1
+
+
+def test_a_broker_without_token_only_serves_localhost(tmp_path):
+    tasks = frontier.Frontier(str(tmp_path / 'frontier.sqlite'))
+    with pytest.raises(ValueError):
+        broker.Broker(f'0.0.0.0:{get_free_port()}', tasks, None, token=None).start()
+
+    server = broker.Broker(f'localhost:{get_free_port()}', tasks, None, token=None)
+    server.start()
+    try:
+        assert broker.BrokerClient(server.address, None).has('house') is False
+    finally:
+        server.close()
+        tasks.close()
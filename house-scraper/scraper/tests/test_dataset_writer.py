@@ -0,0 +1,55 @@
+import json
+import os
+
+import pandas as pd
+from misc import dataset_writer
+
+
+def test_append_writes_a_segment_per_batch(tmp_path):
+    writer = dataset_writer.DatasetWriter(str(tmp_path))
+
+    assert writer.append([]) is None
+    first = writer.append([{'id': 1, 'price': 100}])
+    second = writer.append([{'id': 2, 'price': 200}, {'id': 3, 'price': 300}])
+
+    assert [os.path.basename(segment) for segment in writer.get_segments()] == \
+        ['segment-000001.jsonl', 'segment-000002.jsonl']
+    assert writer.get_segments() == [first, second]
+    with open(second, 'r', encoding='utf-8') as file:
+        assert [json.loads(line)['id'] for line in file] == [2, 3]
+
+
+def test_recovers_the_segments_missing_from_the_manifest(tmp_path):
+    writer = dataset_writer.DatasetWriter(str(tmp_path))
+    writer.append([{'id': 1, 'price': 100}])
+
+    # a crash after writing a segment, before listing it in the manifest; and
+    # another one while writing a segment
+    with open(tmp_path / 'segment-000002.jsonl', 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'id': 2, 'price': 200}) + '\n')
+    with open(tmp_path / 'segment-000003.jsonl.tmp', 'w', encoding='utf-8') as file:
+        file.write('{"id": 3, "pri')
+
+    writer = dataset_writer.DatasetWriter(str(tmp_path))
+    assert [os.path.basename(segment) for segment in writer.get_segments()] == \
+        ['segment-000001.jsonl', 'segment-000002.jsonl']
+    with open(tmp_path / 'manifest.json', 'r', encoding='utf-8') as file:
+        assert json.load(file)['segments'][-1] == {'file': 'segment-000002.jsonl', 'rows': 1}
+    # the numbering goes on after the recovered segment
+    assert os.path.basename(writer.append([{'id': 4, 'price': 400}])) == 'segment-000003.jsonl'
+
+
+def test_compact_keeps_the_newest_row_of_each_key(tmp_path):
+    csv_file = str(tmp_path / 'idealista.csv')
+    pd.DataFrame({'id': [1, 5], 'price': [90, 500]}).to_csv(csv_file, index=False)
+    writer = dataset_writer.DatasetWriter(str(tmp_path / 'segments'))
+    writer.append([{'id': 1, 'price': 100}, {'id': 2, 'price': 200}])
+    writer.append([{'id': 2, 'price': 250}])
+
+    assert writer.compact(csv_file, columns=['id', 'price', 'rooms']) == 3
+    df = pd.read_csv(csv_file)
+    assert list(df.columns) == ['id', 'price', 'rooms']
+    assert dict(zip(df['id'], df['price'])) == {1: 100, 2: 250, 5: 500}
+    assert writer.get_segments() == []
+    assert not [file for file in os.listdir(tmp_path / 'segments') if file.endswith('.jsonl')]
+    assert writer.compact(csv_file) is None
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+from misc import frontier
+
+
+@pytest.fixture
+def crawl(tmp_path):
+    crawl = frontier.Frontier(str(tmp_path / 'frontier.sqlite'))
+    yield crawl
+    crawl.close()
+
+
+def test_put_ignores_the_urls_already_in_the_frontier(crawl):
+    assert crawl.put('house', 'https://www.idealista.com/inmueble/1/')
+    assert not crawl.put('house', 'https://www.idealista.com/inmueble/1/', priority=-1)
+    # the same URL is another entry if it is of another kind
+    assert crawl.put('navigation', 'https://www.idealista.com/inmueble/1/')
+    assert crawl.count('house') == 1
+
+
+def test_lease_takes_the_best_priority_first(crawl):
+    crawl.put('house', 'b', priority=1)
+    crawl.put('house', 'a', priority=1, payload={'location': 'salamanca'})
+    crawl.put('house', 'c', priority=0)
+
+    assert crawl.lease('house') == ('c', 0, None)
+    # same priority: in the order they were added
+    assert crawl.lease('house') == ('b', 1, None)
+    assert crawl.lease('house') == ('a', 1, {'location': 'salamanca'})
+    assert crawl.lease('house') is None
+    assert crawl.count('house', frontier.INFLIGHT) == 3
+
+
+def test_lease_waits_for_a_url(crawl):
+    threading.Timer(0.1, crawl.put, args=('house', 'a')).start()
+
+    assert crawl.lease('house', timeout=5) == ('a', 0, None)
+    assert crawl.lease('house', timeout=0.1) is None
+
+
+def test_complete_and_release(crawl):
+    for url in ('a', 'b', 'c'):
+        crawl.put('house', url)
+    leased = [crawl.lease('house')[0] for _ in range(3)]
+
+    crawl.complete('house', leased[:2])
+    crawl.release('house', leased[2])
+
+    assert crawl.count('house', frontier.DONE) == 2
+    assert crawl.count('house', frontier.PENDING) == 1
+    assert not crawl.has('house', frontier.INFLIGHT)
+    assert crawl.lease('house')[0] == 'c'
+
+
+def test_requeue_only_the_old_leases(crawl):
+    crawl.put('house', 'a')
+    crawl.lease('house')
+
+    assert crawl.requeue(older_than=60) == 0
+    assert crawl.requeue() == 1
+    assert crawl.has('house', frontier.PENDING)
+
+
+def test_a_new_run_resumes_the_crawl(tmp_path):
+    db_file = str(tmp_path / 'frontier.sqlite')
+    crawl = frontier.Frontier(db_file)
+    for url in ('a', 'b', 'c'):
+        crawl.put('house', url)
+    crawl.complete('house', [crawl.lease('house')[0]])
+    crawl.lease('house')
+    crawl.close()
+
+    # the URL in-flight when the run stopped is visited again, the visited one is not
+    crawl = frontier.Frontier(db_file)
+    assert crawl.count('house', frontier.DONE) == 1
+    assert [crawl.lease('house')[0], crawl.lease('house')[0]] == ['b', 'c']
+    crawl.clear()
+    assert not crawl.has('house')
+    crawl.close()
+
+
+def test_put_with_reset_visits_a_url_again(crawl):
+    crawl.put('house', 'a')
+    assert not crawl.put('house', 'a', reset=True)
+    crawl.lease('house')
+    # in-flight: it is being visited already
+    assert not crawl.put('house', 'a', reset=True)
+
+    crawl.complete('house', ['a'])
+    assert not crawl.put('house', 'a')
+    assert crawl.put('house', 'a', priority=3, reset=True)
+    assert crawl.lease('house') == ('a', 3, None)
+    assert crawl.put('house', 'b', reset=True)
@@ -0,0 +1,118 @@
+from scrapers import idealista_parser
+
+HOUSE_URL = 'https://www.idealista.com/inmueble/97812345/'
+NAVIGATION_URL = 'https://www.idealista.com/venta-viviendas/madrid/salamanca/'
+
+
+def get_house_html(price: str = '250.000 €', anchors: str = '<button class="icon-no-pics"><span>12 fotos</span></button>') -> str:
+    return f'''
+    <main class="detail-container"><section class="detail-info">
+      <div class="main-info__title">
+        <h1><span>Piso en calle de Serrano</span></h1>
+        <span><span>Salamanca, Madrid</span></span>
+      </div>
+      <div class="info-data"><span class="info-data-price"><span>{price}</span></span></div>
+      <div class="fake-anchors">{anchors}</div>
+      <div class="info-features">
+        <span><span>90 m²</span></span>
+        <span><span>3 hab.</span></span>
+        <span>Planta 2ª exterior</span>
+      </div>
+      <div class="commentsContainer"><div class="comment">
+        <div class="adCommentsLanguage"><p>Piso   luminoso</p></div>
+      </div></div>
+    </section></main>
+    <div id="multimedia-container"><div id="main-multimedia">
+      <div class="image"><img data-ondemand-img="https://img.idealista.com/1.jpg"></div>
+      <div class="image"><img data-ondemand-img="https://img.idealista.com/2.jpg"></div>
+    </div></div>'''
+
+
+def get_navigation_html(next_page: str = 'pagina-2.htm') -> str:
+    next_link = f'<li class="next"><a href="{next_page}">Siguiente</a></li>' if next_page else ''
+    return f'''
+    <h1 id="h1-container">1.234 casas y pisos en venta en Salamanca</h1>
+    <main id="main-content"><section class="items-container">
+      <article class="item"><div class="item-info-container">
+        <a class="item-link" href="/inmueble/111/">Piso</a>
+        <span class="item-price">250.000€</span>
+        <span class="item-detail">3 hab.</span><span class="item-detail">90 m²</span>
+      </div></article>
+      <article class="item"><div class="item-info-container">
+        <a class="item-link" href="/inmueble/222/">Ático</a>
+        <span class="item-price">A consultar</span>
+      </div></article>
+      <article class="item"><div class="item-info-container"><span>Publicidad</span></div></article>
+      <div class="pagination"><ul>{next_link}</ul></div>
+    </section></main>'''
+
+
+def test_parse_house():
+    house = idealista_parser.parse_house(get_house_html(), HOUSE_URL)
+
+    assert house['id'] == 97812345
+    assert house['url'] == HOUSE_URL
+    assert house['title'] == 'Piso en calle de Serrano'
+    assert house['location'] == 'Salamanca, Madrid'
+    assert house['price'] == 250000
+    assert (house['m2'], house['rooms'], house['floor']) == ('90 m²', '3 hab.', 'Planta 2ª exterior')
+    assert house['num-photos'] == 12
+    assert (house['floor-plan'], house['view3d'], house['video'], house['home-staging']) == (0, 0, 0, 0)
+    assert house['description'] == 'Piso luminoso'
+
+
+def test_parse_house_features():
+    anchors = '<button class="icon-plan"></button><button class="icon-videos"></button>'
+    house = idealista_parser.parse_house(get_house_html(anchors=anchors), HOUSE_URL)
+
+    assert house['num-photos'] == 0
+    assert (house['floor-plan'], house['view3d'], house['video'], house['home-staging']) == (1, 0, 1, 0)
+
+
+def test_parse_house_without_price():
+    assert idealista_parser.parse_house(get_house_html(price='A consultar'), HOUSE_URL)['price'] is None
+
+
+def test_parse_house_with_unexpected_markup():
+    assert idealista_parser.parse_house('<html><body>Blocked</body></html>', HOUSE_URL) is None
+
+
+def test_parse_archived_house():
+    house = idealista_parser.parse_archived_house(get_house_html(), HOUSE_URL)
+
+    assert house['photo_urls'] == ['https://img.idealista.com/1.jpg', 'https://img.idealista.com/2.jpg']
+
+
+def test_parse_navigation():
+    house_urls, next_page_url, summaries = idealista_parser.parse_navigation(get_navigation_html(), NAVIGATION_URL)
+
+    assert house_urls == ['https://www.idealista.com/inmueble/111/', 'https://www.idealista.com/inmueble/222/']
+    assert next_page_url == NAVIGATION_URL + 'pagina-2.htm'
+    assert summaries[house_urls[0]] == {'price': 250000, 'rooms': '3 hab.', 'm2': '90 m²'}
+    assert summaries[house_urls[1]] == {'price': None, 'rooms': None, 'm2': None}
+
+
+def test_parse_last_navigation_page():
+    assert idealista_parser.parse_navigation(get_navigation_html(next_page=None), NAVIGATION_URL)[1] is None
+
+
+def test_parse_result_count():
+    assert idealista_parser.parse_result_count(get_navigation_html()) == 1234
+    assert idealista_parser.parse_result_count('<h1>Casas y pisos en venta</h1>') is None
+
+
+def test_get_page_number():
+    assert idealista_parser.get_page_number(NAVIGATION_URL) == 1
+    assert idealista_parser.get_page_number(NAVIGATION_URL + 'pagina-7.htm') == 7
+
+
+def test_get_page_urls():
+    assert idealista_parser.get_page_urls(NAVIGATION_URL, 61, 30) == [
+        NAVIGATION_URL + 'pagina-2.htm', NAVIGATION_URL + 'pagina-3.htm']
+    assert idealista_parser.get_page_urls(NAVIGATION_URL, 30, 30) == []
+
+
+def test_get_page_urls_keeps_the_filters():
+    url = 'https://www.idealista.com/venta-viviendas/madrid/salamanca/pagina-4.htm?ordenado-por=precios-asc'
+    assert idealista_parser.get_page_urls(url, 50, 25) == [
+        'https://www.idealista.com/venta-viviendas/madrid/salamanca/pagina-2.htm?ordenado-por=precios-asc']
@@ -0,0 +1,116 @@
+import os
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pandas as pd
+import pytest
+from misc import config, merge_datasets
+
+
+def write_csv(path, rows: dict) -> str:
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(params=[1, 50_000], ids=['chunked', 'whole'])
+def chunk_rows(request, monkeypatch):
+    monkeypatch.setattr(config, 'MERGE_CHUNK_ROWS', request.param)
+
+
+def test_stream_merge_deduplicates_on_the_key(tmp_path, chunk_rows):
+    first = write_csv(tmp_path / 'a.csv', {'id': [1, 2, 2], 'price': [100, 200, 201]})
+    # ids written as floats by pandas are the same ids
+    second = write_csv(tmp_path / 'b.csv', {'id': ['2.0', '3'], 'rooms': ['3 hab.', '2 hab.']})
+    out_file = str(tmp_path / 'merged.csv')
+
+    assert merge_datasets._stream_merge([(first, dict()), (second, dict())], out_file, key='id') == 3
+    df = pd.read_csv(out_file, dtype=str, keep_default_na=False)
+    assert list(df.columns) == ['id', 'price', 'rooms']
+    assert df.values.tolist() == [['1', '100', ''], ['2', '200', ''], ['3', '', '2 hab.']]
+    assert not os.path.exists(out_file + '.tmp')
+
+
+def test_stream_merge_numbers_the_rows_of_each_file(tmp_path, chunk_rows):
+    fotocasa = write_csv(tmp_path / 'fotocasa.csv', {'id': [1, 2], 'price': [100, 200]})
+    idealista = write_csv(tmp_path / 'idealista.csv', {'id': [1], 'price': [300]})
+    out_file = str(tmp_path / 'merged.csv')
+
+    assert merge_datasets._stream_merge([(fotocasa, {'source': 'fotocasa'}), (idealista, {'source': 'idealista'})],
+                                        out_file, index=True) == 3
+    df = pd.read_csv(out_file, index_col=0)
+    assert df.index.tolist() == [0, 1, 0]
+    assert df['source'].tolist() == ['fotocasa', 'fotocasa', 'idealista']
+    assert df['id'].tolist() == [1, 2, 1]
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'IDEALISTA_MAPS', str(tmp_path / 'idealista-maps'))
+    monkeypatch.setattr(config, 'FOTOCASA_IMG_DIR', str(tmp_path / 'fotocasa-imgs'))
+    monkeypatch.setattr(config, 'MERGED_FILE', str(tmp_path / 'merged.csv'))
+    monkeypatch.setattr(config, 'MERGED_ZIP_FILE', str(tmp_path / 'merged.zip'))
+    os.makedirs(tmp_path / 'idealista-maps' / '1')
+    os.makedirs(tmp_path / 'fotocasa-imgs' / '2')
+    write_image(tmp_path / 'idealista-maps' / '1' / '0.jpg', b'map')
+    write_image(tmp_path / 'fotocasa-imgs' / '2' / '0.jpg', b'photo')
+    write_csv(config.MERGED_FILE, {'id': [1, 2]})
+    return tmp_path
+
+
+def write_image(path, content: bytes):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def read_zip() -> dict:
+    with ZipFile(config.MERGED_ZIP_FILE) as zip_file:
+        assert zip_file.testzip() is None
+        names = zip_file.namelist()
+        assert len(names) == len(set(names))
+        return {info.filename: (info.header_offset, info.compress_type, zip_file.read(info))
+                for info in zip_file.infolist() if not info.is_dir()}
+
+
+def test_zip_everything(dataset):
+    merge_datasets.zip_everything()
+
+    members = read_zip()
+    assert members['idealista-maps/1/0.jpg'][1:] == (ZIP_STORED, b'map')
+    assert members['fotocasa-imgs/2/0.jpg'][1:] == (ZIP_STORED, b'photo')
+    assert members['merged.csv'][1] == ZIP_DEFLATED
+    # the CSV is the last member, to be replaced by the next update
+    assert max(members.values())[0] == members['merged.csv'][0]
+
+
+def test_zip_everything_appends_the_new_files(dataset):
+    merge_datasets.zip_everything()
+    before = read_zip()
+
+    write_image(dataset / 'fotocasa-imgs' / '2' / '1.jpg', b'new photo')
+    write_csv(config.MERGED_FILE, {'id': [1, 2, 3]})
+    merge_datasets.zip_everything()
+    after = read_zip()
+
+    # the images already archived are not written again
+    for name in ('idealista-maps/1/0.jpg', 'fotocasa-imgs/2/0.jpg'):
+        assert after[name] == before[name]
+    assert after['fotocasa-imgs/2/1.jpg'][2] == b'new photo'
+    assert after['merged.csv'][2].decode('utf-8').split() == ['id', '1', '2', '3']
+    assert max(after.values())[0] == after['merged.csv'][0]
+
+
+def test_zip_everything_rebuilds_the_archive_if_a_file_changed(dataset):
+    merge_datasets.zip_everything()
+
+    write_image(dataset / 'idealista-maps' / '1' / '0.jpg', b'another map')
+    merge_datasets.zip_everything()
+
+    assert read_zip()['idealista-maps/1/0.jpg'][2] == b'another map'
+
+
+def test_zip_everything_deflates_the_csv_in_chunks(dataset, monkeypatch):
+    monkeypatch.setattr(config, 'MERGED_ZIP_CHUNK_MB', 1 / 1024)
+    write_csv(config.MERGED_FILE, {'id': range(5000), 'location': ['salamanca', 'villaverde'] * 2500})
+    merge_datasets.zip_everything()
+
+    with open(config.MERGED_FILE, 'rb') as file:
+        assert read_zip()['merged.csv'][1:] == (ZIP_DEFLATED, file.read())
@@ -0,0 +1,72 @@
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from misc import config, network, proxy_pool
+
+
+class ProbeHandler(BaseHTTPRequestHandler):
+    """
+    Answers any request with a 204, as the probe URL. Requested through the server
+    itself, it also works as a healthy HTTP proxy
+    """
+
+    def do_GET(self):
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.delenv('NO_PROXY', raising=False)
+    monkeypatch.delenv('no_proxy', raising=False)
+    monkeypatch.setattr(network, 'get_fingerprint', lambda: {'headers': dict()})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ProbeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_dead_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_pool(server, candidates: list) -> proxy_pool.ProxyPool:
+    return proxy_pool.ProxyPool(candidates, probe_url=f'http://127.0.0.1:{server.server_port}/probe',
+                                timeout=2)
+
+
+def test_refresh_keeps_the_healthy_proxies(server):
+    healthy = {'ip': '127.0.0.1', 'port': server.server_port}
+    dead = {'ip': '127.0.0.1', 'port': get_dead_port()}
+    pool = get_pool(server, [healthy, dead])
+
+    assert pool.refresh() == 1
+    assert [(proxy['ip'], proxy['port']) for proxy in pool.get_healthy()] == [('127.0.0.1', server.server_port)]
+    assert pool.best()['port'] == server.server_port
+
+
+def test_evicted_proxies_are_not_probed_again(server, monkeypatch):
+    dead = {'ip': '127.0.0.1', 'port': get_dead_port()}
+    pool = get_pool(server, [dead])
+    for _ in range(config.PROXY_MIN_ATTEMPTS):
+        pool.refresh()
+
+    probed = list()
+    probe = pool.probe
+    monkeypatch.setattr(pool, 'probe', lambda proxy: probed.append(proxy) or probe(proxy))
+    pool.refresh()
+    assert probed == []
+
+    # once the eviction expires, the proxy is validated again
+    now = proxy_pool.time()
+    monkeypatch.setattr(proxy_pool, 'time', lambda: now + config.PROXY_EVICTION_SECONDS + 1)
+    pool.refresh()
+    assert probed == [dead]
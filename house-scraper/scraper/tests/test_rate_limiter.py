@@ -0,0 +1,74 @@
+import pytest
+from misc import config, rate_limiter
+
+IDEALISTA_URL = 'https://www.idealista.com/inmueble/1/'
+FOTOCASA_URL = 'https://www.fotocasa.es/es/'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = {'now': 1000.0}
+    monkeypatch.setattr(rate_limiter, 'time', lambda: clock['now'])
+    monkeypatch.setattr(config, 'RATE_INITIAL', 1.0)
+    monkeypatch.setattr(config, 'RATE_MIN', 0.1)
+    monkeypatch.setattr(config, 'RATE_MAX', 2.0)
+    monkeypatch.setattr(config, 'RATE_INCREASE', 0.25)
+    monkeypatch.setattr(config, 'RATE_DECREASE', 0.5)
+    monkeypatch.setattr(config, 'RATE_BURST', 2)
+    monkeypatch.setattr(config, 'RATE_JITTER', 0)
+    monkeypatch.setattr(config, 'WAIT_SCALE', 1)
+    return clock
+
+
+def test_additive_increase(clock):
+    limiter = rate_limiter.RateLimiter()
+    limiter.success(IDEALISTA_URL)
+    limiter.success(IDEALISTA_URL)
+
+    assert limiter.get_rate(IDEALISTA_URL) == pytest.approx(1.5)
+    for _ in range(10):
+        limiter.success(IDEALISTA_URL)
+    assert limiter.get_rate(IDEALISTA_URL) == config.RATE_MAX
+
+
+def test_multiplicative_decrease(clock):
+    limiter = rate_limiter.RateLimiter()
+    limiter.blocked(IDEALISTA_URL)
+
+    assert limiter.get_rate(IDEALISTA_URL) == pytest.approx(0.5)
+    for _ in range(10):
+        limiter.blocked(IDEALISTA_URL)
+    assert limiter.get_rate(IDEALISTA_URL) == config.RATE_MIN
+    limiter.success(IDEALISTA_URL)
+    assert limiter.get_rate(IDEALISTA_URL) == pytest.approx(config.RATE_MIN + config.RATE_INCREASE)
+
+
+def test_every_domain_has_its_own_rate(clock):
+    limiter = rate_limiter.RateLimiter()
+    limiter.blocked(IDEALISTA_URL)
+    limiter.success(FOTOCASA_URL)
+
+    assert limiter.get_rate(IDEALISTA_URL) == pytest.approx(0.5)
+    assert limiter.get_rate(FOTOCASA_URL) == pytest.approx(1.25)
+    assert limiter.get_rate('https://www.idealista.com/venta-viviendas/madrid/') == pytest.approx(0.5)
+
+
+def test_reserve_paces_the_requests_at_the_rate(clock):
+    limiter = rate_limiter.RateLimiter()
+
+    # the bucket starts with a token
+    assert limiter.reserve(IDEALISTA_URL) == 0
+    assert [limiter.reserve(IDEALISTA_URL) for _ in range(3)] == pytest.approx([1, 2, 3])
+
+    # after 4 seconds at half the rate, 2 requests are still owed
+    limiter.blocked(IDEALISTA_URL)
+    clock['now'] += 4
+    assert limiter.reserve(IDEALISTA_URL) == pytest.approx(4)
+
+
+def test_reserve_allows_a_burst_after_an_idle_period(clock):
+    limiter = rate_limiter.RateLimiter()
+    limiter.reserve(IDEALISTA_URL)
+    clock['now'] += 60
+
+    assert [limiter.reserve(IDEALISTA_URL) for _ in range(config.RATE_BURST + 1)] == pytest.approx([0, 0, 1])
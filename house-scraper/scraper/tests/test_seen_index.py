@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+from misc import config, seen_index
+
+
+@pytest.mark.parametrize('url, key', [
+    ('https://www.idealista.com/inmueble/97812345/', 'idealista:97812345'),
+    ('https://idealista.com/inmueble/97812345/?xtmc=1_2_3#foto', 'idealista:97812345'),
+    ('https://www.idealista.com/venta-viviendas/madrid-28001/', None),
+    ('https://www.fotocasa.es/es/comprar/vivienda/madrid-capital/calefaccion/167543210/d', 'fotocasa:167543210'),
+    ('https://www.fotocasa.es/es/comprar/vivienda/madrid-capital/167543210/d?from=list', 'fotocasa:167543210'),
+    ('https://www.fotocasa.es/es/', None),
+])
+def test_canonicalize(url, key):
+    assert seen_index.canonicalize(url) == key
+
+
+def test_the_key_is_the_id_of_the_dataset():
+    url = 'https://www.fotocasa.es/es/comprar/vivienda/madrid-capital/167543210/d'
+    assert seen_index.canonicalize(url) == f'{config.FOTOCASA_ID}:{seen_index.get_listing_id(url)}'
+
+
+@pytest.mark.parametrize('price, rooms, m2, summary', [
+    ('250.000 €', '3 hab.', '90 m²', '250000|3|90'),
+    (250000, 3.0, 90, '250000|3|90'),
+    (None, float('nan'), '', '||'),
+])
+def test_summarize(price, rooms, m2, summary):
+    assert seen_index.summarize(price, rooms, m2) == summary
+
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'DATASET_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'IDEALISTA_FILE', str(tmp_path / 'idealista.csv'))
+    monkeypatch.setattr(config, 'FOTOCASA_FILE', str(tmp_path / 'fotocasa.csv'))
+    pd.DataFrame({'id': ['1'], 'price': ['100']}).to_csv(config.IDEALISTA_FILE, index=False)
+    pd.DataFrame({'id': ['2'], 'price': ['200']}).to_csv(config.FOTOCASA_FILE, index=False)
+    pd.DataFrame({'id': ['3'], 'price': ['300']}).to_csv(f'{config.FOTOCASA_FILE}-madrid.csv', index=False)
+    pd.DataFrame({'id': ['4'], 'price': ['400']}).to_csv(tmp_path / 'fotocasa_idealista_merged.csv', index=False)
+    return tmp_path
+
+
+def test_bootstrap_from_the_datasets(datasets):
+    index = seen_index.SeenIndex(str(datasets / 'seen.tsv'), bloom=False)
+
+    assert index.has('https://www.idealista.com/inmueble/1/')
+    assert index.get_summary('fotocasa:2') == '200||'
+    assert index.has('fotocasa:3')
+    # the merged dataset has the listings of both sites, not only fotocasa's
+    assert not index.has('fotocasa:4')
+    assert not index.has('idealista:4')
+
+
+def test_add_touch_and_close(datasets):
+    index_file = str(datasets / 'seen.tsv')
+    index = seen_index.SeenIndex(index_file, bloom=False)
+    index.add(['https://www.idealista.com/inmueble/9/'], ['900|2|50'])
+    index.add(['idealista:9'], ['900|2|50'])    # unchanged, not written again
+    for _ in range(3):
+        index.touch(['idealista:9', 'fotocasa:2'])
+    with open(index_file, 'r', encoding='utf-8') as file:
+        assert len(file.readlines()) == 3 + 1 + 6
+
+    index.close()
+    with open(index_file, 'r', encoding='utf-8') as file:
+        lines = [line.split('\t') for line in file.read().splitlines()]
+    assert sorted(line[0] for line in lines) == ['fotocasa:2', 'fotocasa:3', 'idealista:1', 'idealista:9']
+
+    index = seen_index.SeenIndex(index_file, bloom=False)
+    assert index.get_summary('idealista:9') == '900|2|50'
+    assert index.get_summary('fotocasa:2') == '200||'
+
+
+def test_bloom_index(datasets):
+    index = seen_index.SeenIndex(str(datasets / 'seen.tsv'), bloom=True)
+    index.add(['fotocasa:5'])
+
+    assert index.has('fotocasa:2') and index.has('fotocasa:5')
+    assert not index.has('fotocasa:6')
+    assert index.get_summary('fotocasa:2') is None